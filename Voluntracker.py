@@ -1,18 +1,24 @@
 import tkinter
-import pickle
+from tkinter import ttk
 import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import httplib2
-import csv
-from PIL import Image
-from PIL import ImageTk
 from tkinter.filedialog import askopenfilename
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from openpyxl import load_workbook
 import platform
+import sqlite3
+import re
+import datetime
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import events
+import roster
+import backups
+import worker
+import diagnostics
+
+# The heavy modules -- metrics, aggregates and tableview (numpy), charts (matplotlib), submission (openpyxl), sheets
+# (the Google API client) and store -- are imported inside the functions that first use them, so opening Voluntracker
+# only pays for the windows that are actually used. Python keeps them loaded after the first import.
 
 
 # A GUI-based application for managing volunteer hours for the Delta Sigma Pi fraternity. Pull backups from an
@@ -23,29 +29,141 @@ import platform
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 
-# Holds the link to the spreadsheet (a unique identifier from the URL) and the range we want to pull
+# Holds the linked spreadsheets (unique identifiers from their URLs, one per line -- see linked_sheets) and the range
+# we want to pull from a sheet when the line doesn't give one. Column A holds the time each response was submitted,
+# which backups keep after the answers (see events.timestamp_last) so the metrics and submission can cover one period
 SpreadURL = ''
-SAMPLE_RANGE_NAME = 'B:F'
+SAMPLE_RANGE_NAME = 'A:F'
+
+# The periods offered next to the backup list, besides typing in dates. Spring semester runs from January through
+# July, and fall semester from August through December
+PERIOD_PRESETS = ['Whole backup', 'This month', 'Last month', 'This semester', 'Last semester']
+FALL_START_MONTH = 8
+
+# How many linked sheets are pulled at once, and the header of the column a merged backup tags each response's sheet in
+SHEET_WORKERS = 4
+SOURCE_HEADER = 'Source'
+
+# When True, each pull only downloads the rows added since the last pull and appends them to a per-spreadsheet log
+# in DELTA_PATH. The full sheet is rebuilt from that log, so pull_backup can still write a complete backup file
+DELTA_PULLS = True
+
+# When True, every backup is also loaded into a local SQLite event store (STORE_PATH), and the metrics and submission
+# windows query it instead of re-reading the backup csv. Backups made before the store existed are imported into it
+# the first time it's opened
+USE_EVENT_STORE = False
+
+# When True, backups are saved packed (see backups.py) instead of as full csv copies: rows shared with earlier backups
+# are stored once, compressed, in BACKUP_PATH/Chunks. Existing csv backups are converted the first time the catalog is
+# opened. Packed backups open like any other in Voluntracker, but not in Excel
+PACK_BACKUPS = False
+
+# When True, Voluntracker watches the linked sheet from startup and backs it up by itself whenever new responses come
+# in (it can also be switched on and off from the main window). Each check only asks the sheet for two rows; the whole
+# sheet is only pulled when they show something changed. The wait between checks starts at WATCH_INTERVAL_MS and
+# doubles after every check that finds nothing, up to WATCH_MAX_INTERVAL_MS
+WATCH = False
+WATCH_INTERVAL_MS = 5 * 60 * 1000
+WATCH_MAX_INTERVAL_MS = 60 * 60 * 1000
+
+# When True, the time spent in each stage of a pull, backup, chart or submission is recorded from startup and logged
+# to DIAGNOSTICS_PATH. It can also be turned on and off from the Diagnostics window
+DIAGNOSTICS = False
+
+# How often (in milliseconds) the Diagnostics window redraws, and how many recent stages it lists
+DIAGNOSTICS_REFRESH_MS = 1000
+DIAGNOSTICS_SHOWN = 100
 
 # Paths to all of the necessary files required for Voluntracker to run properly
 # Default path syntax is Windows/DOS specific - there is a check in __main__ that will change paths to appropriate
 # Linux/Mac OS/Unix syntax if executed on a non-Windows OS
 BACKUP_PATH = 'Backups'
 
+DELTA_PATH = 'Backups\\Delta'
+
 ROSTER_PATH = 'Configuration\\Roster.csv'
 
+ROSTER_JOURNAL_PATH = 'Configuration\\Roster.journal'
+
+ALIAS_PATH = 'Configuration\\aliases.json'
+
 LOGO_PATH = 'Configuration\\DSP_logo.png'
 
 PICKLE_PATH = 'Configuration\\token.pickle'
 
 CREDS_PATH = 'Configuration\\credentials.json'
 
+DISCOVERY_PATH = 'Configuration\\sheets_discovery.json'
+
+CHART_CACHE_PATH = 'Backups\\Charts'
+
+STORE_PATH = 'Backups\\events.sqlite3'
+
+DIAGNOSTICS_PATH = 'Backups\\Diagnostics'
+
+AGGREGATE_PATH = 'Backups\\Aggregates'
+
+REPORT_PATH = 'Reports'
+
 SPRERL_PATH = 'Configuration\\spreadurl.txt'
 
 TEMPLATE_URL = 'Configuration\\BaseTemplate.xlsx'
 
-# Global variable to hold values from the spreadsheet
-values = []
+SUBMISSION_PATH = 'FINALIZED_SUBMISSION.xlsx'
+
+# Global variable to hold values from the spreadsheet, as a compact events.EventTable
+values = events.EventTable()
+
+# Backup files that have already been loaded into EventTables, keyed by path. Only the most recent few are kept
+loaded_events = {}
+LOADED_EVENTS_LIMIT = 4
+
+# Global variable to hold the backup catalog once it has been loaded
+catalog = None
+
+# Global variable to hold the logged-in Google Sheets session, shared by every pull
+session = None
+
+# How many rows the last pull saw in each linked sheet and the hash of the last one, by sheet key, so watch mode can
+# tell whether anything changed
+sheet_state = {}
+
+# Only one pull runs at a time, so a watch check and a click on Pull Backups never write the delta log together
+pull_lock = threading.Lock()
+
+# Watch mode's state: the pending tkinter after() call, the current wait between checks, and whether it's on
+watcher = {'after': None, 'delay': WATCH_INTERVAL_MS, 'on': False}
+
+# Global variable to hold the roster once it has been loaded. Every window shares it
+rosterstore = None
+
+# Global variable to hold the index that matches names from the form to the roster, and the roster it was built from
+nameindex = None
+nameindex_roster = None
+
+# Global variable to hold the SQLite event store once it has been opened (only used with USE_EVENT_STORE)
+eventstore = None
+
+# The period the metrics and submission windows cover, as [start, end] datetimes (end not included, None for no limit).
+# It's picked along with the backup in select_backup
+period = [None, None]
+
+
+# Every view that has been opened, by name, as (window, refresh function) -- see open_view
+views = {}
+
+# Global variable to hold the decoded logo, shared by every window
+logo_image = None
+
+
+# Returns the logo, decoding LOGO_PATH only the first time. Tk reads PNGs itself, so this doesn't need PIL. A new
+# MainWindow is a new Tk interpreter, so the logo is decoded again for it
+def get_logo(window):
+    global logo_image
+
+    if logo_image is None or logo_image.tk is not window.tk:
+        logo_image = tkinter.PhotoImage(master=window, file=LOGO_PATH)
+    return logo_image
 
 
 # Handles creation of the initial window that the user sees upon program start
@@ -55,9 +173,8 @@ class MainWindow(tkinter.Tk):
         self.geometry("500x400")
         self.title("Voluntracker")
 
-        # Imports the image to use on the top of the screen
-        raw_logo = Image.open(LOGO_PATH)
-        logo = ImageTk.PhotoImage(raw_logo)
+        # The image to use on the top of the screen
+        logo = get_logo(self)
 
         photo_label = tkinter.Label(self, image=logo, bg='white', width=self.winfo_screenwidth())
         photo_label.image = logo
@@ -84,10 +201,17 @@ class MainWindow(tkinter.Tk):
                                       height=2, width=15)
 
         # For identifying the current spreadsheet's URL and allowing the user to change it
-        url_text = 'Currently using the spreadsheet at: ' + SpreadURL
-        url_label = tkinter.Label(self, text=url_text)
-        url_button = tkinter.Button(self, text='Change Spreadsheet', command=lambda: change_url(self),
+        self.url_label = tkinter.Label(self, text=describe_linked())
+        url_button = tkinter.Button(self, text='Change Spreadsheets', command=lambda: change_url(self),
                                     height=2, width=15)
+        diagnostics_button = tkinter.Button(self, text='Diagnostics', command=create_diagnostics_window,
+                                            height=2, width=15)
+
+        # Watch mode backs the sheet up by itself whenever new responses come in
+        self.watch_var = tkinter.BooleanVar(self, value=False)
+        watch_button = tkinter.Checkbutton(self, text='Back up new responses automatically', variable=self.watch_var,
+                                           command=lambda: set_watching(self, self.watch_var.get()))
+        self.watch_label = tkinter.Label(self)
 
         # Places all of the widgets on the tkinter window
         photo_label.pack()
@@ -100,13 +224,25 @@ class MainWindow(tkinter.Tk):
         submitbutton.pack(side='left', padx=2, pady=2)
         greet_label.pack(side='top', padx=2, pady=2)
         url_button.pack(side='bottom', padx=2, pady=2)
-        url_label.pack(side='left', padx=2, pady=2)
-        self.mainloop()
+        diagnostics_button.pack(side='bottom', padx=2, pady=2)
+        self.watch_label.pack(side='bottom', padx=2)
+        watch_button.pack(side='bottom', padx=2)
+        self.url_label.pack(side='left', padx=2, pady=2)
 
-    # For displaying new info on a tkinter window
+    # For displaying new info on the main window, e.g. after the spreadsheet was changed
     def refresh(self):
-        self.destroy()
-        self.__init__()
+        self.url_label['text'] = describe_linked()
+
+
+# What the main window says about the linked spreadsheets
+def describe_linked():
+    linked = linked_sheets()
+    if len(linked) == 1:
+        return 'Currently using the spreadsheet at: ' + linked[0]['id']
+    if not linked:
+        return 'Currently using the spreadsheet at: ' + SpreadURL
+    return ('Currently using ' + str(len(linked)) + ' spreadsheets: ' +
+            ', '.join(sheet['label'] for sheet in linked))
 
 
 # Handles creation of all subsequent windows triggered from the main window
@@ -116,9 +252,8 @@ class NewWindow(tkinter.Toplevel):
         self.geometry("800x600")
         self.title("Voluntracker")
 
-        # Imports the image to use on the top of the screen
-        raw_logo = Image.open(LOGO_PATH)
-        logo = ImageTk.PhotoImage(raw_logo)
+        # The image to use on the top of the screen
+        logo = get_logo(self)
 
         photo_label = tkinter.Label(self, image=logo, bg='white', width=self.winfo_screenwidth())
         photo_label.image = logo
@@ -155,206 +290,581 @@ class NewWindow(tkinter.Toplevel):
 # Creates a backup of the linked Google Sheet
 def pull_backup():
     global values
-    global BACKUP_PATH
 
-    if platform.system() == 'Windows':
-        slash = '\\'
-    else:
-        slash = '/'
+    with diagnostics.stage('backup', rows=len(values)):
+        # The catalog picks the new filename and records the backup, along with the period its responses cover, so the
+        # Backups folder never has to be scanned
+        entry = get_catalog().write_backup(values.iter_rows(), values.time_span())
+
+        # The new backup holds exactly what's already in memory, so the other windows don't need to parse it again
+        remember_events(get_catalog().path_of(entry), values)
+
+        if USE_EVENT_STORE:
+            get_store().add_backup(entry['name'], entry['hash'], values.iter_rows(), entry['created'])
+
+
+# Loads a backup file into an EventTable, reusing the copy already in memory if the file hasn't changed since
+def get_events(path):
+    stat = os.stat(path)
+    cached = loaded_events.get(path)
+    if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+        remember_events(path, events.load_backup(path))
+    return loaded_events[path][1]
+
+
+# Keeps a loaded EventTable around for get_events
+def remember_events(path, table):
+    stat = os.stat(path)
+    loaded_events.pop(path, None)
+    loaded_events[path] = ((stat.st_mtime_ns, stat.st_size), table)
+    while len(loaded_events) > LOADED_EVENTS_LIMIT:
+        del loaded_events[next(iter(loaded_events))]
+
+
+# Returns the backup catalog for BACKUP_PATH, loading it the first time it's needed
+def get_catalog():
+    global catalog
+
+    if catalog is None or catalog.directory != BACKUP_PATH:
+        catalog = backups.BackupCatalog(BACKUP_PATH, packed=PACK_BACKUPS)
+        if PACK_BACKUPS:
+            catalog.pack_backups()
+    return catalog
+
+
+# Returns the SQLite event store, opening it (and importing any backups it doesn't have yet) the first time
+def get_store():
+    global eventstore
+
+    import store
+
+    if eventstore is None or eventstore.path != STORE_PATH:
+        eventstore = store.EventStore(STORE_PATH)
+        eventstore.import_catalog(get_catalog(), lambda path: get_events(path).iter_rows())
+    return eventstore
+
+
+# The id of a backup file in the event store, loading it into the store if it isn't there yet. None when the store
+# is turned off
+def stored_backup(path):
+    if not USE_EVENT_STORE:
+        return None
+    digest = backup_digest(path)
+    backup_id = get_store().find(digest)
+    if backup_id is None:
+        backup_id = get_store().add_backup(os.path.basename(path), digest, get_events(path).iter_rows())
+    return backup_id
+
+
+# Lets the user pick a backup out of the catalog (newest first, with the latest already selected) instead of hunting
+# for it in a file dialog. Returns the path to the chosen backup, or '' if the window was closed without choosing.
+# With with_period=True the user also picks the period to cover, from PERIOD_PRESETS or as dates, which is saved in
+# the global period
+def select_backup(title, with_period=False):
+    entries = list(get_catalog().newest_first())
+    if not entries:
+        if with_period:
+            period[:] = [None, None]
+        return askopenfilename(title=title)
+
+    chosen = ['']
+    TKselect = tkinter.Toplevel()
+    TKselect.title(title)
+    TKselect.geometry('500x300')
+
+    scroll = tkinter.Scrollbar(TKselect)
+    listbox = tkinter.Listbox(TKselect, yscrollcommand=scroll.set)
+    for entry in entries:
+        covers = ''
+        if entry.get('first_timestamp'):
+            covers = ', ' + entry['first_timestamp'][:10] + ' to ' + entry['last_timestamp'][:10]
+        listbox.insert('end', entry['name'] + '  (' + entry['created'] + ', ' + str(entry['rows']) + ' rows' + covers +
+                       ')')
+    listbox.selection_set(0)
+
+    # The period to cover: a preset fills in the dates, which can then be changed by hand. Both dates are included,
+    # and a blank one means no limit
+    periodframe = tkinter.Frame(TKselect)
+    presetVar = tkinter.StringVar(TKselect)
+    presetVar.set(PERIOD_PRESETS[0])
+    fromField = tkinter.Entry(periodframe, width=12)
+    toField = tkinter.Entry(periodframe, width=12)
+    periodLabel = tkinter.Label(TKselect, fg='red')
+
+    def fill_period(start, end):
+        fromField.delete(0, 'end')
+        toField.delete(0, 'end')
+        if start is not None:
+            fromField.insert(0, start.date().isoformat())
+        if end is not None:
+            toField.insert(0, (end - datetime.timedelta(days=1)).date().isoformat())
+
+    def on_preset(name):
+        fill_period(*preset_period(name))
+
+    presetSelect = tkinter.OptionMenu(periodframe, presetVar, *PERIOD_PRESETS, command=on_preset)
+    fill_period(*period)
+
+    # Reads the dates typed in, returning False (after saying what's wrong) if they aren't a period
+    def read_period():
+        try:
+            period[:] = events.parse_period(fromField.get(), toField.get())
+        except ValueError as error:
+            periodLabel['text'] = str(error)
+            return False
+        return True
 
-    # The backups directory currently exists -- create a new backup file
-    if os.path.exists(BACKUP_PATH):
-        # Reads files currently in the Backups folder in order to determine new filename
-        cur_files = 0
-        recent_file = ''
+    # Use the highlighted backup
+    def callback():
+        if with_period and not read_period():
+            return
+        selection = listbox.curselection()
+        if selection:
+            chosen[0] = get_catalog().path_of(entries[selection[0]])
+        TKselect.destroy()
+
+    # Fall back to picking any file by hand
+    def browse():
+        if with_period and not read_period():
+            return
+        chosen[0] = askopenfilename(title=title)
+        TKselect.destroy()
+
+    usebutton = tkinter.Button(TKselect, text='Use Backup', command=callback)
+    browsebutton = tkinter.Button(TKselect, text='Browse...', command=browse)
+
+    usebutton.pack(side='bottom')
+    browsebutton.pack(side='bottom')
+    if with_period:
+        periodLabel.pack(side='bottom')
+        periodframe.pack(side='bottom', pady=2)
+        presetSelect.pack(side='left', padx=2)
+        tkinter.Label(periodframe, text='From:').pack(side='left')
+        fromField.pack(side='left', padx=2)
+        tkinter.Label(periodframe, text='To:').pack(side='left')
+        toField.pack(side='left', padx=2)
+    listbox.pack(side='left', fill='both', expand=True)
+    scroll.pack(side='right', fill='y')
+    scroll.config(command=listbox.yview)
+
+    TKselect.grab_set()
+    TKselect.wait_window()
+    return chosen[0]
+
+
+# The (start, end) datetimes of one of PERIOD_PRESETS, counting from today. end is the first moment after the period
+def preset_period(name, today=None):
+    today = today or datetime.date.today()
+    month = datetime.datetime(today.year, today.month, 1)
+    next_month = datetime.datetime(today.year + today.month // 12, today.month % 12 + 1, 1)
+    if name == 'This month':
+        return month, next_month
+    if name == 'Last month':
+        return datetime.datetime(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1), month
+    if name in ('This semester', 'Last semester'):
+        if today.month >= FALL_START_MONTH:
+            semester = (datetime.datetime(today.year, FALL_START_MONTH, 1), datetime.datetime(today.year + 1, 1, 1))
+            previous = (datetime.datetime(today.year, 1, 1), semester[0])
+        else:
+            semester = (datetime.datetime(today.year, 1, 1), datetime.datetime(today.year, FALL_START_MONTH, 1))
+            previous = (datetime.datetime(today.year - 1, FALL_START_MONTH, 1), semester[0])
+        return semester if name == 'This semester' else previous
+    return None, None
+
+
+# A short description of a period, e.g. for labels and file names: '' for the whole backup
+def describe_period(start, end):
+    if start is None and end is None:
+        return ''
+    last = (end - datetime.timedelta(days=1)).date().isoformat() if end is not None else ''
+    return (start.date().isoformat() if start is not None else '') + '_to_' + last
+
+
+# Returns the Google Sheets session, creating it the first time a pull needs it
+def get_session():
+    global session
+    import sheets
+
+    if session is None:
+        session = sheets.SheetsSession(PICKLE_PATH, CREDS_PATH, SCOPES, DISCOVERY_PATH)
+    return session
 
-        with os.scandir(path=BACKUP_PATH) as directory:
-            for file in directory:
-                cur_files += 1
-                recent_file = file.name.split('p', 1)[0]
 
-        if cur_files == 0:
-            new_backup = 'hours_backup.csv'
+# Logs in and pulls the linked sheet into a new EventTable. Runs on a worker.BackgroundJob thread, so it must not
+# touch any tkinter widgets
+def fetch_sheet(job):
+    with pull_lock:
+        return _fetch_sheet(job)
+
+
+def _fetch_sheet(job):
+    import sheets
+    from google.auth.exceptions import RefreshError
+
+    job.progress('Connecting to Google Sheets...')
+    try:
+        with diagnostics.stage('login'):
+            service = get_session().service()
+    except RefreshError:
+        # The saved login was revoked or has expired for good, so the next try starts a fresh login
+        get_session().invalidate()
+        raise
+    job.check_cancelled()
+
+    # Call the Sheets API a window of rows at a time, checking for a cancel between windows. With several sheets
+    # downloading at once, the progress shown is the rows downloaded from all of them
+    linked = linked_sheets()
+    downloaded = {}
+    progress_lock = threading.Lock()
+
+    def progress_for(sheet):
+        def progress(rows):
+            job.check_cancelled()
+            with progress_lock:
+                downloaded[sheet['key']] = rows
+                total = sum(downloaded.values())
+            job.progress('Downloaded ' + str(total) + ' rows...')
+        return progress
+
+    # Pulls one sheet, returning (its rows as a function that streams them, the EventTable they were parsed into if
+    # the pull already built one, how many rows were downloaded). The delta log keeps rows as the sheet has them, so
+    # the hash of the last row still matches the sheet's; the timestamp is only moved after the answers here
+    def pull(sheet):
+        timestamped = sheets.has_timestamp(sheet['range'])
+        if DELTA_PULLS:
+            log = backups.DeltaLog(DELTA_PATH, sheet['key'])
+            added = sheets.pull_delta(service, sheet['id'], sheet['range'], log, http=get_session().http,
+                                      progress=progress_for(sheet))
+            sheet_state[sheet['key']] = (log.row_count, log.last_hash)
+            if timestamped:
+                return lambda: map(events.timestamp_last, log.iter_rows()), None, added
+            return log.iter_rows, None, added
+
+        table = events.EventTable()
+        sheet_rows, last_row = 0, None
+        for chunk in sheets.stream_values(service, sheet['id'], sheet['range'], http=get_session().http):
+            with diagnostics.stage('parse', rows=len(chunk)):
+                table.extend(map(events.timestamp_last, chunk) if timestamped else chunk)
+            sheet_rows += len(chunk)
+            last_row = chunk[-1] if chunk else last_row
+            progress_for(sheet)(sheet_rows)
+        sheet_state[sheet['key']] = (sheet_rows, backups.row_hash(last_row) if last_row is not None else None)
+        return table.iter_rows, table, sheet_rows
+
+    job.progress('Downloading form responses...')
+    with diagnostics.stage('pull', delta=DELTA_PULLS, sheets=len(linked)) as timed:
+        # Every linked sheet downloads at the same time, so the pull takes about as long as the slowest one
+        with ThreadPoolExecutor(max_workers=SHEET_WORKERS) as pool:
+            pulled = list(pool.map(pull, linked))
+
+        with diagnostics.stage('parse'):
+            if len(linked) == 1:
+                rows, table, _ = pulled[0]
+                if table is None:
+                    table = events.EventTable.from_rows(rows())
+            else:
+                table = merge_sheets(linked, [rows for rows, _, _ in pulled])
+        timed.note(rows=len(table), added=sum(added for _, _, added in pulled))
+        return table
+
+
+# One table holding the responses from every linked sheet, in the order they're linked. Each response gets the label
+# of the sheet it came from in an extra Source column after the widest range (and after the timestamp column, even for
+# sheets pulled without one), so the sheets can still be told apart
+def merge_sheets(linked, pulled):
+    import sheets
+
+    width = max([events.TIMESTAMP_COL + 1] + [sheets.range_width(sheet['range']) for sheet in linked])
+    table = events.EventTable()
+    for sheet, rows in zip(linked, pulled):
+        for row in rows():
+            if not row:
+                continue
+            if row[0] == events.HEADER_NAME:
+                if table.header is None:
+                    table.append(row + [''] * (width - len(row)) + [SOURCE_HEADER])
+                continue
+            table.append(row + [''] * (width - len(row)) + [sheet['label']])
+    return table
+
+
+# Every linked spreadsheet, read from SpreadURL (the contents of spreadurl.txt): one per line, as the spreadsheet id
+# optionally followed by the range to pull (SAMPLE_RANGE_NAME by default) and a label to tag its responses with (the
+# id by default). key tells apart two ranges of the same spreadsheet, e.g. one tab per committee. A range linked twice
+# is only pulled once (under its first label), since both pulls would share one delta log
+def linked_sheets():
+    linked = []
+    if SpreadURL == 'NO CURRENT SPREADSHEET SELECTED':
+        return linked
+    seen = set()
+    for line in SpreadURL.splitlines():
+        parts = line.split(None, 2)
+        if not parts:
+            continue
+        range_name = parts[1] if len(parts) > 1 else SAMPLE_RANGE_NAME
+        if (parts[0], range_name) in seen:
+            continue
+        seen.add((parts[0], range_name))
+        key = parts[0] if range_name == SAMPLE_RANGE_NAME else parts[0] + '-' + re.sub(r'\W', '_', range_name)
+        linked.append({'id': parts[0], 'range': range_name, 'label': parts[2] if len(parts) > 2 else parts[0],
+                       'key': key})
+    return linked
+
+
+# Watch mode's background check: returns None if no linked sheet has changed since the last pull, or (the pulled
+# sheets, whether they were pulled without checking first) if any has. The first check after startup goes by the
+# delta logs, which remember the last pull across runs
+def check_sheet(job):
+    import sheets
+
+    unchecked = False
+    with diagnostics.stage('watch check'):
+        for sheet in linked_sheets():
+            known = sheet_state.get(sheet['key'])
+            if known is None and DELTA_PULLS:
+                # Opening a log trims rows a pull hasn't recorded yet, so it waits for any pull writing to it
+                with pull_lock:
+                    log = backups.DeltaLog(DELTA_PATH, sheet['key'])
+                if log.row_count:
+                    known = (log.row_count, log.last_hash)
+            if known is None:
+                unchecked = True
+                break
+            if sheets.has_changed(get_session().service(), sheet['id'], sheet['range'], *known,
+                                  http=get_session().http()):
+                break
         else:
-            new_backup = recent_file + 'p' + str(cur_files) + '.csv'
-
-        # Writes the results obtained from create_backup_window to a csv file in the given directory
-        with open(BACKUP_PATH + slash + new_backup, 'w+', newline='\n', encoding='utf-8') as csvfile:
-            csvfile.truncate()
-            valuewriter = csv.writer(csvfile)
-            for item in values:
-                valuewriter.writerow(item)
-    # The backups directory does not exist -- Create a new one and save an initial backup file
+            return None
+    return fetch_sheet(job), unchecked
+
+
+# Turns watch mode on or off. mainwindow shows what it's doing
+def set_watching(mainwindow, on):
+    watcher['on'] = on
+    if watcher['after'] is not None:
+        mainwindow.after_cancel(watcher['after'])
+        watcher['after'] = None
+    if on:
+        watcher['delay'] = WATCH_INTERVAL_MS
+        watch_check(mainwindow)
+    else:
+        mainwindow.watch_label['text'] = ''
+
+
+def watch_check(mainwindow):
+    watcher['after'] = None
+    if not linked_sheets():
+        watch_next(mainwindow, 'Watching -- waiting for a spreadsheet to be linked')
+        return
+
+    def on_done(result):
+        global values
+        checked = time.strftime('%H:%M')
+        if result is None:
+            watcher['delay'] = min(watcher['delay'] * 2, WATCH_MAX_INTERVAL_MS)
+            watch_next(mainwindow, 'Watching -- no new responses at ' + checked)
+            return
+
+        table, unchecked = result
+        values = table
+        # A sheet pulled without checking first may be the same as the latest backup already saved
+        if unchecked:
+            digest = ''
+            for row in table.iter_rows():
+                digest = backups.extend_digest(digest, row)
+            if get_catalog().find_hash(digest) is not None:
+                watcher['delay'] = min(watcher['delay'] * 2, WATCH_MAX_INTERVAL_MS)
+                watch_next(mainwindow, 'Watching -- no new responses at ' + checked)
+                return
+
+        pull_backup()
+        watcher['delay'] = WATCH_INTERVAL_MS
+        watch_next(mainwindow, 'Watching -- backed up ' + str(len(table)) + ' responses at ' + checked)
+
+    def on_error(error):
+        watcher['delay'] = min(watcher['delay'] * 2, WATCH_MAX_INTERVAL_MS)
+        watch_next(mainwindow, 'Watching -- the last check failed: ' + str(error))
+
+    mainwindow.watch_label['text'] = 'Watching -- checking the sheet...'
+    worker.BackgroundJob(mainwindow, check_sheet, on_done=on_done, on_error=on_error).start()
+
+
+# Schedules the next check, unless watch mode was turned off while this one was running
+def watch_next(mainwindow, text):
+    if not watcher['on']:
+        return
+    mainwindow.watch_label['text'] = text
+    watcher['after'] = mainwindow.after(watcher['delay'], watch_check, mainwindow)
+
+
+# Shows a view -- one of Voluntracker's windows -- building it the first time it's opened. build(window) fills in
+# a new NewWindow and returns a refresh function (or None), which is called with args every time the view is shown
+# to load new data into the widgets already there. Closing a view only hides it, so opening it again reuses the same
+# widgets instead of building another window, and every window runs on the main window's one event loop
+def open_view(name, title, build, *args):
+    view = views.get(name)
+    if view is None or not view[0].winfo_exists():
+        window = NewWindow()
+        window.title(title)
+        window.protocol('WM_DELETE_WINDOW', window.withdraw)
+        view = views[name] = (window, build(window))
     else:
-        os.mkdir(BACKUP_PATH)
-        # Writes the results obtained from create_backup_window to a csv file in the given directory
-        with open(BACKUP_PATH + slash + 'hours_backup.csv', 'w+', newline='\n', encoding='utf-8') as csvfile:
-            csvfile.truncate()
-            valuewriter = csv.writer(csvfile)
-            for item in values:
-                valuewriter.writerow(item)
+        view[0].deiconify()
+        view[0].lift()
 
+    if view[1] is not None:
+        view[1](*args)
+    return view[0]
 
-# Creates a new window for pulling the current data in Google Sheets and creating backups from it
-def create_backup_window():
-    # Google API login and setup
-    creds = None
-    global values
 
-    if(SpreadURL == 'NO CURRENT SPREADSHEET SELECTED'):
+# Creates a new window for pulling the current data in Google Sheets and creating backups from it. The window opens
+# right away and the pull runs in the background, filling the list in once the data arrives
+def create_backup_window():
+    if not linked_sheets():
         create_error_window('ERROR: Please input a valid Google Sheets URL first')
     else:
-        try:
-            # The file token.pickle stores the user's access and refresh tokens, and is
-            # created automatically when the authorization flow completes for the first
-            # time.
-            if os.path.exists(PICKLE_PATH):
-                with open(PICKLE_PATH, 'rb') as token:
-                    creds = pickle.load(token)
-            # If there are no (valid) credentials available, let the user log in.
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        CREDS_PATH, SCOPES)
-                    creds = flow.run_local_server()
-                # Save the credentials for the next run
-                with open(PICKLE_PATH, 'wb') as token:
-                    pickle.dump(creds, token)
-
-            service = build('sheets', 'v4', credentials=creds)
-
-            # Call the Sheets API
-            sheet = service.spreadsheets()
-            result = sheet.values().get(spreadsheetId=SpreadURL,
-                                        range=SAMPLE_RANGE_NAME).execute()
-            values = result.get('values', [])
-        except httplib2.ServerNotFoundError:
-            print("Something Went Wrong")
-
-        # Creates new window for viewing and interacting with Backup Management
-        TKbackup = NewWindow()
-        TKbackup.title("Backup Management")
-
-        # Creates the button that will allow users to pull new backups
-        backupbutton = tkinter.Button(TKbackup)
-        # Button for creating backups
-        backupbutton["text"] = "Click here \n to create a backup!"
-        backupbutton["command"] = pull_backup
-
-        # Creating the textbox and accompanying scrollbar that will show current values
-        scroll = tkinter.Scrollbar(TKbackup)
-        textbox = tkinter.Listbox(TKbackup, yscrollcommand=scroll.set)
-        # TODO 'item' is a list of strings -- might want to change this for formatting purposes
-        for item in values:
-            if item == values[0]:
-                item = '  '.join(item)
-                textbox.insert('end', item)
-            else:
-                item = '  '.join(item)
-                textbox.insert('end', item)
+        open_view('backup', 'Backup Management', build_backup_view)
+
+
+# Builds the backup window. Every time it's shown it starts a new pull, unless one is still running
+def build_backup_view(TKbackup):
+    import tableview
+
+    # Creates the button that will allow users to pull new backups. It stays disabled until the pull is done,
+    # so a half-finished pull can never be saved
+    backupbutton = tkinter.Button(TKbackup, state='disabled')
+    # Button for creating backups
+    backupbutton["text"] = "Click here \n to create a backup!"
+    backupbutton["command"] = pull_backup
+
+    # Shows what the background pull is doing, and lets the user stop it
+    statusbar = tkinter.Frame(TKbackup)
+    status = tkinter.Label(statusbar)
+    progress = ttk.Progressbar(statusbar, mode='indeterminate', length=200)
+    cancelbutton = tkinter.Button(statusbar, text='Cancel')
+
+    # Creating the table that will show current values. It only draws the rows on screen, so it opens just as
+    # fast for huge sheets
+    valuetable = tableview.VirtualTable(TKbackup)
+
+    # The pull currently running, if any
+    jobs = []
+
+    def finished(text):
+        progress.stop()
+        progress.pack_forget()
+        cancelbutton.pack_forget()
+        status['text'] = text
+
+    def on_done(table):
+        global values
+        values = table
+        finished('Pulled ' + str(len(table)) + ' responses.')
+        backupbutton['state'] = 'normal'
+        valuetable.set_data(table)
+
+    def on_error(error):
+        finished('The pull failed.')
+        create_error_window('ERROR: Could not pull from Google Sheets. Check your internet connection and '
+                            'try again.\n\n' + str(error))
+
+    def cancel():
+        jobs[0].cancel()
+        finished('Pull cancelled.')
+
+    cancelbutton['command'] = cancel
+
+    # Placing everything where it belongs
+    statusbar.pack(side='top')
+    status.pack(side='left', padx=2)
+    backupbutton.pack(side='bottom')
+    valuetable.pack(side='top', fill='both', expand=True)
 
-        # Placing everything where it belongs
-        backupbutton.pack(side='bottom')
-        textbox.pack(side='left', fill='both', expand=True)
-        scroll.pack(side='right', fill='y')
+    def refresh():
+        if jobs and not jobs[0].finished and not jobs[0].cancelled.is_set():
+            return
+        backupbutton['state'] = 'disabled'
+        status['text'] = 'Starting pull...'
+        progress.pack(side='left', padx=2)
+        cancelbutton.pack(side='left', padx=2)
+        progress.start()
+        jobs[:] = [worker.BackgroundJob(TKbackup, fetch_sheet, on_progress=lambda text: status.config(text=text),
+                                        on_done=on_done, on_error=on_error).start()]
 
-        scroll.config(command=textbox.yview)
-        TKbackup.mainloop()
+    return refresh
 
 
 # The Roster Window -- for managing the roster, such as entering or deleting members, as well as viewing the
 # current roster
 def create_roster_window():
-    TKroster = NewWindow()
-    TKroster.title("Roster")
+    open_view('roster', 'Roster', build_roster_view)
 
-    rosterdata = []
 
-    # Refreshes the window by essentially destroying the current window and creating it again with new data
-    def refresh():
-        TKroster.destroy()
-        create_roster_window()
-
-    if os.path.exists(ROSTER_PATH):
-        with open(ROSTER_PATH, 'r', newline='\n', encoding='utf-8') as rosterfile:
-            rostreader = csv.reader(rosterfile)
-            for member in rostreader:
-                member = ''.join(member)  # Converts list to a single string
-                rosterdata.append(member)
-    else:
-        with open(ROSTER_PATH, 'w+', newline='\n', encoding='utf-8') as rosterfile:
-            rosterfile.truncate()
+def build_roster_view(TKroster):
+    members = get_roster()
 
     scroll = tkinter.Scrollbar(TKroster)
-    textbox = tkinter.Listbox(TKroster)
+    textbox = tkinter.Listbox(TKroster, yscrollcommand=scroll.set)
+    scroll.config(command=textbox.yview)
+
+    # Fills the list from the roster in memory
+    def fill():
+        textbox.delete(0, 'end')
+        if len(members) != 0:
+            textbox.insert('end', *members)
+        else:
+            textbox.insert('end', 'No members in roster file!')
 
-    if len(rosterdata) != 0:
-        for member in rosterdata:
-            textbox.insert('end', member)
-    else:
-        textbox.insert('end', 'No members in roster file!')
+    # Keeps the list in step with the roster as members are added and deleted. New members just go on the end
+    def on_change(kind, name):
+        if kind == 'add' and len(members) > 1:
+            textbox.insert('end', name)
+        else:
+            fill()
+
+    fill()
+    members.subscribe(on_change)
+    textbox.bind('<Destroy>', lambda event: members.unsubscribe(on_change))
 
     editmem = tkinter.Button(TKroster, command=edit_members, text='Edit Members')
-    refresh = tkinter.Button(TKroster, command=refresh, text='Refresh')
+    matchbutton = tkinter.Button(TKroster, command=create_match_names_window, text='Match Names')
+    # Checks whether Roster.csv was changed outside of Voluntracker, which reloads it (and so refreshes the list)
+    refreshbutton = tkinter.Button(TKroster, command=members.reload_if_changed, text='Refresh')
 
-    refresh.pack(side='top')
+    refreshbutton.pack(side='top')
     editmem.pack(side='bottom')
+    matchbutton.pack(side='bottom')
     textbox.pack(side='left', fill='both', expand=True)
     scroll.pack(side='right', fill='y')
 
-    TKroster.mainloop()
+    return members.reload_if_changed
 
 
 # Editing members -- adding and deleting them
 def edit_members():
-    TKedit = NewWindow()
+    TKedit = open_view('edit_members', 'Edit Member Roster', build_edit_members_view)
     TKedit.geometry('600x200')
-    TKedit.title('Edit Member Roster')
 
-    # Reading currently existing members off the roster file
-    membersList = ['--Select a member--']
-    with open(ROSTER_PATH, 'r', encoding='utf-8', newline='\n') as rosterfile:
-        rostread = csv.reader(rosterfile)
-        for member in rostread:
-            member = ''.join(member)
-            membersList.append(member)
+
+def build_edit_members_view(TKedit):
+    members = get_roster()
 
     # Enter a new member into the roster
     def callback():
-        with open(ROSTER_PATH, 'a', newline='\n', encoding='utf-8') as rosterfile:
-            rostwrite = csv.writer(rosterfile)
-            rostwrite.writerow([field.get()])
-        field.select_clear()
+        members.add(field.get().strip())
+        field.delete(0, 'end')
 
     # Delete a member from the roster
     def deletemem():
-        deletion = defaultVar.get()
-        newRoster = []
-        for mem in membersList:
-            if mem == deletion:
-                continue
-            elif mem == '--Select a member--':
-                continue
-            else:
-                newRoster.append(mem)
-
-        with open(ROSTER_PATH, 'w', encoding='utf-8', newline='\n') as rosterfile:
-            rostwriter = csv.writer(rosterfile)
-            for member in newRoster:
-                rostwriter.writerow([member])
-
-        TKedit.destroy()
+        members.remove(memSelect.get())
+        TKedit.withdraw()
 
     # Build all of the buttons and whatnot into the TK window
-    defaultVar = tkinter.StringVar(TKedit)
-    defaultVar.set('--Select a member--')
-
     label1 = tkinter.Label(TKedit, text='Add a new member here: ')
     field = tkinter.Entry(TKedit)
     button1 = tkinter.Button(TKedit, text='Submit Changes', command=callback)
-    memSelect = tkinter.OptionMenu(TKedit, defaultVar, *membersList)
+    # Members can be picked from the list or typed in
+    memSelect = ttk.Combobox(TKedit)
     button2 = tkinter.Button(TKedit, text='Delete Member', command=deletemem)
 
     label1.pack(side='left')
@@ -363,250 +873,563 @@ def edit_members():
     button2.pack(side='bottom')
     memSelect.pack(side='bottom')
 
-    TKedit.mainloop()
+    def refresh():
+        memSelect['values'] = members.names()
+        memSelect.set('--Select a member--')
+        field.delete(0, 'end')
+
+    # Keeps the list of members to delete up to date while the window is open
+    def on_change(kind, name):
+        memSelect['values'] = members.names()
+
+    members.subscribe(on_change)
+    memSelect.bind('<Destroy>', lambda event: members.unsubscribe(on_change))
+    return refresh
+
+
+# Returns the roster store, loading Roster.csv the first time it's needed
+def get_roster():
+    global rosterstore
+
+    if rosterstore is None or rosterstore.path != ROSTER_PATH:
+        rosterstore = roster.RosterStore(ROSTER_PATH, ROSTER_JOURNAL_PATH)
+    return rosterstore
+
+
+# Returns the index matching names typed into the form to roster members (see names.py), rebuilt whenever the roster
+# changes. Matches confirmed by hand are kept in ALIAS_PATH
+def get_name_index():
+    import names
+
+    global nameindex, nameindex_roster
+
+    members = get_roster()
+    if nameindex is None or nameindex_roster != members.digest() or nameindex.alias_path != ALIAS_PATH:
+        nameindex = names.NameIndex(members.names(), ALIAS_PATH)
+        nameindex_roster = members.digest()
+    return nameindex
+
+
+# The per-member and per-venue totals for a backup, with every misspelled name counted under the roster member it
+# matches. With start and/or end, only the events submitted in that period are counted: they're picked out with the
+# backup's time index (or the store's timestamp index) instead of from its cached whole-backup summary
+def matched_aggregate(path, start=None, end=None):
+    import aggregates
+
+    backup_id = stored_backup(path)
+    if backup_id is not None:
+        aggregate = get_store().aggregate(backup_id, start, end)
+    elif start is None and end is None:
+        aggregate = get_aggregate(path)
+    else:
+        aggregate = aggregates.Aggregate.from_table(get_events(path).between(start, end))
+    return aggregate.renamed(get_name_index().mapping(aggregate.members))
+
+
+# Whether a period can be used with a backup. Backups pulled without column A have no timestamps, so only the whole
+# backup can be used for them -- otherwise says so in an error window and returns False
+def period_usable(path, start, end):
+    if start is None and end is None:
+        return True
+    backup_id = stored_backup(path)
+    if backup_id is not None:
+        try:
+            get_store().check_period(backup_id, start, end)
+            usable = True
+        except ValueError:
+            usable = False
+    else:
+        table = get_events(path)
+        usable = len(table.time_index()) > 0 or not len(table)
+    if not usable:
+        create_error_window('ERROR: ' + events.NO_TIMESTAMPS + '.\n\nChoose "Whole backup" for this backup, or pull a '
+                            'new backup that includes column A.')
+    return usable
+
+
+# Reviewing how the names in a backup were matched to the roster, and confirming or correcting the matches
+def create_match_names_window():
+    TKmatch = open_view('match_names', 'Match Names', build_match_names_view)
+    TKmatch.geometry('700x400')
+
+
+# Builds the name matching window. Every time it's shown it asks which backup to check and lists every name in it
+# that isn't exactly on the roster, with the member it was matched to (if any) and how
+def build_match_names_view(TKmatch):
+    import names
+
+    members = get_roster()
+
+    table = ttk.Treeview(TKmatch, columns=('match', 'how'), selectmode='browse')
+    table.heading('#0', text='Name on the form')
+    table.heading('match', text='Roster member')
+    table.heading('how', text='Matched by')
+    scroll = tkinter.Scrollbar(TKmatch, command=table.yview)
+    table.configure(yscrollcommand=scroll.set)
+
+    controls = tkinter.Frame(TKmatch)
+    # Members can be picked from the list or typed in
+    memSelect = ttk.Combobox(controls, width=30)
+
+    def show(name):
+        member, how = get_name_index().resolve(name)
+        if how == names.ALIAS and member == name:
+            member, how = None, 'not a member'
+        row = (member or '', how or 'no match')
+        if table.exists(name):
+            table.item(name, values=row)
+        else:
+            table.insert('', 'end', iid=name, text=name, values=row)
+
+    def selected():
+        selection = table.selection()
+        return selection[0] if selection else None
+
+    def on_select(event):
+        name = selected()
+        if name is not None:
+            memSelect.set(table.set(name, 'match'))
+
+    # Records that the selected name is the member picked in the list
+    def confirm():
+        name = selected()
+        if name is not None and memSelect.get() in members.names():
+            get_name_index().confirm(name, memSelect.get())
+            show(name)
+
+    # Records that the selected name isn't anybody on the roster, so it's never matched automatically
+    def reject():
+        name = selected()
+        if name is not None:
+            get_name_index().confirm(name, None)
+            show(name)
+
+    # Goes back to matching the selected name automatically
+    def forget():
+        name = selected()
+        if name is not None:
+            get_name_index().forget(name)
+            show(name)
+
+    confirmbutton = tkinter.Button(controls, text='Confirm Match', command=confirm)
+    rejectbutton = tkinter.Button(controls, text='Not a Member', command=reject)
+    forgetbutton = tkinter.Button(controls, text='Forget', command=forget)
+    table.bind('<<TreeviewSelect>>', on_select)
+
+    controls.pack(side='bottom', pady=5)
+    memSelect.pack(side='left', padx=2)
+    confirmbutton.pack(side='left', padx=2)
+    rejectbutton.pack(side='left', padx=2)
+    forgetbutton.pack(side='left', padx=2)
+    table.pack(side='left', fill='both', expand=True)
+    scroll.pack(side='right', fill='y')
+
+    def refresh():
+        FILEPATH = select_backup('Select the backup file to check!')
+        if FILEPATH == '':
+            TKmatch.withdraw()
+            return
+        if not os.path.exists(FILEPATH):
+            TKmatch.withdraw()
+            create_error_window('ERROR: You have to select a valid backup file to use')
+            return
+
+        backup_id = stored_backup(FILEPATH)
+        aggregate = get_store().aggregate(backup_id) if backup_id is not None else get_aggregate(FILEPATH)
+        table.delete(*table.get_children())
+        for name, _, _ in get_name_index().review(sorted(aggregate.members)):
+            show(name)
+        memSelect['values'] = members.names()
+        memSelect.set('')
+
+    return refresh
 
 
 # Creating a window to show metrics on members in the fraternity and their volunteer hours
 def create_metrics_window():
-    TKmetrics = NewWindow()
-    TKmetrics.title("Metrics")
+    open_view('metrics', 'Metrics', build_metrics_view)
+
+
+# Builds the metrics window. Every time it's shown it asks which backup to use and shows that backup's charts
+def build_metrics_view(TKmetrics):
+    import metrics
+    import charts
+    import aggregates
+
     TKmetrics.geometry(str(TKmetrics.winfo_screenwidth()) + 'x' + str(TKmetrics.winfo_screenheight()))
 
-    memberMetrics = []
-    try:
-        FILEPATH = askopenfilename(title='Select the backup file to use!')
-    except FileNotFoundError:
-        create_error_window('ERROR: You have to select a valid backup file to use')
-        TKmetrics.quit()
-
-    # Check backup file for current members and their volunteer hours
-    with open(FILEPATH, 'r', encoding='utf-8', newline='\n') as backupfile:
-        backupread = csv.reader(backupfile)
-        for event in backupread:
-            if event[0] == 'What is your name?':
-                continue
-            else:
-                memberEvent = []
-                memberEvent.append(event[0])
-                memberEvent.append(float(event[3]))
-                memberMetrics.append(memberEvent)
-    memberMetrics.sort()
-
-    # All of the monstrous code here is for adding together hours for members who have multiple events listed.
-    # If this wasn't present, and you just used memberMetrics, it wouldn't properly add together a member's total hours
-    cleanData = list()
-    duplicate = False
-    pos = 0
-
-    # We need to check every event in memberMetrics
-    for event in memberMetrics:
-        # First member needs to be added
-        if len(cleanData) == 0:
-            cleanData.append(memberMetrics[0])
-        # Then everyone else
-        else:
-            # And then if they're already present in the new list
-            for entry in cleanData:
-                if event[0] == entry[0]:
-                    duplicate = True
-                    value = event[1]
-            # If they're in the new list, add their new event to the old one
-            if duplicate:
-                cleanData[pos][1] = value + cleanData[pos][1]
-                duplicate = False
-            # If they aren't in the new list, add them and their hours from their event
-            else:
-                cleanData.append(event)
-                pos = pos + 1
-
-    # Check for members who have yet to submit hours (wouldn't show up if we just check backups/current)
-    with open(ROSTER_PATH, 'r', encoding='utf-8', newline='\n') as rosterfile:
-        rostread = csv.reader(rosterfile)
-        match = False
-        for member in rostread:
-            member = ''.join(member)
-            for x in cleanData:
-                if member == x[0]:
-                    match = True
-            if match:
-                match = False
-            else:
-                addition = []
-                addition.append(member)
-                addition.append(0)
-                cleanData.append(addition)
+    # Charts are cached by the backup's contents and by the roster and name matches, so they're only worked out the
+    # first time they're drawn. The metrics engine does the grouping in linear time instead of rescanning every
+    # member for every event
+    members = get_roster()
+    # The backup being shown and the period it covers, and its metrics once they've been worked out (by name index
+    # digest, since confirming a name match changes them)
+    chosen = ['', (None, None)]
+    results = {}
+
+    def get_results():
+        key = get_name_index().digest()
+        if key not in results:
+            results.clear()
+            results[key] = matched_aggregate(chosen[0], *chosen[1]).results(members.names())
+        return results[key]
+
+    # Picking which chart to show
+    controls = tkinter.Frame(TKmetrics)
+    modeVar = tkinter.StringVar(TKmetrics)
+    modeVar.set(charts.CHART_MODES['top'])
+    modeSelect = tkinter.OptionMenu(controls, modeVar, *charts.CHART_MODES.values())
+    countLabel = tkinter.Label(controls, text='How many to show:')
+    countField = tkinter.Spinbox(controls, from_=1, to=100, width=5)
+    countField.delete(0, 'end')
+    countField.insert(0, str(metrics.TOP_N))
+    chartLabel = tkinter.Label(TKmetrics, bg='white')
+
+    # Draws (or loads from the cache) the selected chart, sized to fit the window
+    def show():
+        mode = [key for key, name in charts.CHART_MODES.items() if name == modeVar.get()][0]
+        try:
+            n = max(1, int(countField.get()))
+        except ValueError:
+            n = metrics.TOP_N
+        size = (max(4, TKmetrics.winfo_width() // 100 - 1), max(3, TKmetrics.winfo_height() // 100 - 3))
+
+        with diagnostics.stage('metrics chart', mode=mode):
+            path = charts.cached_chart(CHART_CACHE_PATH, backup_digest(chosen[0]),
+                                       get_name_index().digest() + describe_period(*chosen[1]), get_results, mode, n,
+                                       size=size)
+        chart = tkinter.PhotoImage(master=TKmetrics, file=path)
+        chartLabel.configure(image=chart)
+        chartLabel.image = chart
+
+    showbutton = tkinter.Button(controls, text='Show Chart', command=show)
+
+    # Draws how the totals changed over every backup in the catalog, from their cached summaries
+    def show_trends():
+        entries = list(get_catalog().newest_first())[::-1]
+        size = (max(4, TKmetrics.winfo_width() // 100 - 1), max(3, TKmetrics.winfo_height() // 100 - 3))
+
+        def get_points():
+            return aggregates.trend(AGGREGATE_PATH, [
+                (entry['created'][:10], entry['hash'],
+                 lambda entry=entry: get_events(get_catalog().path_of(entry))) for entry in entries])
+
+        with diagnostics.stage('metrics chart', mode='trend'):
+            path = charts.cached_trend(CHART_CACHE_PATH, [entry['hash'] for entry in entries], get_points, size=size)
+        chart = tkinter.PhotoImage(master=TKmetrics, file=path)
+        chartLabel.configure(image=chart)
+        chartLabel.image = chart
+
+    trendbutton = tkinter.Button(controls, text='Trends Across Backups', command=show_trends)
+
+    # Saves every chart as PNG and PDF, plus a summary csv, into REPORT_PATH/<backup name>. The charts are drawn in
+    # other processes while the window carries on
+    def export():
+        import report
+
+        name = os.path.splitext(os.path.basename(chosen[0]))[0]
+        if describe_period(*chosen[1]):
+            name += '-' + describe_period(*chosen[1])
+        output_dir = os.path.join(REPORT_PATH, name)
+        results_now = get_results()
+        exportbutton['state'] = 'disabled'
+        reportLabel['text'] = 'Exporting the report...'
+
+        def on_done(paths):
+            exportbutton['state'] = 'normal'
+            reportLabel['text'] = 'Saved the report to ' + os.path.abspath(output_dir)
+
+        def on_error(error):
+            exportbutton['state'] = 'normal'
+            reportLabel['text'] = ''
+            create_error_window('ERROR: Could not export the report.\n\n' + str(error))
+
+        worker.BackgroundJob(TKmetrics, lambda job: report.export_report(results_now, output_dir),
+                             on_done=on_done, on_error=on_error).start()
+
+    exportbutton = tkinter.Button(controls, text='Export Report', command=export)
+    reportLabel = tkinter.Label(TKmetrics)
+
+    controls.pack(side='top')
+    modeSelect.pack(side='left', padx=2)
+    countLabel.pack(side='left', padx=2)
+    countField.pack(side='left', padx=2)
+    showbutton.pack(side='left', padx=2)
+    trendbutton.pack(side='left', padx=2)
+    exportbutton.pack(side='left', padx=2)
+    reportLabel.pack(side='top')
+    chartLabel.pack(side='top', fill='both', expand=True)
+
+    # The metrics depend on who's on the roster, so they're worked out again after it changes
+    def on_change(kind, name):
+        results.clear()
+    members.subscribe(on_change)
+    chartLabel.bind('<Destroy>', lambda event: members.unsubscribe(on_change))
+
+    def refresh():
+        FILEPATH = select_backup('Select the backup file to use!', with_period=True)
+        if FILEPATH == '':
+            TKmetrics.withdraw()
+            return
+        if not os.path.exists(FILEPATH):
+            TKmetrics.withdraw()
+            create_error_window('ERROR: You have to select a valid backup file to use')
+            return
+        if not period_usable(FILEPATH, *period):
+            TKmetrics.withdraw()
+            return
+
+        chosen[0] = FILEPATH
+        chosen[1] = tuple(period)
+        results.clear()
+        TKmetrics.update_idletasks()
+        show()
+
+    return refresh
 
-    # Using matplotlib to create a bar chart with members' volunteer hours
-    f = Figure(figsize=(4, 5), dpi=100)
-    names = []
-    hours = []
-    for member in cleanData:
-        names.append(member[0])
-        hours.append(member[1])
 
-    f.add_subplot(111).bar(names, hours)
+# The per-member and per-venue totals for a backup file, from its cached summary. The backup is only parsed the first
+# time, and the summary is kept in AGGREGATE_PATH under the backup's content hash
+def get_aggregate(path):
+    import aggregates
 
-    canvas = FigureCanvasTkAgg(f, TKmetrics)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side='top', fill='both', expand=True)
+    return aggregates.cached_aggregate(AGGREGATE_PATH, backup_digest(path), lambda: get_events(path))
 
-    TKmetrics.mainloop()
+
+# Content hash for a backup file. Backups in the catalog already have one recorded; anything else is hashed
+def backup_digest(path):
+    import charts
+
+    entry = get_catalog().get(os.path.basename(path))
+    if entry is not None and os.path.abspath(get_catalog().path_of(entry)) == os.path.abspath(path):
+        return entry['hash']
+    return charts.file_digest(path)
 
 
 # The submissions window -- for taking the data from a backup file and entering it into a formalized Excel workbook
 # This is probably the most complex part of this program
 def create_submission_window():
+    open_view('submission', 'Submission', build_submission_view)
 
-    TKsubmit = NewWindow()
-    TKsubmit.title("Submission")
 
-    members = []
-    with open(ROSTER_PATH, 'r', encoding='utf-8', newline='\n') as roster:
-        rostreader = csv.reader(roster)
-        for member in rostreader:
-            member = ''.join(member)
-            members.append(member)
+# Builds the submission window. Every time it's shown it asks which backup to submit and writes the workbook
+def build_submission_view(TKsubmit):
+    import submission
 
-    filename = askopenfilename()
-    eventData = []
+    result = tkinter.Label(TKsubmit, wraplength=600)
+    result.pack(side='top', pady=10)
 
-    # We need to get all of the data from the selected backup file
-    with open(filename, 'r', encoding='utf-8', newline='\n') as rawdata:
-        rawreader = csv.reader(rawdata)
-        for i in rawreader:
-            if i[0] == 'What is your name?':
-                continue
-            else:
-                event = []
-                volunteer = i[0]
-                event.append(volunteer)
-                duration = i[3]
-                event.append(duration)
-                location = i[2]
-                event.append(location)
-                eventData.append(event)
-    eventData.sort()
-
-    # Variables for going through the columns and ensuring duplicates are properly handled
-    presentMem = []
-    wb = load_workbook(TEMPLATE_URL)
-    num = 6
-    pos = 'B' + str(num)
-
-    # Used to track if the below try-catch block ran into an error, and therefore the Excel spreadsheet shouldn't
-    # be saved.
-    success = True
-
-    # For each of the unique events in eventData, find out if the volunteer is already listed. If so, add the event
-    # to their row. If not, give them a new row and put in their first event.
-    for event in eventData:
+    def refresh():
+        filename = select_backup('Select the backup file to submit!', with_period=True)
+        start, end = period
+        if filename == '':
+            TKsubmit.withdraw()
+            return
+        if not period_usable(filename, start, end):
+            TKsubmit.withdraw()
+            return
+
+        # Every member's events are grouped in one pass and streamed into a copy of the template. Members with more
+        # events than fit on one row carry on in the rows underneath
+        result['text'] = 'Creating the submission spreadsheet...'
+        TKsubmit.update_idletasks()
         try:
-            # Member not already recorded. Give them a new row and put in their first event
-            if event[0] not in presentMem:
-                wb.active[pos] = event[0]
-                presentMem.append(event[0])
-                tempCol = 'C'
-                pos = tempCol + str(num)
-                wb.active[pos] = event[2]
-                tempCol = 'D'
-                pos = tempCol + str(num)
-                wb.active[pos] = float(event[1])
-                num += 1
-                pos = 'B' + str(num)
-            # Member already recorded. Move on to the next pair of columns to put in new event data
-            elif event[0] in presentMem:
-                # Member has one activity already recorded, new one will be added to the second pair of columns (E+F)
-                if wb.active['E' + str(num-1)].value is None:
-                    pos = 'E' + str(num - 1)
-                    wb.active[pos] = event[2]
-                    pos = 'F' + str(num - 1)
-                    wb.active[pos] = float(event[1])
-                    pos = 'B' + str(num)
-                # Member has two activities already recorded, new one will be added to the third pair of columns (G+H)
-                elif wb.active['G' + str(num-1)].value is None:
-                    pos = 'G' + str(num - 1)
-                    wb.active[pos] = event[2]
-                    pos = 'H' + str(num - 1)
-                    wb.active[pos] = float(event[1])
-                    pos = 'B' + str(num)
-                # Member already has three activies recorded, new one will be added to the fourth pair of columns (I+J)
-                elif wb.active['I' + str(num-1)].value is None:
-                    pos = 'I' + str(num - 1)
-                    wb.active[pos] = event[2]
-                    pos = 'J' + str(num - 1)
-                    wb.active[pos] = float(event[1])
-                    pos = 'B' + str(num)
+            with diagnostics.stage('submission'):
+                # Events logged under a misspelled name go on the row of the roster member it matches. Only the
+                # events submitted in the chosen period are included
+                names = get_name_index()
+                backup_id = stored_backup(filename)
+                if backup_id is not None:
+                    grouped = get_store().member_events(backup_id, start, end)
+                    grouped = submission.merge_members(grouped, names.mapping(name for name, _ in grouped))
+                    submission.write_members(grouped, TEMPLATE_URL, SUBMISSION_PATH)
                 else:
-                    errName = event[0]
-                    raise ValueError('Too many events for one member: ' + event[0])
-        except ValueError:
-            success = False
-            create_error_window('Too many events for one member: ' + errName)
-
-    # If we didn't run into any errors, we have to save the new Excel file and notify user of success
-    if success:
-        wb.save('FINALIZED_SUBMISSION.xlsx')
-        create_error_window('Successfully created a formalized volunteer spreadsheet! \n'
-                            'It\'s located at: ' + os.path.abspath('FINALIZED_SUBMISSION.xlsx'))
+                    table = get_events(filename)
+                    if start is not None or end is not None:
+                        table = table.between(start, end)
+                    mapping = names.mapping(table.member_names)
+                    submission.write_submission(table, TEMPLATE_URL, SUBMISSION_PATH, mapping)
+        except (OSError, ValueError, sqlite3.Error) as error:
+            result['text'] = 'ERROR: Could not create the submission spreadsheet.\n\n' + str(error)
+        else:
+            result['text'] = ('Successfully created a formalized volunteer spreadsheet! \n'
+                              'It\'s located at: ' + os.path.abspath(SUBMISSION_PATH))
 
-    TKsubmit.mainloop()
+    return refresh
 
 
-# Create a window for error messages, defined in a way that's (hopefully) useful to the end user
+# Create a window for error messages, defined in a way that's (hopefully) useful to the end user. There is one
+# message window, which shows the latest message
 def create_error_window(errText):
-    TKError = NewWindow()
+    TKError = open_view('message', 'Voluntracker', build_error_view, errText)
     TKError.geometry('400x300')
-    errLabel = tkinter.Label(TKError, text=errText, wraplength=400)
+
+
+def build_error_view(TKError):
+    errLabel = tkinter.Label(TKError, wraplength=400)
 
     errLabel.pack()
 
-    TKError.mainloop()
+    def refresh(errText):
+        errLabel['text'] = errText
+
+    return refresh
+
+
+# The Diagnostics window -- shows how long each stage of the recent pulls, backups, charts and submissions took, so
+# it's clear whether the time goes to logging in, the Sheets API, parsing, the metrics, matplotlib or openpyxl
+def create_diagnostics_window():
+    open_view('diagnostics', 'Diagnostics', build_diagnostics_view)
+
+
+def build_diagnostics_view(TKdiag):
+    log = os.path.join(DIAGNOSTICS_PATH, 'diagnostics.jsonl')
+    profiles = os.path.join(DIAGNOSTICS_PATH, 'Profiles')
+
+    controls = tkinter.Frame(TKdiag)
+    recording = tkinter.BooleanVar(TKdiag, value=diagnostics.enabled)
+    profiling = tkinter.BooleanVar(TKdiag, value=diagnostics.profile_dir is not None)
+
+    # Applies the two checkboxes. Everything is logged to DIAGNOSTICS_PATH while recording
+    def configure():
+        diagnostics.configure(recording.get(), log, profiles if profiling.get() else None)
+
+    recordbox = tkinter.Checkbutton(controls, text='Record timings', variable=recording, command=configure)
+    profilebox = tkinter.Checkbutton(controls, text='Profile with cProfile', variable=profiling, command=configure)
+    clearbutton = tkinter.Button(controls, text='Clear', command=diagnostics.reset)
+    pathlabel = tkinter.Label(TKdiag, text='Logged to ' + os.path.abspath(log) + ', profiles saved to ' +
+                              os.path.abspath(profiles))
+
+    # Totals per stage, then the most recent stages, newest first
+    columns = ('calls', 'total', 'average', 'longest')
+    totals = ttk.Treeview(TKdiag, columns=columns, height=8)
+    totals.heading('#0', text='Stage')
+    for column, heading in zip(columns, ('Calls', 'Total (s)', 'Average (ms)', 'Longest (ms)')):
+        totals.heading(column, text=heading)
+        totals.column(column, width=100, anchor='e')
+    counterlabel = tkinter.Label(TKdiag, justify='left')
+    recent = ttk.Treeview(TKdiag, columns=('seconds', 'details'), height=12)
+    recent.heading('#0', text='Stage')
+    recent.heading('seconds', text='Time (ms)')
+    recent.heading('details', text='Details')
+    recent.column('seconds', width=100, anchor='e')
+    recent.column('details', width=400)
+
+    controls.pack(side='top')
+    recordbox.pack(side='left', padx=2)
+    profilebox.pack(side='left', padx=2)
+    clearbutton.pack(side='left', padx=2)
+    pathlabel.pack(side='top')
+    totals.pack(side='top', fill='x')
+    counterlabel.pack(side='top', fill='x')
+    recent.pack(side='top', fill='both', expand=True)
+
+    # Redraws both tables from the recorded stages, every second while the window is showing
+    def update():
+        if not TKdiag.winfo_exists():
+            return
+        if TKdiag.winfo_viewable():
+            stages, counters = diagnostics.summary()
+            totals.delete(*totals.get_children())
+            for name, (calls, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1]):
+                totals.insert('', 'end', text=name, values=(calls, format(total, '.3f'),
+                                                            format(total / calls * 1000, '.1f'),
+                                                            format(longest * 1000, '.1f')))
+            counterlabel['text'] = '   '.join(name + ': ' + str(n) for name, n in sorted(counters.items()))
+
+            recent.delete(*recent.get_children())
+            for record in reversed(diagnostics.recent_stages()[-DIAGNOSTICS_SHOWN:]):
+                details = ', '.join(key + '=' + str(value) for key, value in record.items()
+                                    if key not in ('stage', 'seconds', 'pid'))
+                recent.insert('', 'end', text=record['stage'], values=(format(record['seconds'] * 1000, '.1f'),
+                                                                       details))
+        TKdiag.after(DIAGNOSTICS_REFRESH_MS, update)
+
+    update()
+    return None
 
 
 # Change the Google Sheets URL -- needs to be the FULL URL straight from the address bar when on the Sheet in a browser
 def change_url(mainwindow):
-    TKurl = NewWindow()
-    TKurl.geometry('600x200')
-    TKurl.title('Change Google Sheet')
-    descriptor = tkinter.Label(TKurl, text='Paste the URL here:')
-    field = tkinter.Entry(TKurl)
+    TKurl = open_view('change_url', 'Change Google Sheets', lambda window: build_change_url_view(window, mainwindow))
+    TKurl.geometry('700x300')
+
 
-    # Executes when the user clicks the 'Submit' button -- changes the Spreadsheet URL
+# Builds the window for linking spreadsheets. Each line is one sheet: its URL, then optionally the range to pull
+# (e.g. Fall!B:F) and a label for its responses
+def build_change_url_view(TKurl, mainwindow):
+    descriptor = tkinter.Label(TKurl, text='Paste the URL of each spreadsheet on its own line. To pull a different '
+                                           'range than ' + SAMPLE_RANGE_NAME + ' or label the responses, add them '
+                                           'after the URL, e.g.\n<URL> Fall!B:F Fall semester', justify='left')
+    field = tkinter.Text(TKurl, height=8, width=80)
+
+    # Executes when the user clicks the 'Submit' button -- changes the linked spreadsheets
     def callback():
         global SpreadURL
         try:
             # The URL should be submitted as a full copy-paste of the URL with the Google Sheets file open in the
             # browser
-            raw_input = str(field.get())
-            input = raw_input.split('/d/')[1]
-            input = input.split('/')[0]
-            SpreadURL = input
+            lines = []
+            for raw_input in field.get('1.0', 'end').splitlines():
+                parts = raw_input.split(None, 1)
+                if not parts:
+                    continue
+                input = parts[0].split('/d/')[1]
+                input = input.split('/')[0]
+                lines.append(' '.join([input] + parts[1:]))
+            if not lines:
+                raise IndexError()
+            SpreadURL = '\n'.join(lines)
             with open(SPRERL_PATH, 'w', encoding='utf-8') as pathfile:
                 pathfile.truncate()
-                pathfile.write(input)
-            field.select_clear()
-            TKurl.destroy()
+                pathfile.write(SpreadURL)
+            TKurl.withdraw()
             mainwindow.refresh()
         except IndexError:
-            create_error_window('INDEX ERROR: Please make sure you properly copied the URL into the textbox')
+            create_error_window('INDEX ERROR: Please make sure you properly copied each URL into the textbox')
 
     change = tkinter.Button(TKurl, text='Submit', command=callback)
 
-    descriptor.pack(side='left')
-    field.pack(side='left')
-    change.pack(side='left')
-    TKurl.mainloop()
+    descriptor.pack(side='top', padx=2, pady=2)
+    field.pack(side='top', fill='both', expand=True, padx=2)
+    change.pack(side='bottom', pady=2)
+
+    # Starts from the sheets already linked, shown the way they'd be pasted
+    def refresh():
+        field.delete('1.0', 'end')
+        for sheet in linked_sheets():
+            line = 'https://docs.google.com/spreadsheets/d/' + sheet['id'] + '/edit'
+            if sheet['range'] != SAMPLE_RANGE_NAME or sheet['label'] != sheet['id']:
+                line += ' ' + sheet['range']
+            if sheet['label'] != sheet['id']:
+                line += ' ' + sheet['label']
+            field.insert('end', line + '\n')
+
+    return refresh
 
 
 # The starting/main execution point for Voluntracker.py
 if __name__ == '__main__':
+    # In a frozen (PyInstaller) build, the processes report.py draws charts in start by running this file again;
+    # this makes them run the chart work they were started for instead of opening another window
+    multiprocessing.freeze_support()
+
     # If we aren't executing on Windows, we need to change our file path syntax for the OS
     if platform.system() != 'Windows':
         BACKUP_PATH = 'Backups'
+        DELTA_PATH = 'Backups/Delta'
         ROSTER_PATH = 'Configuration/Roster.csv'
+        ROSTER_JOURNAL_PATH = 'Configuration/Roster.journal'
+        ALIAS_PATH = 'Configuration/aliases.json'
         LOGO_PATH = 'Configuration/DSP_logo.png'
         PICKLE_PATH = 'Configuration/token.pickle'
         CREDS_PATH = 'Configuration/credentials.json'
+        DISCOVERY_PATH = 'Configuration/sheets_discovery.json'
+        CHART_CACHE_PATH = 'Backups/Charts'
+        STORE_PATH = 'Backups/events.sqlite3'
+        DIAGNOSTICS_PATH = 'Backups/Diagnostics'
+        AGGREGATE_PATH = 'Backups/Aggregates'
+        REPORT_PATH = 'Reports'
         SPRERL_PATH = 'Configuration/spreadurl.txt'
         TEMPLATE_URL = 'Configuration/BaseTemplate.xlsx'
 
@@ -620,5 +1443,12 @@ if __name__ == '__main__':
             pathfile.write('NO CURRENT SPREADSHEET SELECTED')
             SpreadURL = 'NO CURRENT SPREADSHEET SELECTED'
 
+    if DIAGNOSTICS:
+        diagnostics.configure(log=os.path.join(DIAGNOSTICS_PATH, 'diagnostics.jsonl'))
+
     TK = MainWindow()
+    if WATCH:
+        TK.watch_var.set(True)
+        set_watching(TK, True)
+    TK.mainloop()
 
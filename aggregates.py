@@ -0,0 +1,119 @@
+import json
+import os
+import metrics
+import diagnostics
+from backups import write_json
+
+
+# Small per-backup summaries -- hours and event counts per member, event counts per venue -- saved next to the
+# backups in a sidecar json named after the backup's content hash. A backup is only parsed the first time its
+# summary is needed; after that the metrics window and the trend chart work from the summary alone. Summaries can be
+# added together with merge(), e.g. to combine semesters kept in separate sheets into one set of metrics.
+# (Each backup is a full snapshot of its sheet, so merging backups of the same sheet would count events twice.)
+
+# Bump this whenever the sidecar format changes, so old summaries are rebuilt instead of misread
+AGGREGATE_VERSION = '1'
+
+
+class Aggregate:
+    def __init__(self, members=None, venues=None):
+        # {member: [hours, events]} and {venue: events}, both in the order members and venues first appear
+        self.members = members if members is not None else {}
+        self.venues = venues if venues is not None else {}
+
+    # Summarizes an events.EventTable, with the same numpy group-bys the metrics engine uses
+    @classmethod
+    def from_table(cls, table):
+        totals = metrics.member_totals(table)
+        counts = metrics.member_counts(table)
+        venue_counts = metrics.venue_counts(table)
+        members = {table.member_names[i]: [float(totals[i]), int(counts[i])] for i in range(len(counts)) if counts[i]}
+        venues = {table.venue_names[i]: int(venue_counts[i]) for i in range(len(venue_counts)) if venue_counts[i]}
+        return cls(members, venues)
+
+    @property
+    def events(self):
+        return sum(count for _, count in self.members.values())
+
+    @property
+    def hours(self):
+        return sum(hours for hours, _ in self.members.values())
+
+    # Adds other's totals into this summary
+    def add(self, other):
+        for member, (hours, count) in other.members.items():
+            totals = self.members.setdefault(member, [0.0, 0])
+            totals[0] += hours
+            totals[1] += count
+        for venue, count in other.venues.items():
+            self.venues[venue] = self.venues.get(venue, 0) + count
+        return self
+
+    # A copy with members renamed by mapping ({name: roster name}, e.g. from names.NameIndex.mapping). Members who
+    # end up with the same name are added together
+    def renamed(self, mapping):
+        if not mapping:
+            return self
+        renamed = Aggregate({}, dict(self.venues))
+        for member, (hours, count) in self.members.items():
+            totals = renamed.members.setdefault(mapping.get(member, member), [0.0, 0])
+            totals[0] += hours
+            totals[1] += count
+        return renamed
+
+    # The same dict metrics.compute_metrics returns for the events behind this summary
+    def results(self, roster=None, top_n=metrics.TOP_N):
+        names = list(self.members)
+        venues = sorted(self.venues.items(), key=lambda pair: -pair[1])
+        return metrics.summarize(names, [self.members[name][0] for name in names], venues, roster, top_n)
+
+    def to_json(self):
+        return {'version': AGGREGATE_VERSION,
+                'members': [[member, hours, count] for member, (hours, count) in self.members.items()],
+                'venues': [[venue, count] for venue, count in self.venues.items()]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({member: [hours, count] for member, hours, count in data['members']},
+                   {venue: count for venue, count in data['venues']})
+
+
+# Adds any number of summaries together into a new one
+def merge(aggregates):
+    merged = Aggregate()
+    for aggregate in aggregates:
+        merged.add(aggregate)
+    return merged
+
+
+def sidecar_path(directory, digest):
+    return os.path.join(directory, digest + '.json')
+
+
+# Returns the summary of the backup with content hash digest, reading its sidecar if there is one. Otherwise
+# load_table() is called to get the backup as an events.EventTable, and the new summary is saved for next time
+def cached_aggregate(directory, digest, load_table):
+    path = sidecar_path(directory, digest)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as sidecar:
+            data = json.load(sidecar)
+        if data.get('version') == AGGREGATE_VERSION:
+            diagnostics.count('aggregate cache hits')
+            return Aggregate.from_json(data)
+
+    diagnostics.count('aggregate cache misses')
+    with diagnostics.stage('aggregate'):
+        aggregate = Aggregate.from_table(load_table())
+    os.makedirs(directory, exist_ok=True)
+    write_json(path, aggregate.to_json())
+    return aggregate
+
+
+# One point per backup for the trend chart: (label, total hours, events, active members), oldest backup first.
+# backups is a list of (label, digest, load_table) in order
+def trend(directory, backups):
+    points = []
+    for label, digest, load_table in backups:
+        aggregate = cached_aggregate(directory, digest, load_table)
+        points.append((label, aggregate.hours, aggregate.events, len(aggregate.members)))
+    return points
@@ -0,0 +1,349 @@
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import diagnostics
+
+
+# Local storage for Voluntracker backups.
+
+# Separates cells when hashing a row, so ['ab', 'c'] and ['a', 'bc'] hash differently
+CELL_SEPARATOR = '\x1f'
+
+
+# Content hash of a single sheet row
+def row_hash(row):
+    return hashlib.sha1(CELL_SEPARATOR.join(row).encode('utf-8')).hexdigest()
+
+
+# Folds one more row into a running digest. A digest built row by row over a whole backup identifies its contents
+def extend_digest(digest, row):
+    return _extend(digest, row_hash(row))
+
+
+def _extend(digest, hashed_row):
+    return hashlib.sha1((digest + hashed_row).encode('ascii')).hexdigest()
+
+
+# Writes a json file by replacing it in one step, so a crash mid-write never leaves a half-written file behind
+def write_json(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as jsonfile:
+        json.dump(data, jsonfile)
+    os.replace(temp_path, path)
+
+
+# An append-only log of every row pulled from one spreadsheet, used by delta pulls. New rows are appended to
+# <spreadsheet id>.csv, and <spreadsheet id>.json remembers how many sheet rows have been ingested, the hash of the
+# last one (to detect edits above the end of the sheet) and a running digest over all of them. Reading the log back
+# from the start reconstructs the full snapshot.
+class DeltaLog:
+    def __init__(self, directory, spreadsheet_id):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, spreadsheet_id + '.csv')
+        self.state_path = os.path.join(directory, spreadsheet_id + '.json')
+        self.state = {'rows': 0, 'last_hash': None, 'digest': '', 'size': 0}
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as statefile:
+                self.state = json.load(statefile)
+
+        # Rows appended after the last saved state (e.g. the program was closed mid-pull) are not trusted
+        if os.path.exists(self.path) and os.path.getsize(self.path) != self.state['size']:
+            with open(self.path, 'r+b') as logfile:
+                logfile.truncate(self.state['size'])
+
+    @property
+    def row_count(self):
+        return self.state['rows']
+
+    @property
+    def last_hash(self):
+        return self.state['last_hash']
+
+    @property
+    def digest(self):
+        return self.state['digest']
+
+    # Appends new rows to the end of the log and records them in the state file
+    def append(self, rows):
+        if not rows:
+            return
+        digest = self.state['digest']
+        with open(self.path, 'a', newline='\n', encoding='utf-8') as logfile:
+            logwriter = csv.writer(logfile)
+            for row in rows:
+                logwriter.writerow(row)
+                digest = extend_digest(digest, row)
+
+        self.state = {'rows': self.state['rows'] + len(rows), 'last_hash': row_hash(rows[-1]), 'digest': digest,
+                      'size': os.path.getsize(self.path)}
+        write_json(self.state_path, self.state)
+
+    # Throws away everything in the log, for when the sheet was edited and has to be pulled again from scratch
+    def reset(self):
+        with open(self.path, 'w', newline='\n', encoding='utf-8'):
+            pass
+        self.state = {'rows': 0, 'last_hash': None, 'digest': '', 'size': 0}
+        write_json(self.state_path, self.state)
+
+    # Streams the full snapshot back out of the log, one row at a time
+    def iter_rows(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8', newline='\n') as logfile:
+            for row in csv.reader(logfile):
+                yield row
+
+
+# Packed backups. Consecutive backups of a sheet share almost all of their rows, so instead of a full csv copy each
+# packed backup is a small manifest (hours_backupN.pack) listing the chunks of rows it's made of. Chunks are gzipped
+# csv, named after the hash of their contents and kept once in Backups/Chunks however many backups use them. Chunk
+# boundaries are picked by the rows themselves (after any row whose hash is a multiple of CHUNK_ROWS), so rows added
+# to the end of the sheet, or a row edited or inserted in the middle, only change the chunks around them and every
+# other chunk is shared with the previous backup. Reading a packed backup streams the chunks back in order.
+PACKED_EXTENSION = '.pack'
+CHUNK_DIR = 'Chunks'
+
+# Rows in a chunk on average, and at most
+CHUNK_ROWS = 1024
+CHUNK_MAX_ROWS = 8 * CHUNK_ROWS
+
+PACK_VERSION = 1
+
+
+def chunk_path(chunk_dir, chunk_id):
+    return os.path.join(chunk_dir, chunk_id[:2], chunk_id + '.csv.gz')
+
+
+# Saves one chunk of rows unless an identical chunk is already stored. Returns the chunk's id
+def _write_chunk(chunk_dir, rows):
+    text = io.StringIO(newline='\n')
+    csv.writer(text).writerows(rows)
+    data = text.getvalue().encode('utf-8')
+    chunk_id = hashlib.sha1(data).hexdigest()
+
+    path = chunk_path(chunk_dir, chunk_id)
+    if os.path.exists(path):
+        diagnostics.count('backup chunks shared')
+    else:
+        diagnostics.count('backup chunks written')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as chunkfile:
+            chunkfile.write(gzip.compress(data, mtime=0))
+        os.replace(temp_path, path)
+    return chunk_id
+
+
+# Writes rows as a packed backup at path. Returns (rows, digest) like a csv backup would have
+def write_packed(path, rows):
+    chunk_dir = os.path.join(os.path.dirname(path), CHUNK_DIR)
+    chunks = []
+    digest = ''
+    count = 0
+    pending = []
+    for row in rows:
+        hashed = row_hash(row)
+        digest = _extend(digest, hashed)
+        count += 1
+        pending.append(row)
+        if int(hashed[:8], 16) % CHUNK_ROWS == 0 or len(pending) == CHUNK_MAX_ROWS:
+            chunks.append((_write_chunk(chunk_dir, pending), len(pending)))
+            pending = []
+    if pending:
+        chunks.append((_write_chunk(chunk_dir, pending), len(pending)))
+
+    # The manifest goes last, so a crash part way through never leaves a backup with missing chunks
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as manifest:
+        manifest.write(json.dumps({'version': PACK_VERSION, 'rows': count, 'digest': digest}) + '\n')
+        for chunk_id, chunk_rows in chunks:
+            manifest.write(chunk_id + ' ' + str(chunk_rows) + '\n')
+    os.replace(temp_path, path)
+    return count, digest
+
+
+# Streams the rows of a packed backup, one chunk at a time
+def iter_packed(path):
+    chunk_dir = os.path.join(os.path.dirname(path), CHUNK_DIR)
+    with open(path, 'r', encoding='utf-8') as manifest:
+        header = json.loads(manifest.readline())
+        if header.get('version') != PACK_VERSION:
+            raise ValueError(path + ' was packed by a different version of Voluntracker')
+        chunk_ids = [line.split()[0] for line in manifest if line.strip()]
+    for chunk_id in chunk_ids:
+        with gzip.open(chunk_path(chunk_dir, chunk_id), 'rt', encoding='utf-8', newline='\n') as chunkfile:
+            yield from csv.reader(chunkfile)
+
+
+def is_packed(path):
+    return path.endswith(PACKED_EXTENSION)
+
+
+# Streams the rows of any backup, packed or csv
+def iter_backup(path):
+    if is_packed(path):
+        yield from iter_packed(path)
+        return
+    with open(path, 'r', encoding='utf-8', newline='\n') as csvfile:
+        yield from csv.reader(csvfile)
+
+
+# Backup files are named hours_backup.csv, hours_backup1.csv, hours_backup2.csv, ... (or .pack when packed)
+BACKUP_PREFIX = 'hours_backup'
+BACKUP_NAME_PATTERN = re.compile(re.escape(BACKUP_PREFIX) + r'(\d*)(\.csv|' + re.escape(PACKED_EXTENSION) + ')$')
+
+CATALOG_NAME = 'catalog.jsonl'
+
+
+# Filename for the backup with the given index
+def backup_name(index, extension='.csv'):
+    return BACKUP_PREFIX + (str(index) if index else '') + extension
+
+
+# A persistent index of every backup in the Backups folder, so finding the latest backup or the next free filename
+# never has to scan the directory. Each backup is one json line in catalog.jsonl holding its name, index, creation
+# time, row count, content digest and first/last form timestamps (None when the backup has no timestamps).
+# New backups are appended to the end of the file. With packed=True new backups are written packed.
+class BackupCatalog:
+    def __init__(self, directory, packed=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.packed = packed
+        self.path = os.path.join(directory, CATALOG_NAME)
+        self.entries = []
+        self.by_name = {}
+        self.by_hash = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as catalogfile:
+                for line in catalogfile:
+                    if line.strip():
+                        self._remember(json.loads(line))
+        else:
+            self._import_existing()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Entries from newest to oldest
+    def newest_first(self):
+        return reversed(self.entries)
+
+    def latest(self):
+        return self.entries[-1] if self.entries else None
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    # Returns the entry for a backup with exactly this content, if there is one
+    def find_hash(self, digest):
+        return self.by_hash.get(digest)
+
+    def path_of(self, entry):
+        return os.path.join(self.directory, entry['name'])
+
+    # The filename the next backup will be saved under
+    def next_name(self):
+        latest = self.latest()
+        index = latest['index'] + 1 if latest else 0
+        # Only happens if someone copied a backup into the folder by hand
+        while any(os.path.exists(os.path.join(self.directory, backup_name(index, extension)))
+                  for extension in ('.csv', PACKED_EXTENSION)):
+            index += 1
+        return backup_name(index, PACKED_EXTENSION if self.packed else '.csv')
+
+    # Writes rows to a new backup file and records it in the catalog. timestamps is an optional (first, last) pair
+    def write_backup(self, rows, timestamps=(None, None)):
+        name = self.next_name()
+        digest = ''
+        count = 0
+        with diagnostics.stage('backup write', packed=self.packed) as timed:
+            if self.packed:
+                count, digest = write_packed(os.path.join(self.directory, name), rows)
+            else:
+                with open(os.path.join(self.directory, name), 'w+', newline='\n', encoding='utf-8') as csvfile:
+                    valuewriter = csv.writer(csvfile)
+                    for row in rows:
+                        valuewriter.writerow(row)
+                        digest = extend_digest(digest, row)
+                        count += 1
+            timed.note(rows=count)
+        return self.add(name, count, digest, timestamps)
+
+    # Converts every csv backup in the catalog to a packed one, deleting the csv once its packed copy is recorded.
+    # Returns how many were converted
+    def pack_backups(self):
+        converted = []
+        for i, entry in enumerate(self.entries):
+            if is_packed(entry['name']):
+                continue
+            name = backup_name(entry['index'], PACKED_EXTENSION)
+            count, digest = write_packed(os.path.join(self.directory, name), iter_backup(self.path_of(entry)))
+            if digest != entry['hash']:
+                os.remove(os.path.join(self.directory, name))
+                raise ValueError('Packing ' + entry['name'] + ' changed its contents')
+            converted.append(self.path_of(entry))
+            self.entries[i] = dict(entry, name=name)
+
+        if converted:
+            # Rewritten in one step, then the csv copies are removed
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as catalogfile:
+                for entry in self.entries:
+                    catalogfile.write(json.dumps(entry) + '\n')
+            os.replace(temp_path, self.path)
+            entries, self.entries, self.by_name, self.by_hash = self.entries, [], {}, {}
+            for entry in entries:
+                self._remember(entry)
+            for path in converted:
+                os.remove(path)
+        return len(converted)
+
+    # Records an already-written backup file. created defaults to now
+    def add(self, name, rows, digest, timestamps=(None, None), created=None):
+        match = BACKUP_NAME_PATTERN.match(name)
+        latest = self.latest()
+        entry = {
+            'name': name,
+            'index': int(match.group(1) or 0) if match else (latest['index'] + 1 if latest else 0),
+            'created': (created or datetime.datetime.now()).isoformat(timespec='seconds'),
+            'rows': rows,
+            'hash': digest,
+            'first_timestamp': timestamps[0],
+            'last_timestamp': timestamps[1],
+        }
+        with open(self.path, 'a', encoding='utf-8') as catalogfile:
+            catalogfile.write(json.dumps(entry) + '\n')
+        self._remember(entry)
+        return entry
+
+    def _remember(self, entry):
+        self.entries.append(entry)
+        self.by_name[entry['name']] = entry
+        self.by_hash.setdefault(entry['hash'], entry)
+
+    # First run with a catalog: records the backups that are already in the folder, oldest first
+    def _import_existing(self):
+        found = []
+        with os.scandir(path=self.directory) as directory:
+            for file in directory:
+                match = BACKUP_NAME_PATTERN.match(file.name)
+                if file.is_file() and match:
+                    found.append((int(match.group(1) or 0), file.name))
+
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        for index, name in sorted(found):
+            path = os.path.join(self.directory, name)
+            digest = ''
+            count = 0
+            for row in iter_backup(path):
+                digest = extend_digest(digest, row)
+                count += 1
+            self.add(name, count, digest, created=datetime.datetime.fromtimestamp(os.path.getmtime(path)))
@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import events
+import metrics
+import submission
+import backups
+import sheets
+import report
+import roster
+import diagnostics
+from google.auth.exceptions import RefreshError
+
+
+# Headless batch mode for running many chapters at once without opening any windows. Takes a json file listing one
+# job per chapter and, for each one, pulls the chapter's sheet (or loads a backup), saves a backup, exports the report
+# (every chart as PNG and PDF, and summary.csv -- see report.py) and writes the finalized submission workbook into its
+# own folder. Chapters are run in a pool of processes, so a
+# regional batch takes about (chapters / cores) times as long as a single chapter.
+#
+# The jobs file is a list of objects like:
+#   {"name": "Alpha", "spreadsheet": "<id from the sheet's URL>", "roster": "Alpha/Roster.csv",
+#    "template": "Configuration/BaseTemplate.xlsx"}
+# with "backup": "<path to a backup csv>" in place of "spreadsheet" to skip the pull, an optional "range"
+# (defaults to A:F, the form's timestamp and answers), and optional "from" and "to" days (e.g. "2021-01-01") to limit
+# the report and the submission to the responses submitted in that period. Relative paths are relative to the jobs
+# file.
+#
+# Run with: python batch.py jobs.json [--out Batch] [--workers N] [--diagnostics LOG] [--profile DIR]
+# --diagnostics appends the time spent in every stage of every chapter to a json-lines log (the same records the
+# Diagnostics window shows), and --profile also saves a cProfile capture of each chapter into DIR.
+# Pulls use the login saved by Voluntracker (Configuration/token.pickle), so log in from Voluntracker once first.
+
+DEFAULT_RANGE = 'A:F'
+DEFAULT_OUTPUT = 'Batch'
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+PICKLE_PATH = os.path.join('Configuration', 'token.pickle')
+CREDS_PATH = os.path.join('Configuration', 'credentials.json')
+DISCOVERY_PATH = os.path.join('Configuration', 'sheets_discovery.json')
+
+# Each worker process logs in once and reuses the session for every chapter it runs. Workers only read the saved
+# login: it's refreshed once by refresh_login before they start, so they never rewrite the token file at the same time
+session = None
+
+
+def get_session():
+    global session
+
+    if session is None:
+        session = sheets.SheetsSession(PICKLE_PATH, CREDS_PATH, SCOPES, DISCOVERY_PATH, interactive=False, save=False)
+    return session
+
+
+# Refreshes the saved login (if it's expired or about to) and saves it, in this process, before any worker starts
+def refresh_login():
+    sheets.SheetsSession(PICKLE_PATH, CREDS_PATH, SCOPES, DISCOVERY_PATH, interactive=False).credentials()
+
+
+# Reads the jobs file, checking every job has what it needs before anything is run
+def load_jobs(path):
+    with open(path, 'r', encoding='utf-8') as jobsfile:
+        jobs = json.load(jobsfile)
+    base = os.path.dirname(os.path.abspath(path))
+
+    names = set()
+    for job in jobs:
+        if not job.get('name'):
+            raise ValueError('Every job needs a "name"')
+        if job['name'] in names:
+            raise ValueError('Two jobs are named ' + job['name'])
+        names.add(job['name'])
+        if bool(job.get('spreadsheet')) == bool(job.get('backup')):
+            raise ValueError(job['name'] + ': give either a "spreadsheet" or a "backup", not both')
+        if not job.get('template'):
+            raise ValueError(job['name'] + ': no "template" given')
+        job['period'] = events.parse_period(job.get('from', ''), job.get('to', ''))
+        for key in ('backup', 'roster', 'template'):
+            if job.get(key):
+                job[key] = os.path.join(base, job[key])
+    return jobs
+
+
+# Runs one chapter. Called in a worker process; returns a summary dict for the report
+def run_job(job, output_dir):
+    with diagnostics.stage('chapter', chapter=job['name']):
+        return _run_job(job, output_dir)
+
+
+def _run_job(job, output_dir):
+    start = time.perf_counter()
+    chapter_dir = os.path.join(output_dir, job['name'])
+    chart_dir = os.path.join(chapter_dir, 'Charts')
+
+    if job.get('spreadsheet'):
+        service = get_session().service()
+        range_name = job.get('range', DEFAULT_RANGE)
+        table = events.EventTable()
+        for chunk in sheets.stream_values(service, job['spreadsheet'], range_name, http=get_session().http):
+            table.extend(map(events.timestamp_last, chunk) if sheets.has_timestamp(range_name) else chunk)
+        backups.BackupCatalog(os.path.join(chapter_dir, 'Backups')).write_backup(table.iter_rows(),
+                                                                                 table.time_span())
+    else:
+        table = events.load_backup(job['backup'])
+    period_start, period_end = job.get('period', (None, None))
+    if period_start is not None or period_end is not None:
+        table = table.between(period_start, period_end)
+
+    members = roster.load_names(job['roster']) if job.get('roster') else None
+    results = metrics.compute_metrics(table, members)
+    # Chapters already run in parallel, so each chapter draws its own charts
+    report.export_report(results, chart_dir, workers=1)
+
+    members = submission.write_submission(table, job['template'],
+                                          os.path.join(chapter_dir, 'FINALIZED_SUBMISSION.xlsx'))
+    return {'name': job['name'], 'events': len(table), 'members': members, 'inactive': len(results['inactive']),
+            'average': results['average'], 'seconds': time.perf_counter() - start}
+
+
+# Runs every job on a pool of `workers` processes (one per core by default). Returns (summaries, failures), where
+# failures maps a job's name to its error message; one chapter failing doesn't stop the others. With a log path,
+# every worker records its stage timings there (and with profile_dir, a cProfile capture of each chapter). A line
+# about each chapter is passed to echo as it finishes
+def run_batch(jobs, output_dir, workers=None, echo=print, log=None, profile_dir=None):
+    summaries = []
+    failures = {}
+    setup = {}
+    if log or profile_dir:
+        setup = {'initializer': diagnostics.configure, 'initargs': (True, log, profile_dir)}
+    if any(job.get('spreadsheet') for job in jobs):
+        refresh_login()
+    with ProcessPoolExecutor(max_workers=workers, **setup) as pool:
+        futures = {pool.submit(run_job, job, output_dir): job['name'] for job in jobs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                summary = future.result()
+            except Exception as error:
+                failures[name] = type(error).__name__ + ': ' + str(error)
+                echo(name + ': FAILED -- ' + failures[name])
+            else:
+                summaries.append(summary)
+                echo(name + ': ' + str(summary['events']) + ' events, ' + str(summary['members']) +
+                       ' members, ' + str(summary['inactive']) + ' inactive (' +
+                       format(summary['seconds'], '.1f') + ' s)')
+    return summaries, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run pulls, metrics and submissions for many chapters at once.')
+    parser.add_argument('jobs', help='json file listing the chapters to run')
+    parser.add_argument('--out', default=DEFAULT_OUTPUT, help='folder to write each chapter\'s results into')
+    parser.add_argument('--workers', type=int, default=None, help='processes to use (default: one per core)')
+    parser.add_argument('--diagnostics', metavar='LOG', help='json-lines file to log stage timings to')
+    parser.add_argument('--profile', metavar='DIR', help='folder to save a cProfile capture of each chapter in')
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.jobs)
+    except (OSError, ValueError) as error:
+        print('Could not read ' + args.jobs + ': ' + str(error), file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    try:
+        summaries, failures = run_batch(jobs, args.out, args.workers, log=args.diagnostics, profile_dir=args.profile)
+    except (sheets.LoginRequired, RefreshError) as error:
+        print('Could not log in to Google Sheets: ' + str(error), file=sys.stderr)
+        return 2
+    print(str(len(summaries)) + ' of ' + str(len(jobs)) + ' chapters done in ' +
+          format(time.perf_counter() - start, '.1f') + ' s, results in ' + os.path.abspath(args.out))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    # Lets a frozen build's worker processes run their chapters instead of starting another batch
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import csv
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+from generate_responses import write_responses
+
+
+# Compares the memory held by a loaded backup in the old representation (a list of lists of strings, as the global
+# `values` used to be) against an events.EventTable.
+# Run with: python benchmarks/bench_events_memory.py [rows ...]
+
+SIZES = [10000, 100000, 1000000]
+
+
+# Returns (result, bytes still allocated by load() once it returns)
+def measure(load):
+    tracemalloc.start()
+    result = load()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+
+def load_lists(path):
+    with open(path, 'r', encoding='utf-8', newline='\n') as backupfile:
+        return list(csv.reader(backupfile))
+
+
+def main(sizes):
+    print('{:>10} {:>16} {:>16} {:>8}'.format('rows', 'lists (B/event)', 'table (B/event)', 'ratio'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, 'hours_backup.csv')
+            write_responses(path, rows, members=2000, venues=50)
+
+            lists, list_bytes = measure(lambda: load_lists(path))
+            del lists
+            table, table_bytes = measure(lambda: events.load_backup(path))
+            del table
+
+            print('{:>10} {:>16.1f} {:>16.1f} {:>7.1f}x'.format(
+                rows, list_bytes / rows, table_bytes / rows, list_bytes / table_bytes))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+import sheets
+from generate_responses import write_responses
+from fake_sheets import FakeSheetsServer, serve_csv
+
+
+# Compares pulling a whole sheet with one values().get against sheets.stream_values, one window at a time and with
+# parallel windows, against the local fake Sheets server (run in its own process so its memory isn't counted).
+# Reports wall time and the peak memory held by the client while pulling.
+# Run with: python benchmarks/bench_fetch.py [rows ...]
+
+SIZES = [10000, 100000]
+
+# Simulated round trip per request, and extra server time per row returned, in seconds
+LATENCY = 0.05
+ROW_COST = 0.00002
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port):
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+# Runs pull() and returns (seconds, peak bytes, rows pulled)
+def measure(pull):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = pull()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, rows
+
+
+def main(sizes):
+    local = threading.local()
+
+    def http():
+        if not hasattr(local, 'http'):
+            local.http = httplib2.Http(timeout=sheets.HTTP_TIMEOUT)
+        return local.http
+
+    print('{:>10} {:>22} {:>10} {:>14}'.format('rows', 'mode', 'time (s)', 'peak (MB)'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, 'sheet.csv')
+            write_responses(path, size, members=2000, venues=50)
+            port = free_port()
+            process = multiprocessing.Process(target=serve_csv, args=(path, port, LATENCY, ROW_COST), daemon=True)
+            process.start()
+            wait_for(port)
+
+            document = FakeSheetsServer([], port=0).discovery_document()
+            document['rootUrl'] = document['baseUrl'] = 'http://127.0.0.1:' + str(port) + '/'
+            service = build_from_document(document, http=http())
+
+            # Each mode just counts the rows it sees, the way a streaming writer would consume them
+            def single():
+                return len(sheets.fetch_values(service, 'sheet', 'B:F'))
+
+            def streamed(workers):
+                return lambda: sum(len(chunk) for chunk in sheets.stream_values(
+                    service, 'sheet', 'B:F', workers=workers, http=http if workers > 1 else None))
+
+            for mode, pull in (('single get', single), ('stream, 1 worker', streamed(1)),
+                               ('stream, ' + str(sheets.FETCH_WORKERS) + ' workers', streamed(sheets.FETCH_WORKERS))):
+                elapsed, peak, rows = measure(pull)
+                assert rows == size + 1, (mode, rows)
+                print('{:>10} {:>22} {:>10.3f} {:>14.1f}'.format(size, mode, elapsed, peak / 1e6))
+
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
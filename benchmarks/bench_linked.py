@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+import Voluntracker
+from generate_responses import generate_rows
+from fake_sheets import FakeSheetsServer
+from bench_watch import FakeSession, FakeJob
+from bench_fetch import free_port, wait_for
+
+
+# Pulls several linked sheets of different sizes through Voluntracker.fetch_sheet against the local fake Sheets
+# server (run in its own process, like a real server it doesn't compete with the client for the GIL), once with every
+# sheet at the same time (SHEET_WORKERS) and once one after another, next to pulling only the biggest sheet. Full
+# pulls are used (DELTA_PULLS off) so every run downloads everything.
+# Run with: python benchmarks/bench_linked.py [rows of the biggest sheet]
+
+ROWS = 50000
+# Each sheet's size as a share of the biggest one
+SHARES = [1.0, 0.6, 0.3, 0.1]
+
+# Simulated round trip per request, and extra server time per row returned, in seconds
+LATENCY = 0.05
+ROW_COST = 0.00002
+
+
+def serve(sizes, port):
+    spreadsheets = {'sheet' + str(i): list(generate_rows(size, seed=i)) for i, size in enumerate(sizes)}
+    FakeSheetsServer(spreadsheets, port, LATENCY, ROW_COST).serve_forever()
+
+
+def main(rows):
+    sizes = [max(1, int(rows * share)) for share in SHARES]
+    port = free_port()
+    process = multiprocessing.Process(target=serve, args=(sizes, port), daemon=True)
+    process.start()
+    wait_for(port)
+
+    document = FakeSheetsServer([], port=0).discovery_document()
+    document['rootUrl'] = document['baseUrl'] = 'http://127.0.0.1:' + str(port) + '/'
+    service = build_from_document(document, http=httplib2.Http())
+
+    Voluntracker.DELTA_PULLS = False
+    Voluntracker.session = FakeSession(service)
+
+    def pull(names, workers):
+        Voluntracker.SpreadURL = '\n'.join(name + ' B:F ' + name for name in names)
+        Voluntracker.SHEET_WORKERS = workers
+        start = time.perf_counter()
+        table = Voluntracker.fetch_sheet(FakeJob())
+        return table, time.perf_counter() - start
+
+    print('{:>34} {:>10} {:>9}'.format('pull', 'responses', 'time (s)'))
+    with tempfile.TemporaryDirectory() as tmp:
+        Voluntracker.DELTA_PATH = tmp
+        names = ['sheet' + str(i) for i in range(len(sizes))]
+        for label, pulled_names, workers in (('biggest sheet alone', names[:1], 1),
+                                             (str(len(names)) + ' sheets, one after another', names, 1),
+                                             (str(len(names)) + ' sheets at once', names, len(names))):
+            table, seconds = pull(pulled_names, workers)
+            assert len(table) == sum(sizes[names.index(name)] for name in pulled_names)
+            print('{:>34} {:>10} {:>9.3f}'.format(label, len(table), seconds))
+
+    process.terminate()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
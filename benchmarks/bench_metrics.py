@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+import metrics
+from generate_responses import member_names, write_responses
+
+
+# Benchmarks the metrics engine against synthetic backup files of increasing size, to show that loading and
+# aggregating a backup scales linearly with the number of form responses.
+# Run with: python benchmarks/bench_metrics.py [rows ...]
+
+SIZES = [10000, 100000, 1000000]
+
+
+def main(sizes):
+    roster = member_names(2500)
+    print('{:>10} {:>10} {:>10} {:>14} {:>10}'.format('rows', 'load (s)', 'agg (s)', 'rows/s', 'ns/row'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, 'hours_backup.csv')
+            write_responses(path, rows, members=2000, venues=50)
+
+            start = time.perf_counter()
+            data = events.load_backup(path)
+            loaded = time.perf_counter()
+            metrics.compute_metrics(data, roster)
+            done = time.perf_counter()
+
+            total = done - start
+            print('{:>10} {:>10.3f} {:>10.3f} {:>14,.0f} {:>10.0f}'.format(
+                rows, loaded - start, done - loaded, rows / total, total / rows * 1e9))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
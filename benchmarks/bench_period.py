@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import events
+import aggregates
+from generate_responses import write_responses
+
+
+# Times working out the metrics for one period of a backup: building the time index (once per loaded backup), then
+# picking out the period with it, against parsing every response's timestamp and keeping the ones inside the period.
+# Run with: python benchmarks/bench_period.py [rows]
+
+ROWS = 200000
+
+# (label, first day, last day) of the periods to pick out. The generated responses cover 2020
+PERIODS = [('one day', '2020-03-02', '2020-03-02'), ('one month', '2020-03-01', '2020-03-31'),
+           ('spring semester', '2020-01-01', '2020-07-31'), ('whole year', '2020-01-01', '2020-12-31')]
+
+
+def scan(table, start, end):
+    keep = []
+    for i in range(len(table)):
+        moment = events.parse_timestamp(table.cell(i, events.TIMESTAMP_COL))
+        if moment is not None and start <= moment < end:
+            keep.append(i)
+    return table.take(keep)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'responses.csv')
+        write_responses(path, rows, members=2000, venues=50)
+        table = events.load_backup(path)
+
+    index, seconds = timed(table.time_index)
+    print('time index for ' + str(rows) + ' responses built in ' + format(seconds, '.3f') + ' s (in order: ' +
+          str(index.in_order) + ')')
+
+    print('{:>16} {:>9} {:>12} {:>12}'.format('period', 'events', 'index (s)', 'scan (s)'))
+    for label, first, last in PERIODS:
+        start, end = events.parse_period(first, last)
+        indexed, index_seconds = timed(lambda: aggregates.Aggregate.from_table(table.between(start, end)))
+        scanned, scan_seconds = timed(lambda: aggregates.Aggregate.from_table(scan(table, start, end)))
+        assert indexed.events == scanned.events
+        print('{:>16} {:>9} {:>12.4f} {:>12.4f}'.format(label, indexed.events, index_seconds, scan_seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
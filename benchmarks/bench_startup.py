@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Measures how long Voluntracker takes to start: importing Voluntracker.py, opening the main window, and opening each
+# of the other windows for the first time (when they import whatever they need and build their widgets) and a second
+# time (when the hidden window is shown again with new data). Every run is a fresh Python process, so the numbers are
+# cold starts like a user double-clicking the exe. Needs a display.
+# Run with: python benchmarks/bench_startup.py [runs]
+
+RUNS = 5
+
+# Size of the backup the metrics, submission and backup windows are opened with
+BACKUP_ROWS = 10000
+
+
+# Runs inside the child process, from a scratch folder with a copy of Configuration. Prints the timings as json
+def child():
+    from generate_responses import write_responses
+
+    timings = {}
+    start = time.perf_counter()
+    import Voluntracker
+    timings['import'] = time.perf_counter() - start
+
+    Voluntracker.BACKUP_PATH = 'Backups'
+    Voluntracker.DELTA_PATH = os.path.join('Backups', 'Delta')
+    Voluntracker.CHART_CACHE_PATH = os.path.join('Backups', 'Charts')
+    Voluntracker.ROSTER_PATH = os.path.join('Configuration', 'Roster.csv')
+    Voluntracker.ROSTER_JOURNAL_PATH = os.path.join('Configuration', 'Roster.journal')
+    Voluntracker.LOGO_PATH = os.path.join('Configuration', 'DSP_logo.png')
+    Voluntracker.TEMPLATE_URL = os.path.join('Configuration', 'BaseTemplate.xlsx')
+    Voluntracker.SpreadURL = 'benchmark'
+
+    os.makedirs('Backups')
+    backup = os.path.join('Backups', 'hours_backup.csv')
+    write_responses(backup, BACKUP_ROWS, members=2000, venues=50)
+
+    # Each step is timed until its window is drawn. The pull and the backup picker are replaced so the benchmark
+    # never touches the network or waits on a dialog
+    Voluntracker.select_backup = lambda title, with_period=False: backup
+    Voluntracker.fetch_sheet = lambda job: Voluntracker.events.load_backup(backup)
+
+    start = time.perf_counter()
+    mainwindow = Voluntracker.MainWindow()
+    mainwindow.update()
+    timings['main window'] = time.perf_counter() - start
+
+    for name, opener in (('roster', Voluntracker.create_roster_window),
+                         ('backup', Voluntracker.create_backup_window),
+                         ('metrics', Voluntracker.create_metrics_window),
+                         ('submission', Voluntracker.create_submission_window)):
+        for attempt in ('first', 'again'):
+            start = time.perf_counter()
+            opener()
+            mainwindow.update()
+            timings[name + ' (' + attempt + ')'] = time.perf_counter() - start
+
+    print(json.dumps(timings))
+
+
+def main(runs):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, 'Configuration'), os.path.join(tmp, 'Configuration'))
+        for _ in range(runs):
+            for path in ('Backups', os.path.join('Configuration', 'Roster.csv'),
+                         os.path.join('Configuration', 'Roster.journal')):
+                path = os.path.join(tmp, path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=tmp,
+                                    env=dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.path.dirname(
+                                        os.path.abspath(__file__))),
+                                    capture_output=True, text=True)
+            if output.returncode != 0:
+                sys.exit('The startup run failed (is there a display?):\n' + output.stderr)
+            for name, seconds in json.loads(output.stdout.splitlines()[-1]).items():
+                results.setdefault(name, []).append(seconds)
+
+    print('{:>22} {:>12} {:>12}'.format('step', 'median (ms)', 'max (ms)'))
+    for name, seconds in results.items():
+        print('{:>22} {:>12.1f} {:>12.1f}'.format(name, statistics.median(seconds) * 1000, max(seconds) * 1000))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        child()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
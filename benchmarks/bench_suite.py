@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import events
+import metrics
+import charts
+import submission
+import backups
+from generate_responses import member_names, write_responses
+
+
+# Runs the main code paths end to end on synthetic form responses of increasing size, without opening any windows:
+# writing a backup (what pull_backup does), loading it, aggregating the metrics, matching them against the roster,
+# rendering every chart, and writing the submission workbook (what create_submission_window does). For each step it
+# reports wall time, throughput in responses per second, and the peak memory the step allocated. Timing and memory
+# are measured in separate runs, since tracing every allocation slows the code down.
+# Run with: python benchmarks/bench_suite.py [rows ...]
+
+SIZES = [1000, 100000, 1000000]
+
+MEMBERS = 2000
+VENUES = 50
+
+# Extra roster members who never log any hours, as a share of MEMBERS
+INACTIVE_SHARE = 0.2
+
+TEMPLATE_PATH = os.path.join(ROOT, 'Configuration', 'BaseTemplate.xlsx')
+
+
+# The steps to time, as (name, function). Each function takes the scratch folder and the state built up by the
+# steps before it, and may add to the state
+def steps():
+    def write_backup(tmp, state):
+        catalog = backups.BackupCatalog(os.path.join(tmp, 'Backups'))
+        state['backup'] = catalog.path_of(catalog.write_backup(state['source'].iter_rows()))
+
+    def load_backup(tmp, state):
+        state['table'] = events.load_backup(state['backup'])
+
+    def compute_metrics(tmp, state):
+        metrics.compute_metrics(state['table'])
+
+    def match_roster(tmp, state):
+        state['results'] = metrics.compute_metrics(state['table'], state['roster'])
+
+    def render_charts(tmp, state):
+        for mode in charts.CHART_MODES:
+            charts.save_chart(state['results'], mode, os.path.join(tmp, mode + '.png'))
+
+    def write_submission(tmp, state):
+        # Starts from an unparsed template each time, like the first submission after opening Voluntracker
+        submission.templates.clear()
+        submission.write_submission(state['table'], TEMPLATE_PATH, os.path.join(tmp, 'FINALIZED_SUBMISSION.xlsx'))
+
+    return [('backup write', write_backup), ('backup load', load_backup), ('metrics', compute_metrics),
+            ('roster matching', match_roster), ('charts', render_charts), ('submission', write_submission)]
+
+
+# Runs every step in order on a fresh copy of the state. With trace=True, returns each step's peak allocated bytes
+# instead of its time
+def run(tmp, source, roster, trace=False):
+    state = {'source': source, 'roster': roster}
+    measured = {}
+    for name, step in steps():
+        if trace:
+            tracemalloc.start()
+            step(tmp, state)
+            measured[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            step(tmp, state)
+            measured[name] = time.perf_counter() - start
+    return measured
+
+
+def main(sizes):
+    roster = member_names(int(MEMBERS * (1 + INACTIVE_SHARE)))
+    print('{:>10} {:>16} {:>10} {:>14} {:>11}'.format('rows', 'step', 'time (s)', 'rows/s', 'peak (MB)'))
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'responses.csv')
+            write_responses(path, rows, members=MEMBERS, venues=VENUES)
+            source = events.load_backup(path)
+            os.remove(path)
+
+            with tempfile.TemporaryDirectory() as scratch:
+                seconds = run(scratch, source, roster)
+            with tempfile.TemporaryDirectory() as scratch:
+                peaks = run(scratch, source, roster, trace=True)
+
+            for name, _ in steps():
+                print('{:>10} {:>16} {:>10.3f} {:>14,.0f} {:>11.1f}'.format(
+                    rows, name, seconds[name], rows / seconds[name], peaks[name] / 1e6))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
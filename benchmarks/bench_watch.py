@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+import sheets
+import Voluntracker
+from generate_responses import generate_rows
+from fake_sheets import FakeSheetsServer
+
+
+# Runs watch mode's check (Voluntracker.check_sheet) against the local fake Sheets server, without opening any
+# windows, and reports what each check costs in requests, response bytes and time: an idle check when nothing has
+# changed, a check after new responses come in (which pulls only the new rows), and for comparison a full pull of
+# the sheet, which is what every click on Pull Backups used to cost.
+# Run with: python benchmarks/bench_watch.py [rows]
+
+ROWS = 100000
+NEW_ROWS = 25
+
+
+# Stands in for sheets.SheetsSession, with no login. Like the real one, each thread gets its own transport
+class FakeSession:
+    def __init__(self, service):
+        self._service = service
+        self.local = threading.local()
+
+    def service(self):
+        return self._service
+
+    def http(self):
+        if not hasattr(self.local, 'http'):
+            self.local.http = httplib2.Http(timeout=sheets.HTTP_TIMEOUT)
+        return self.local.http
+
+
+class FakeJob:
+    def progress(self, message):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+# Runs check() and returns (its result, requests, response bytes, seconds)
+def measure(server, check):
+    requests, sent = server.requests, server.bytes_sent
+    start = time.perf_counter()
+    result = check()
+    return result, server.requests - requests, server.bytes_sent - sent, time.perf_counter() - start
+
+
+def main(rows):
+    server = FakeSheetsServer(list(generate_rows(rows, members=2000, venues=50))).start()
+    service = build_from_document(server.discovery_document(), http=httplib2.Http())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Voluntracker.DELTA_PATH = os.path.join(tmp, 'Delta')
+        Voluntracker.SpreadURL = 'watched B:F'
+        Voluntracker.session = FakeSession(service)
+
+        def check():
+            return Voluntracker.check_sheet(FakeJob())
+
+        print('{:>32} {:>9} {:>12} {:>9}'.format('check', 'requests', 'bytes', 'time (s)'))
+
+        def report(name, measured):
+            print('{:>32} {:>9} {:>12,} {:>9.3f}'.format(name, *measured[1:]))
+
+        # The first check after startup has nothing to go by, so it pulls
+        result, *measured = measure(server, check)
+        assert result is not None and len(result[0]) == rows
+        report('first check (pulls)', (result, *measured))
+
+        measured = measure(server, check)
+        assert measured[0] is None
+        report('idle check', measured)
+
+        server.rows.extend(list(generate_rows(NEW_ROWS, seed=1))[1:])
+        measured = measure(server, check)
+        assert measured[0] is not None and len(measured[0][0]) == rows + NEW_ROWS
+        report('check after ' + str(NEW_ROWS) + ' new responses', measured)
+
+        measured = measure(server, check)
+        assert measured[0] is None
+        report('idle check', measured)
+
+        measured = measure(server, lambda: sum(len(chunk) for chunk in sheets.stream_values(service, 'watched', 'B:F')))
+        report('full pull, for comparison', measured)
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
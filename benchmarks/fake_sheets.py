@@ -0,0 +1,145 @@
+import csv
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# A local stand-in for the Google Sheets API, for benchmarking (and poking at) the fetch code without a network or a
+# Google account. It serves a minimal discovery document plus spreadsheets.values.get over rows held in memory, so a
+# real googleapiclient service can be built against it with sheets.SheetsSession-style code:
+#
+#     server = FakeSheetsServer(rows).start()
+#     service = build_from_document(server.discovery_document(), http=httplib2.Http())
+#
+# Run it on its own with: python benchmarks/fake_sheets.py backup.csv [port]
+
+CELL_PATTERN = re.compile(r'^[A-Za-z]*(\d*)$')
+
+
+# Turns the row part of an A1 range ('B57:F5056', 'B:F', 'Sheet1!B2:F') into a 0-based slice of the sheet's rows
+def parse_rows(range_name, total):
+    cells = range_name.rpartition('!')[2]
+    start, _, end = cells.partition(':')
+    first = CELL_PATTERN.match(start).group(1)
+    last = CELL_PATTERN.match(end or start).group(1)
+    return (int(first) - 1 if first else 0), (int(last) if last else total)
+
+
+class FakeSheetsServer:
+    # rows is either the rows of one sheet, served whatever spreadsheet id is asked for, or {spreadsheet id: rows} to
+    # serve several. latency is how long (in seconds) every request takes before it's answered, to mimic a real network round trip,
+    # and row_cost is how much longer it takes per row returned, since the real API slows down with response size
+    def __init__(self, rows, port=0, latency=0.0, row_cost=0.0):
+        self.rows = rows
+        self.latency = latency
+        self.row_cost = row_cost
+        self.requests = 0
+        # Response bytes sent, to compare what different pulls cost in bandwidth
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:' + str(self.httpd.server_address[1]) + '/'
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Just enough of the real Sheets v4 discovery document for build_from_document to create spreadsheets.values.get
+    def discovery_document(self):
+        return {
+            'kind': 'discovery#restDescription',
+            'discoveryVersion': 'v1',
+            'id': 'sheets:v4',
+            'name': 'sheets',
+            'version': 'v4',
+            'rootUrl': self.url,
+            'servicePath': '',
+            'baseUrl': self.url,
+            'batchPath': 'batch',
+            'parameters': {},
+            'schemas': {'ValueRange': {'id': 'ValueRange', 'type': 'object', 'properties': {
+                'range': {'type': 'string'},
+                'majorDimension': {'type': 'string'},
+                'values': {'type': 'array', 'items': {'type': 'array', 'items': {'type': 'any'}}},
+            }}},
+            'resources': {'spreadsheets': {'resources': {'values': {'methods': {'get': {
+                'id': 'sheets.spreadsheets.values.get',
+                'path': 'v4/spreadsheets/{spreadsheetId}/values/{range}',
+                'httpMethod': 'GET',
+                'parameters': {
+                    'spreadsheetId': {'type': 'string', 'required': True, 'location': 'path'},
+                    'range': {'type': 'string', 'required': True, 'location': 'path'},
+                },
+                'parameterOrder': ['spreadsheetId', 'range'],
+                'response': {'$ref': 'ValueRange'},
+            }}}}}},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+
+                parts = urllib.parse.urlparse(self.path).path.strip('/').split('/')
+                if len(parts) != 5 or parts[:2] != ['v4', 'spreadsheets'] or parts[3] != 'values':
+                    self.send_error(404)
+                    return
+
+                sheet = server.rows
+                if isinstance(sheet, dict):
+                    sheet = sheet.get(urllib.parse.unquote(parts[2]))
+                    if sheet is None:
+                        self.send_error(404)
+                        return
+                range_name = urllib.parse.unquote(parts[4])
+                first, last = parse_rows(range_name, len(sheet))
+                rows = sheet[first:last]
+                body = {'range': range_name, 'majorDimension': 'ROWS'}
+                if rows:
+                    body['values'] = rows
+                if server.latency or server.row_cost:
+                    time.sleep(server.latency + server.row_cost * len(rows))
+                self._send(body)
+
+            def _send(self, body):
+                content = json.dumps(body).encode('utf-8')
+                with server.lock:
+                    server.bytes_sent += len(content)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# Serves the rows of a backup csv, for running the fake server in its own process
+def serve_csv(path, port, latency=0.0, row_cost=0.0):
+    with open(path, 'r', encoding='utf-8', newline='\n') as csvfile:
+        rows = list(csv.reader(csvfile))
+    FakeSheetsServer(rows, port, latency, row_cost).serve_forever()
+
+
+if __name__ == '__main__':
+    import sys
+    server_port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    print('Serving ' + sys.argv[1] + ' on http://127.0.0.1:' + str(server_port) + '/')
+    serve_csv(sys.argv[1], server_port)
@@ -0,0 +1,128 @@
+import argparse
+import csv
+import datetime
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import HEADER_NAME
+
+
+# Generates synthetic Google Forms responses in the layout Voluntracker backs them up in (name, date, venue, hours,
+# description from B:F, then the submission timestamp from column A), for benchmarks and for trying the app out
+# without a real sheet. The data is shaped like a real
+# chapter's: a few members log most of the events, a few venues get most of the visits, hours are mostly whole or
+# half hours, and a small share of the hours answers are blank or typed out in words.
+# Run with: python benchmarks/generate_responses.py out.csv [--rows N] [--members N] [--events-per-member N]
+#                                                         [--venues N] [--seed N]
+
+FORM_HEADER = [HEADER_NAME, 'What day did you volunteer?', 'Where did you volunteer?',
+               'How many hours did you volunteer?', 'Describe what you did', 'Timestamp']
+
+FIRST_NAMES = ['Alex', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Reese', 'Drew',
+               'Parker', 'Skyler', 'Rowan', 'Emerson', 'Hayden', 'Kendall', 'Logan', 'Peyton', 'Sawyer', 'Cameron',
+               'Dakota', 'Elliot', 'Finley', 'Harper', 'Jesse', 'Kai', 'Lane', 'Micah', 'Noel']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Moore', 'Jackson', 'Martin', 'Lee',
+              'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker']
+VENUE_KINDS = ['Food Bank', 'Animal Shelter', 'Library', 'Community Garden', 'Elementary School', 'Hospital',
+               'Habitat Build', 'Senior Center', 'Park Cleanup', 'Blood Drive']
+TASKS = ['Sorted donations', 'Served meals', 'Tutored students', 'Walked dogs', 'Planted trees', 'Picked up litter',
+         'Helped with check-in', 'Painted walls', 'Stocked shelves', 'Read to kids', '']
+
+# Share of hours answers that are left blank or written out instead of as a number
+MESSY_HOURS = 0.01
+
+
+# count distinct, realistic-looking member names. Once every first/last pair is used, numbers are added
+def member_names(count, seed=0):
+    pairs = [first + ' ' + last for first, last in itertools.product(FIRST_NAMES, LAST_NAMES)]
+    random.Random(seed).shuffle(pairs)
+    names = pairs[:count]
+    for i in range(len(names), count):
+        names.append(pairs[i % len(pairs)] + ' ' + str(i // len(pairs) + 1))
+    return names
+
+
+def venue_names(count):
+    return [VENUE_KINDS[i % len(VENUE_KINDS)] + ' #' + str(i // len(VENUE_KINDS) + 1) for i in range(count)]
+
+
+# Yields the header and then rows of responses. rows defaults to members * events_per_member, which is then the
+# average number of events per member. Responses are submitted in order over the days from start, each within a week
+# after the day volunteered
+def generate_rows(rows=None, members=200, events_per_member=10, venues=30, seed=0,
+                  start=datetime.date(2020, 1, 1), days=365):
+    if rows is None:
+        rows = members * events_per_member
+    rng = random.Random(seed)
+    names = member_names(members, seed)
+    places = venue_names(venues)
+
+    # How active each member is, and how popular each venue is
+    activity = list(itertools.accumulate(rng.paretovariate(1.5) for _ in names))
+    popularity = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(places))))
+
+    yield list(FORM_HEADER)
+    # Drawn in blocks, so a million rows don't have to be held in memory at once
+    block = 10000
+    for first in range(0, rows, block):
+        count = min(block, rows - first)
+        who = rng.choices(names, cum_weights=activity, k=count)
+        where = rng.choices(places, cum_weights=popularity, k=count)
+        for i, (name, place) in enumerate(zip(who, where), first):
+            submitted = datetime.datetime.combine(start, datetime.time()) + datetime.timedelta(
+                seconds=int(i * days * 86400 / rows))
+            day = max(start, submitted.date() - datetime.timedelta(days=rng.randrange(7)))
+            yield [name, str(day.month) + '/' + str(day.day) + '/' + str(day.year), place, _hours(rng),
+                   rng.choice(TASKS), str(submitted.month) + '/' + str(submitted.day) + '/' + str(submitted.year) +
+                   ' ' + str(submitted.hour) + submitted.strftime(':%M:%S')]
+
+
+def _hours(rng):
+    if rng.random() < MESSY_HOURS:
+        return rng.choice(['', 'two', 'n/a'])
+    hours = rng.choice([1, 1, 2, 2, 2, 3, 3, 4, 5, 8]) + rng.choice([0, 0, 0, 0.5])
+    return str(int(hours)) if hours == int(hours) else str(hours)
+
+
+# Writes generate_rows(...) to a csv at path, the way pull_backup writes a backup. Returns the number of responses
+def write_responses(path, rows=None, members=200, events_per_member=10, venues=30, seed=0):
+    count = -1
+    with open(path, 'w', newline='\n', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        for count, row in enumerate(generate_rows(rows, members, events_per_member, venues, seed)):
+            writer.writerow(row)
+    return count
+
+
+# Writes a roster of the generated members (plus `inactive` extra members who never log anything), one per line
+def write_roster(path, members=200, inactive=0, seed=0):
+    with open(path, 'w', newline='\n', encoding='utf-8') as rosterfile:
+        writer = csv.writer(rosterfile)
+        for name in member_names(members + inactive, seed):
+            writer.writerow([name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic Google Forms volunteer responses to a csv.')
+    parser.add_argument('path', help='csv file to write')
+    parser.add_argument('--rows', type=int, default=None, help='responses to write (default: members x events)')
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--events-per-member', type=int, default=10)
+    parser.add_argument('--venues', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--roster', help='also write a roster of the members to this csv')
+    args = parser.parse_args(argv)
+
+    count = write_responses(args.path, args.rows, args.members, args.events_per_member, args.venues, args.seed)
+    if args.roster:
+        write_roster(args.roster, args.members, seed=args.seed)
+    print('Wrote ' + str(count) + ' responses to ' + args.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import numpy
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import metrics
+import diagnostics
+
+
+# Chart rendering for the metrics window. Every chart draws a fixed number of bars no matter how big the roster is,
+# and rendered charts are saved as PNGs keyed by the backup's content, the roster and the chart settings, so opening
+# the metrics for a backup that hasn't changed just loads an image.
+
+# The charts that can be drawn, and the names shown for them in the metrics window
+CHART_MODES = {
+    'top': 'Top performers',
+    'bottom': 'Bottom performers',
+    'venues': 'Most popular venues',
+    'distribution': 'Hours distribution',
+    'members': 'Every member',
+}
+
+# How many bars the hours distribution is split into
+DEFAULT_BINS = 10
+
+# Bar labels are left off once there are more bars than this, since they'd just overlap
+MAX_LABELS = 40
+
+# Bump this whenever the way charts look changes, so old cached images aren't reused
+CACHE_VERSION = '2'
+
+# How many rendered charts to keep in the cache before the oldest are deleted
+CACHE_LIMIT = 200
+
+
+# Draws one chart from the results of metrics.compute_metrics into a new matplotlib Figure
+def render_chart(results, mode, n=metrics.TOP_N, bins=DEFAULT_BINS, size=(8, 5), dpi=100):
+    figure = Figure(figsize=size, dpi=dpi)
+    axes = figure.add_subplot(111)
+
+    if mode == 'top':
+        _bars(axes, results['top'][:n], 'Hours')
+        axes.axhline(results['average'], color='gray', linestyle='--', label='Organization average')
+        axes.legend()
+        axes.set_title('Top ' + str(n) + ' performers')
+    elif mode == 'bottom':
+        _bars(axes, results['bottom'][:n], 'Hours')
+        axes.axhline(results['average'], color='gray', linestyle='--', label='Organization average')
+        axes.legend()
+        axes.set_title('Bottom ' + str(n) + ' performers')
+    elif mode == 'venues':
+        _bars(axes, results['venues'][:n], 'Events')
+        axes.set_title(str(n) + ' most popular venues')
+    elif mode == 'distribution':
+        hours = [member[1] for member in results['members']]
+        counts, edges = numpy.histogram(hours, bins=bins) if hours else (numpy.zeros(bins), numpy.arange(bins + 1))
+        axes.bar(edges[:-1], counts, width=numpy.diff(edges), align='edge', edgecolor='white')
+        axes.axvline(results['average'], color='gray', linestyle='--', label='Organization average')
+        axes.legend()
+        axes.set_xlabel('Hours')
+        axes.set_ylabel('Members')
+        axes.set_title('Hours distribution')
+    elif mode == 'members':
+        _bars(axes, results['members'], 'Hours')
+        axes.axhline(results['average'], color='gray', linestyle='--', label='Organization average')
+        axes.legend()
+        axes.set_title('Hours per member')
+    else:
+        raise ValueError('Unknown chart: ' + mode)
+
+    figure.tight_layout()
+    return figure
+
+
+def _bars(axes, pairs, ylabel):
+    labels = [pair[0] for pair in pairs]
+    heights = [pair[1] for pair in pairs]
+    if len(pairs) <= MAX_LABELS:
+        axes.bar(range(len(pairs)), heights)
+        axes.set_xticks(range(len(pairs)))
+        axes.set_xticklabels(labels, rotation=30, ha='right')
+    else:
+        # Too many bars to tell apart anyway, so they're drawn as one filled outline instead of a rectangle each,
+        # which is what makes a chart of every member in a big chapter slow to draw
+        edges = numpy.arange(len(pairs) + 1) - 0.5
+        axes.fill_between(edges, heights + heights[-1:], step='post', linewidth=0)
+        axes.set_xlim(edges[0], edges[-1])
+        axes.set_xticks([])
+    axes.set_ylabel(ylabel)
+
+
+# Content hash of a file, used to tell whether a backup or roster has changed since a chart was cached
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as datafile:
+        for block in iter(lambda: datafile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# The cache filename for one chart of one backup/roster pair
+def chart_key(backup_digest, roster_digest, mode, n, bins, size, dpi):
+    parts = [CACHE_VERSION, backup_digest, roster_digest, mode, str(n), str(bins), str(size), str(dpi)]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest() + '.png'
+
+
+# Returns the path to a PNG of the chart, rendering it only if it isn't cached already. get_results is called (with
+# no arguments) to get the metrics only when the chart has to be drawn, so a cache hit never loads the backup
+def cached_chart(cache_dir, backup_digest, roster_digest, get_results, mode, n=metrics.TOP_N, bins=DEFAULT_BINS,
+                 size=(8, 5), dpi=100):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, chart_key(backup_digest, roster_digest, mode, n, bins, size, dpi))
+    if os.path.exists(path):
+        # Marks the chart as recently used so pruning keeps it
+        os.utime(path)
+        diagnostics.count('chart cache hits')
+        return path
+
+    diagnostics.count('chart cache misses')
+
+    save_chart(get_results(), mode, path, n, bins, size, dpi)
+    prune_cache(cache_dir)
+    return path
+
+
+# Renders one chart straight to a file at path, as a PNG or (for a path ending in .pdf) a PDF
+def save_chart(results, mode, path, n=metrics.TOP_N, bins=DEFAULT_BINS, size=(8, 5), dpi=100):
+    with diagnostics.stage('chart render', mode=mode):
+        _save_figure(render_chart(results, mode, n, bins, size, dpi), path)
+
+
+def _save_figure(figure, path):
+    temp_path = path + '.tmp'
+    if path.endswith('.pdf'):
+        FigureCanvasAgg(figure).print_figure(temp_path, format='pdf')
+    else:
+        FigureCanvasAgg(figure).print_png(temp_path)
+    os.replace(temp_path, path)
+
+
+# Draws how the organization's totals changed from backup to backup. points are (label, total hours, events,
+# active members) tuples, oldest first, as returned by aggregates.trend
+def render_trend(points, size=(8, 5), dpi=100):
+    figure = Figure(figsize=size, dpi=dpi)
+    axes = figure.add_subplot(111)
+    labels = [point[0] for point in points]
+    positions = range(len(points))
+
+    axes.plot(positions, [point[1] for point in points], marker='o', label='Total hours')
+    axes.plot(positions, [point[2] for point in points], marker='o', label='Events')
+    axes.set_ylabel('Hours / events')
+    members = axes.twinx()
+    members.plot(positions, [point[3] for point in points], marker='s', color='gray', linestyle='--',
+                 label='Active members')
+    members.set_ylabel('Active members')
+
+    if len(points) <= MAX_LABELS:
+        axes.set_xticks(list(positions))
+        axes.set_xticklabels(labels, rotation=30, ha='right')
+    else:
+        axes.set_xticks([])
+    lines = axes.get_lines() + members.get_lines()
+    axes.legend(lines, [line.get_label() for line in lines], loc='upper left')
+    axes.set_title('Trends across ' + str(len(points)) + ' backups')
+    figure.tight_layout()
+    return figure
+
+
+# Like cached_chart, for the trend chart over the backups with the given content hashes (oldest first).
+# get_points is only called when the chart has to be drawn
+def cached_trend(cache_dir, digests, get_points, size=(8, 5), dpi=100):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, chart_key(hashlib.sha1('|'.join(digests).encode('utf-8')).hexdigest(), '',
+                                             'trend', 0, 0, size, dpi))
+    if os.path.exists(path):
+        os.utime(path)
+        diagnostics.count('chart cache hits')
+        return path
+
+    diagnostics.count('chart cache misses')
+    with diagnostics.stage('chart render', mode='trend'):
+        _save_figure(render_trend(get_points(), size, dpi), path)
+    prune_cache(cache_dir)
+    return path
+
+
+# Deletes the oldest cached charts once there are more than CACHE_LIMIT of them
+def prune_cache(cache_dir, limit=CACHE_LIMIT):
+    with os.scandir(cache_dir) as directory:
+        cached = [(file.stat().st_mtime, file.path) for file in directory if file.name.endswith('.png')]
+    if len(cached) > limit:
+        for _, path in sorted(cached)[:len(cached) - limit]:
+            os.remove(path)
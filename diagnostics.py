@@ -0,0 +1,148 @@
+import collections
+import cProfile
+import datetime
+import json
+import os
+import threading
+import time
+
+
+# Lightweight timing and counters for the slow parts of Voluntracker (logging in, Sheets requests, parsing backups,
+# metrics, charts, workbooks). Code wraps a stage in `with diagnostics.stage('name'):` and bumps counters with
+# diagnostics.count('name'). While recording is off (the default) stage() hands back one shared do-nothing context
+# and count() returns straight away, so the hooks cost a function call. While it's on, every stage is kept in memory
+# for the diagnostics window and, if a log path is set, appended to a json-lines log; with a profile folder set, the
+# outermost stage running at any time is also captured with cProfile into a .prof file there.
+
+# How many recent stages are kept in memory
+RECENT_LIMIT = 500
+
+enabled = False
+log_path = None
+profile_dir = None
+
+lock = threading.Lock()
+recent = collections.deque(maxlen=RECENT_LIMIT)
+totals = {}
+counters = collections.Counter()
+profiling = threading.Lock()
+profile_count = 0
+
+
+# Turns recording on or off, and sets where stages are logged and profiles saved (None for neither)
+def configure(enable=True, log=None, profile=None):
+    global enabled, log_path, profile_dir
+
+    for directory in (os.path.dirname(log) if log else None, profile):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    log_path = log
+    profile_dir = profile
+    enabled = enable
+
+
+class _Stage:
+    __slots__ = ('name', 'fields', 'start', 'profile')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.profile = None
+
+    # Extra details to record with the stage, e.g. how many rows it handled
+    def note(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        if profile_dir is not None and profiling.acquire(blocking=False):
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Something else (a debugger, another profiler) is already profiling
+                self.profile = None
+                profiling.release()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+            _save_profile(self.name, self.profile)
+            profiling.release()
+        if kind is not None:
+            self.fields['error'] = kind.__name__
+        _record(self.name, seconds, self.fields)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def note(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+# Times a block: `with stage('sheets request', rows=5000) as timed: ... timed.note(more=1)`
+def stage(name, **fields):
+    if not enabled:
+        return NULL_STAGE
+    return _Stage(name, fields)
+
+
+def count(name, n=1):
+    if enabled:
+        with lock:
+            counters[name] += n
+
+
+def _record(name, seconds, fields):
+    record = {'stage': name, 'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+              'seconds': round(seconds, 6), 'thread': threading.current_thread().name, 'pid': os.getpid()}
+    record.update(fields)
+    with lock:
+        recent.append(record)
+        calls, total, longest = totals.get(name, (0, 0.0, 0.0))
+        totals[name] = (calls + 1, total + seconds, max(longest, seconds))
+        if log_path is not None:
+            with open(log_path, 'a', encoding='utf-8') as logfile:
+                logfile.write(json.dumps(record) + '\n')
+
+
+def _save_profile(name, profile):
+    global profile_count
+
+    with lock:
+        profile_count += 1
+        number = profile_count
+    filename = name.replace(' ', '_') + '-' + str(os.getpid()) + '-' + str(number) + '.prof'
+    profile.dump_stats(os.path.join(profile_dir, filename))
+
+
+# The most recent stages, newest last, as dicts
+def recent_stages():
+    with lock:
+        return list(recent)
+
+
+# Every stage recorded so far as {name: (calls, total seconds, longest seconds)}, plus the counters
+def summary():
+    with lock:
+        return dict(totals), dict(counters)
+
+
+def reset():
+    with lock:
+        recent.clear()
+        totals.clear()
+        counters.clear()
@@ -0,0 +1,391 @@
+from array import array
+from bisect import bisect_left
+import datetime
+import re
+import diagnostics
+from backups import iter_backup
+
+
+# A compact, shared in-memory model of the form responses. Every cell is interned into a per-column string pool and
+# stored as an integer id in a typed array, so a loaded sheet costs a few bytes per cell instead of a Python list
+# of string objects per row. The same table is used by the backup, metrics and submission windows. Timestamps are
+# nearly all different, so interning them would save nothing: they're kept as seconds in a typed array instead.
+
+# The header cell of the name column in the Google Forms output -- rows starting with this are skipped
+HEADER_NAME = 'What is your name?'
+
+# Column positions inside a backup row. The first FORM_COLUMNS cells are the answers in the B:F range of the response
+# sheet; the Forms timestamp from column A, when it was pulled, goes after them (see timestamp_last)
+NAME_COL = 0
+VENUE_COL = 2
+HOURS_COL = 3
+FORM_COLUMNS = 5
+TIMESTAMP_COL = 5
+
+# Google Forms writes timestamps like 1/15/2021 13:45:02 in US-locale sheets, which is parsed by hand since
+# strptime is several times slower. ISO dates are also read, and then the other formats here, tried in order. Dates
+# typed in by the user for a period are read the same way
+US_TIMESTAMP = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})(?:\s+(\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+TIMESTAMP_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# Exactly how Google Forms writes a timestamp (no leading zeros on the month, day or hour). A timestamp written like
+# this can be rebuilt from its seconds by format_timestamp, so its text isn't kept
+FORMS_TIMESTAMP = re.compile(r'([1-9]\d?/[1-9]\d?/\d{4}) ([1-9]?\d):([0-5]\d):([0-5]\d)$')
+
+# Seconds at the start of each day and into the day of each hour and minute seen in a Forms timestamp (None for a day
+# that isn't a date), since converting the numbers costs more than the rest of reading a timestamp
+day_seconds = {}
+minute_seconds = {}
+
+# Stands in for the seconds of an event with no readable timestamp
+NO_TIME = float('nan')
+
+# Why a period can't be used with a backup pulled before column A was
+NO_TIMESTAMPS = 'This backup has no form timestamps, so only the whole backup can be used'
+
+
+# A sheet row pulled from column A onwards (timestamp first) rearranged into the backup layout: the answers in their
+# usual columns, padded to FORM_COLUMNS, then the timestamp, then any answers past column F
+def timestamp_last(row):
+    if not row:
+        return row
+    answers = row[1:FORM_COLUMNS + 1]
+    return answers + [''] * (FORM_COLUMNS - len(answers)) + row[:1] + row[FORM_COLUMNS + 1:]
+
+
+# Parses a Forms timestamp (or a date) into a datetime, or None if it's blank or not a date
+def parse_timestamp(text):
+    text = text.strip()
+    if not text:
+        return None
+    match = US_TIMESTAMP.match(text)
+    if match:
+        month, day, year, hour, minute, second = match.groups()
+        try:
+            return datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                                     int(second or 0))
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for form in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, form)
+        except ValueError:
+            pass
+    return None
+
+
+# Seconds since EPOCH for a cell of the timestamp column (NO_TIME if it isn't a date), and whether format_timestamp
+# gives back exactly the same text
+def timestamp_seconds(text):
+    match = FORMS_TIMESTAMP.match(text)
+    if match:
+        day, hour, minute, second = match.groups()
+        if day not in day_seconds:
+            month, day_of_month, year = map(int, day.split('/'))
+            try:
+                day_seconds[day] = (datetime.date(year, month, day_of_month).toordinal() - EPOCH_ORDINAL) * 86400
+            except ValueError:
+                day_seconds[day] = None
+        key = hour + minute
+        if key not in minute_seconds:
+            minute_seconds[key] = int(hour) * 3600 + int(minute) * 60 if int(hour) < 24 else None
+        start, within = day_seconds[day], minute_seconds[key]
+        if start is not None and within is not None:
+            return start + within + int(second), True
+    moment = parse_timestamp(text)
+    return (NO_TIME if moment is None else (moment - EPOCH).total_seconds()), False
+
+
+# Seconds since EPOCH written the way Google Forms writes a timestamp: 1/15/2021 13:45:02
+def format_timestamp(seconds):
+    moment = EPOCH + datetime.timedelta(seconds=seconds)
+    return '%d/%d/%d %d:%02d:%02d' % (moment.month, moment.day, moment.year, moment.hour, moment.minute,
+                                      moment.second)
+
+
+# The (start, end) datetimes of a period typed in as its first and last days (both included), where end is the first
+# moment after the last day and a blank day means no limit. Raises ValueError if either isn't a date or they're the
+# wrong way round
+def parse_period(first='', last=''):
+    bounds = []
+    for label, text in (('From', first), ('To', last)):
+        moment = parse_timestamp(text) if text and text.strip() else None
+        if text and text.strip() and moment is None:
+            raise ValueError(label + ' should be a date like 2021-01-31, not ' + repr(text.strip()))
+        bounds.append(moment)
+    start, end = bounds
+    if end is not None:
+        end = datetime.datetime.combine(end.date(), datetime.time()) + datetime.timedelta(days=1)
+    if start is not None and end is not None and start >= end:
+        raise ValueError('From should be before To')
+    return start, end
+
+
+# Maps every distinct string in a column to a small integer id and back
+class StringPool:
+    __slots__ = ('ids', 'strings')
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+
+# Parses the hours column. Blank or unreadable cells count as 0 hours, the original text is still kept in the pool
+def parse_hours(text):
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+# Column-oriented storage for a sheet of form responses. columns[c][i] is the pool id of cell c in event i,
+# widths[i] is how many cells event i originally had (the Sheets API leaves off empty trailing cells), and hours
+# holds the parsed hours column so the metrics never have to convert strings again. The timestamp column's pool only
+# ever holds '': times holds each event's timestamp as seconds since EPOCH (NO_TIME if it has none), and time_texts
+# the text of the few, by event, that format_timestamp can't rebuild exactly
+class EventTable:
+    __slots__ = ('header', 'columns', 'pools', 'widths', 'hours', 'times', 'time_texts', '_time_index')
+
+    def __init__(self):
+        self.header = None
+        self.columns = []
+        self.pools = []
+        self.widths = array('B')
+        self.hours = array('d')
+        self.times = array('d')
+        self.time_texts = {}
+        self._time_index = None
+
+    # Builds a table from any iterable of rows (lists of strings), e.g. sheet values or a csv.reader
+    @classmethod
+    def from_rows(cls, rows):
+        table = cls()
+        table.extend(rows)
+        return table
+
+    def __len__(self):
+        return len(self.hours)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+        self._time_index = None
+
+    # Adds one row. The header row is kept apart from the events, and blank rows are dropped
+    def append(self, row):
+        self._time_index = None
+        if not row:
+            return
+        if row[NAME_COL] == HEADER_NAME:
+            self.header = list(row)
+            return
+        if len(row) > len(self.columns):
+            self._widen(len(row))
+
+        stamp = row[TIMESTAMP_COL] if len(row) > TIMESTAMP_COL else ''
+        if stamp:
+            seconds, exact = timestamp_seconds(stamp)
+            if not exact:
+                self.time_texts[len(self.times)] = stamp
+            row = row[:TIMESTAMP_COL] + [''] + row[TIMESTAMP_COL + 1:]
+        else:
+            seconds = NO_TIME
+        self.times.append(seconds)
+
+        for column, pool, cell in zip(self.columns, self.pools, row):
+            column.append(pool.intern(cell))
+        for column, pool in zip(self.columns[len(row):], self.pools[len(row):]):
+            column.append(pool.intern(''))
+        self.widths.append(len(row))
+        self.hours.append(parse_hours(row[HOURS_COL]) if len(row) > HOURS_COL else 0.0)
+
+    # Adds empty columns until the table is width cells wide
+    def _widen(self, width):
+        while len(self.columns) < width:
+            pool = StringPool()
+            if len(self.hours):
+                self.columns.append(array('i', [pool.intern('')]) * len(self.hours))
+            else:
+                self.columns.append(array('i'))
+            self.pools.append(pool)
+
+    # Rebuilds event i as a list of strings, exactly as it was appended
+    def row(self, i):
+        cells = [self.pools[c][self.columns[c][i]] for c in range(self.widths[i])]
+        if len(cells) > TIMESTAMP_COL:
+            cells[TIMESTAMP_COL] = self.timestamp_text(i)
+        return cells
+
+    # The timestamp cell of event i as it was appended ('' if it was blank)
+    def timestamp_text(self, i):
+        text = self.time_texts.get(i)
+        if text is not None:
+            return text
+        seconds = self.times[i]
+        return '' if seconds != seconds else format_timestamp(seconds)
+
+    # Yields the header (if there is one) and then every event as a list of strings
+    def iter_rows(self):
+        if self.header is not None:
+            yield self.header
+        for i in range(len(self)):
+            yield self.row(i)
+
+    # A new table holding only the events at indices (in that order), sharing this table's string pools. A range, as
+    # returned by TimeIndex.select for a sheet in time order, is copied as slices of the columns
+    def take(self, indices):
+        subset = EventTable()
+        subset.header = self.header
+        subset.pools = list(self.pools)
+        if isinstance(indices, range) and indices.step == 1:
+            part = slice(indices.start, indices.stop)
+            subset.columns = [column[part] for column in self.columns]
+            subset.widths = self.widths[part]
+            subset.hours = self.hours[part]
+            subset.times = self.times[part]
+            subset.time_texts = {i - indices.start: text for i, text in self.time_texts.items() if i in indices}
+        else:
+            subset.columns = [array('i', [column[i] for i in indices]) for column in self.columns]
+            subset.widths = array('B', [self.widths[i] for i in indices])
+            subset.hours = array('d', [self.hours[i] for i in indices])
+            subset.times = array('d', [self.times[i] for i in indices])
+            if self.time_texts:
+                subset.time_texts = {new: self.time_texts[old] for new, old in enumerate(indices)
+                                     if old in self.time_texts}
+        return subset
+
+    # The events sorted by timestamp, for picking out a period. Built the first time it's needed and kept until
+    # more rows are added
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self)
+        return self._time_index
+
+    # The first and last timestamps in ISO format, as the backup catalog records them, or (None, None) if there are
+    # none
+    def time_span(self):
+        index = self.time_index()
+        if not len(index):
+            return None, None
+        return index.first().isoformat(), index.last().isoformat()
+
+    # The events with timestamps from start up to (not including) end, as a new table. None means no limit, so with
+    # neither bound every event is kept, timestamped or not, and the table itself is returned. Raises ValueError when
+    # a period is asked of events that have no timestamps at all (e.g. a backup pulled from B:F), rather than quietly
+    # leaving every event out
+    def between(self, start=None, end=None):
+        if start is None and end is None:
+            return self
+        index = self.time_index()
+        if len(self) and not len(index):
+            raise ValueError(NO_TIMESTAMPS)
+        return self.take(index.select(start, end))
+
+    def cell(self, i, column):
+        if column >= len(self.columns):
+            return ''
+        if column == TIMESTAMP_COL:
+            return self.timestamp_text(i) if self.widths[i] > TIMESTAMP_COL else ''
+        return self.pools[column][self.columns[column][i]]
+
+    def member_name(self, i):
+        return self.cell(i, NAME_COL)
+
+    def venue_name(self, i):
+        return self.cell(i, VENUE_COL)
+
+    # Interned member/venue ids and names, the arrays the metrics engine groups on
+    @property
+    def member_ids(self):
+        return self._column(NAME_COL)
+
+    @property
+    def venue_ids(self):
+        return self._column(VENUE_COL)
+
+    @property
+    def member_names(self):
+        return self._pool(NAME_COL).strings
+
+    @property
+    def venue_names(self):
+        return self._pool(VENUE_COL).strings
+
+    def _column(self, column):
+        if column >= len(self.columns):
+            self._widen(column + 1)
+        return self.columns[column]
+
+    def _pool(self, column):
+        if column >= len(self.pools):
+            self._widen(column + 1)
+        return self.pools[column]
+
+
+# The events of an EventTable in time order, from the timestamps it parsed as they were added. Responses are normally
+# already in the order they were submitted, which is checked in one pass and then needs no sort at all. After that,
+# picking out the events in any period is two binary searches. Events without a readable timestamp are left out
+class TimeIndex:
+    __slots__ = ('times', 'order', 'in_order')
+
+    def __init__(self, table):
+        with diagnostics.stage('time index', rows=len(table)):
+            times = table.times
+            # NO_TIME compares false with everything, so any event without a timestamp fails this too
+            self.in_order = (not times or times[0] == times[0]) and all(a <= b for a, b in zip(times, times[1:]))
+            if self.in_order:
+                # Every event has a timestamp and they're already sorted, so a period is a plain run of events
+                self.times = array('d', times)
+                self.order = None
+            else:
+                keyed = sorted((moment, i) for i, moment in enumerate(times) if moment == moment)
+                self.times = array('d', [moment for moment, _ in keyed])
+                self.order = array('i', [i for _, i in keyed])
+
+    def __len__(self):
+        return len(self.times)
+
+    # The earliest and latest timestamps, as datetimes (None when there are none)
+    def first(self):
+        return EPOCH + datetime.timedelta(seconds=self.times[0]) if self.times else None
+
+    def last(self):
+        return EPOCH + datetime.timedelta(seconds=self.times[-1]) if self.times else None
+
+    # Indices of the events from start up to (not including) end, in the order they're in the table. start and end
+    # are datetimes, or None for no limit
+    def select(self, start=None, end=None):
+        low = bisect_left(self.times, (start - EPOCH).total_seconds()) if start is not None else 0
+        high = bisect_left(self.times, (end - EPOCH).total_seconds()) if end is not None else len(self.times)
+        high = max(low, high)
+        if self.in_order:
+            return range(low, high)
+        return sorted(self.order[low:high])
+
+
+# Reads a backup written by pull_backup (csv or packed) into an EventTable, streaming its rows
+def load_backup(path):
+    with diagnostics.stage('csv parse') as timed:
+        table = EventTable.from_rows(iter_backup(path))
+        timed.note(rows=len(table))
+    return table
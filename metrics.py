@@ -0,0 +1,84 @@
+import numpy
+import diagnostics
+
+
+# A GUI-independent metrics engine for Voluntracker. Works on an events.EventTable, whose member and venue columns are
+# already interned integer ids, and does all of the per-member and per-venue group-bys with numpy.bincount, so the
+# cost of every metric grows linearly with the number of form responses instead of (responses x members).
+
+# How many members to show in the top/bottom performer lists
+TOP_N = 5
+
+
+# Total hours for every member in data.member_names, in the same order
+def member_totals(data):
+    return numpy.bincount(numpy.asarray(data.member_ids), weights=numpy.asarray(data.hours),
+                          minlength=len(data.member_names))
+
+
+# Number of events logged by every member in data.member_names, in the same order
+def member_counts(data):
+    return numpy.bincount(numpy.asarray(data.member_ids), minlength=len(data.member_names))
+
+
+# Number of events logged at every venue in data.venue_names, in the same order
+def venue_counts(data):
+    return numpy.bincount(numpy.asarray(data.venue_ids), minlength=len(data.venue_names))
+
+
+# Computes every metric shown in the metrics window. Returns a dict with:
+#   'members'   -- (name, total hours) for everyone who logged hours (sorted by name), followed by roster members
+#                  with no hours at 0
+#   'inactive'  -- roster members who have not logged any hours
+#   'average'   -- organization average hours per member
+#   'top'/'bottom' -- the top_n highest and lowest (name, hours) pairs
+#   'venues'    -- (venue, event count) pairs, most popular first
+def compute_metrics(data, roster=None, top_n=TOP_N):
+    with diagnostics.stage('metrics', rows=len(data)):
+        # Only members with at least one event count as having logged hours
+        present = numpy.flatnonzero(member_counts(data))
+        totals = member_totals(data)[present]
+        names = [data.member_names[i] for i in present]
+
+        counts = venue_counts(data)
+        by_popularity = [i for i in numpy.argsort(-counts, kind='stable') if counts[i]]
+        venues = [(data.venue_names[i], int(counts[i])) for i in by_popularity]
+
+        return summarize(names, totals, venues, roster, top_n)
+
+
+# Builds the compute_metrics dict from per-member totals already worked out elsewhere (e.g. by an SQL group-by in
+# store.EventStore): names and totals are every member who logged hours, in first-seen order, and venues is the
+# (venue, event count) list, most popular first
+def summarize(names, totals, venues, roster=None, top_n=TOP_N):
+    totals = numpy.asarray(totals, dtype=float)
+
+    # Roster matching is a set lookup per roster member instead of a scan over every member with hours
+    known = set(names)
+    inactive = []
+    if roster is not None:
+        seen = set()
+        for member in roster:
+            if member not in known and member not in seen:
+                seen.add(member)
+                inactive.append(member)
+
+    members = [(names[i], float(totals[i])) for i in sorted(range(len(names)), key=names.__getitem__)]
+    members.extend((member, 0.0) for member in inactive)
+
+    all_hours = numpy.concatenate((totals, numpy.zeros(len(inactive))))
+    all_names = list(names) + inactive
+    average = float(all_hours.mean()) if len(all_hours) else 0.0
+
+    # Stable sorts keep ties in first-seen order, so the lists don't shuffle around between runs
+    descending = numpy.argsort(-all_hours, kind='stable')[:top_n]
+    ascending = numpy.argsort(all_hours, kind='stable')[:top_n]
+
+    return {
+        'members': members,
+        'inactive': inactive,
+        'average': average,
+        'top': [(all_names[i], float(all_hours[i])) for i in descending],
+        'bottom': [(all_names[i], float(all_hours[i])) for i in ascending],
+        'venues': list(venues),
+    }
@@ -0,0 +1,160 @@
+import collections
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from backups import write_json
+
+
+# Matches the names members type into the form against the roster. Every name is first reduced to a normalized key
+# (case, accents, punctuation and extra spaces ignored, and word order too as a fallback), which catches most
+# differences with a dict lookup. Names that still don't match are compared against roster names sharing the most
+# three-letter pieces (trigrams) with them, by edit distance, so a typo like "Jonh Smith" still finds "John Smith"
+# without comparing every name to every roster member. Matches the user confirms or rejects are saved in an alias
+# table, so from then on that name resolves with a single lookup.
+
+# How alike (1.0 = identical) a name must be to its closest roster name to be matched by edit distance
+MATCH_THRESHOLD = 0.85
+
+# How many roster names sharing the most trigrams are compared by edit distance
+CANDIDATES = 5
+
+# How a name was matched
+ALIAS = 'alias'
+EXACT = 'exact'
+NORMALIZED = 'normalized'
+FUZZY = 'fuzzy'
+
+NON_WORD = re.compile(r'[^\w\s]')
+
+
+# 'José  O'Neil ' -> 'jose oneil'
+def normalize(name):
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return ' '.join(NON_WORD.sub('', name.casefold()).split())
+
+
+def trigrams(key):
+    padded = '  ' + key + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Edit distance, counting two swapped neighbouring letters as one edit like any other typo. Gives up (and returns
+# limit + 1) as soon as it must be more than limit
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def similarity(a, b):
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    limit = int(longest * (1 - MATCH_THRESHOLD))
+    return 1.0 - edit_distance(a, b, limit) / longest
+
+
+class NameIndex:
+    def __init__(self, roster, alias_path=None):
+        self.roster = list(roster)
+        self.alias_path = alias_path
+        self.exact = set(self.roster)
+        self.by_key = {}
+        self.by_sorted_key = {}
+        self.by_trigram = collections.defaultdict(list)
+        self.keys = []
+        for i, member in enumerate(self.roster):
+            key = normalize(member)
+            self.keys.append(key)
+            self.by_key.setdefault(key, member)
+            self.by_sorted_key.setdefault(' '.join(sorted(key.split())), member)
+            for trigram in trigrams(key):
+                self.by_trigram[trigram].append(i)
+
+        # {normalized form name: roster name it was confirmed as, or the form name itself if it was rejected}
+        self.aliases = {}
+        if alias_path and os.path.exists(alias_path):
+            with open(alias_path, 'r', encoding='utf-8') as aliasfile:
+                self.aliases = json.load(aliasfile)
+        # Names already looked up, so each distinct name is only ever compared against the roster once
+        self.resolved = {}
+
+    # Returns (roster name, how it matched) for a name from the form, or (None, None) if nothing is close enough
+    def resolve(self, name):
+        if name in self.exact:
+            return name, EXACT
+        if name not in self.resolved:
+            self.resolved[name] = self._resolve(name)
+        return self.resolved[name]
+
+    def _resolve(self, name):
+        key = normalize(name)
+        alias = self.aliases.get(key)
+        if alias is not None:
+            return alias, ALIAS
+        member = self.by_key.get(key) or self.by_sorted_key.get(' '.join(sorted(key.split())))
+        if member is not None:
+            return member, NORMALIZED
+        member, score = self.closest(key)
+        if member is not None and score >= MATCH_THRESHOLD:
+            return member, FUZZY
+        return None, None
+
+    # The roster name closest to a normalized key by edit distance, among the CANDIDATES sharing the most trigrams
+    # with it. Returns (roster name, similarity), or (None, 0.0) if no roster name shares any trigram
+    def closest(self, key):
+        shared = collections.Counter()
+        for trigram in trigrams(key):
+            shared.update(self.by_trigram.get(trigram, ()))
+        best, best_score = None, 0.0
+        for i, _ in shared.most_common(CANDIDATES):
+            score = similarity(key, self.keys[i])
+            if score > best_score:
+                best, best_score = self.roster[i], score
+        return best, best_score
+
+    # Maps every name that should be counted as someone else to the roster name it belongs to. Names that already
+    # are roster names, or that don't match anyone, are left out
+    def mapping(self, names):
+        mapped = {}
+        for name in names:
+            member, _ = self.resolve(name)
+            if member is not None and member != name:
+                mapped[name] = member
+        return mapped
+
+    # Every name that isn't exactly on the roster, as (name, roster name or None, how it matched), for reviewing
+    def review(self, names):
+        return [(name,) + self.resolve(name) for name in names if name not in self.exact]
+
+    # Records that name is member (or with member=None, that name is nobody on the roster) and saves the table
+    def confirm(self, name, member=None):
+        self.aliases[normalize(name)] = member if member is not None else name
+        self.resolved.clear()
+        if self.alias_path:
+            write_json(self.alias_path, self.aliases)
+
+    def forget(self, name):
+        if self.aliases.pop(normalize(name), None) is not None:
+            self.resolved.clear()
+            if self.alias_path:
+                write_json(self.alias_path, self.aliases)
+
+    # Changes whenever the roster or the alias table does, for caches of anything worked out from matched names
+    def digest(self):
+        data = json.dumps([self.roster, sorted(self.aliases.items())])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
@@ -0,0 +1,144 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import events
+import metrics
+import charts
+import aggregates
+import roster
+import diagnostics
+
+
+# Exports a report for one backup, for sending to the oversight organization: every chart in charts.CHART_MODES as
+# PNG and/or PDF, plus summary.csv with every member's hours and the organization-wide numbers. Charts are drawn with
+# matplotlib's non-interactive Agg backend, each in its own worker process, so a full report takes about as long as
+# the slowest chart instead of all of them added up. Nothing here needs a display, so reports can be made headless.
+# The pool is started the first time a report is exported and kept for later ones, since starting the processes (and
+# importing matplotlib in each) costs more than drawing a chart.
+#
+# Run with: python report.py backup.csv [--roster Roster.csv] [--aliases aliases.json] [--out Reports]
+#                                       [--formats png pdf] [--workers N] [--from DATE] [--to DATE]
+# --from and --to limit the report to the responses submitted from the first day up to and including the last.
+
+FORMATS = ('png', 'pdf')
+
+# Chart size in inches, and resolution of the PNGs
+SIZE = (10, 6)
+DPI = 150
+
+SUMMARY_NAME = 'summary.csv'
+
+pool = None
+pool_workers = None
+
+
+def get_pool(workers=None):
+    global pool, pool_workers
+
+    if pool is None or pool_workers != workers:
+        if pool is not None:
+            pool.shutdown()
+        pool = ProcessPoolExecutor(max_workers=workers)
+        pool_workers = workers
+    return pool
+
+
+# Writes the report for results (a metrics.compute_metrics dict) into output_dir. workers=1 draws every chart in this
+# process instead of the pool, e.g. when already running in a worker. Returns the paths written, summary first
+def export_report(results, output_dir, formats=FORMATS, n=metrics.TOP_N, size=SIZE, dpi=DPI, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    with diagnostics.stage('report', charts=len(charts.CHART_MODES) * len(formats)):
+        paths = [os.path.join(output_dir, SUMMARY_NAME)]
+        write_summary(results, paths[0])
+
+        jobs = [(mode, os.path.join(output_dir, mode + '.' + extension))
+                for mode in charts.CHART_MODES for extension in formats]
+        if workers == 1:
+            for mode, path in jobs:
+                charts.save_chart(results, mode, path, n, size=size, dpi=dpi)
+        else:
+            futures = [get_pool(workers).submit(charts.save_chart, results, mode, path, n, size=size, dpi=dpi)
+                       for mode, path in jobs]
+            for future in futures:
+                future.result()
+        paths.extend(path for _, path in jobs)
+    return paths
+
+
+# summary.csv: one row per member (hours, and whether they're a top or bottom performer or inactive), then the
+# organization-wide numbers and the venues, each under its own heading
+def write_summary(results, path):
+    top = {name for name, _ in results['top']}
+    bottom = {name for name, _ in results['bottom']}
+    inactive = set(results['inactive'])
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', newline='', encoding='utf-8') as summaryfile:
+        writer = csv.writer(summaryfile)
+        writer.writerow(['Member', 'Hours', 'Status'])
+        for name, hours in results['members']:
+            status = ('Inactive' if name in inactive else 'Top performer' if name in top else
+                      'Bottom performer' if name in bottom else '')
+            writer.writerow([name, format(hours, 'g'), status])
+
+        writer.writerow([])
+        writer.writerow(['Organization', 'Value'])
+        writer.writerow(['Members', len(results['members'])])
+        writer.writerow(['Inactive members', len(inactive)])
+        writer.writerow(['Total hours', format(sum(hours for _, hours in results['members']), 'g')])
+        writer.writerow(['Average hours per member', format(results['average'], '.2f')])
+
+        writer.writerow([])
+        writer.writerow(['Venue', 'Events'])
+        writer.writerows(results['venues'])
+    os.replace(temp_path, path)
+
+
+# The metrics for a backup file, with misspelled names counted under the roster member they match. The roster is
+# read along with its journal, so members added or removed in Voluntracker count. start and end (datetimes) limit
+# them to the responses submitted in that period
+def backup_results(backup_path, roster_path=None, alias_path=None, start=None, end=None):
+    import names
+
+    table = events.load_backup(backup_path)
+    if start is not None or end is not None:
+        table = table.between(start, end)
+    aggregate = aggregates.Aggregate.from_table(table)
+    members = roster.load_names(roster_path) if roster_path else None
+    if members is not None:
+        aggregate = aggregate.renamed(names.NameIndex(members, alias_path).mapping(aggregate.members))
+    return aggregate.results(members)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the charts and a summary csv for one backup.')
+    parser.add_argument('backup', help='backup file (csv or packed) to report on')
+    parser.add_argument('--roster', help='roster csv, to include inactive members and match misspelled names')
+    parser.add_argument('--aliases', help='name matches confirmed in Voluntracker (Configuration/aliases.json)')
+    parser.add_argument('--out', default='Reports', help='folder to write the report into')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--workers', type=int, default=None, help='processes to draw charts in (default: one per core)')
+    parser.add_argument('--from', dest='first', default='', help='first day to include, e.g. 2021-01-01')
+    parser.add_argument('--to', dest='last', default='', help='last day to include')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        results = backup_results(args.backup, args.roster, args.aliases, *events.parse_period(args.first, args.last))
+        paths = export_report(results, args.out, args.formats, workers=args.workers)
+    except (OSError, ValueError) as error:
+        print('Could not export the report: ' + str(error), file=sys.stderr)
+        return 1
+    print('Wrote ' + str(len(paths)) + ' files to ' + os.path.abspath(args.out) + ' in ' +
+          format(time.perf_counter() - start, '.1f') + ' s')
+    return 0
+
+
+if __name__ == '__main__':
+    # Lets a frozen build's chart processes draw their charts instead of starting another report
+    multiprocessing.freeze_support()
+    sys.exit(main())
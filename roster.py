@@ -0,0 +1,152 @@
+import csv
+import hashlib
+import os
+
+
+# The membership roster, loaded once and kept in memory as an insertion-ordered dict (so membership checks are
+# O(1)). Roster.csv stays the saved copy of the roster; adds and deletes are appended to a small journal file next to
+# it instead of rewriting the whole roster, and the journal is folded back into Roster.csv (compacted) when it gets
+# long or the roster is next loaded. Windows showing the roster subscribe to change notifications instead of
+# re-reading the file.
+
+# Journal entries: ['+', name] adds a member and ['-', name] removes one
+ADD = '+'
+REMOVE = '-'
+
+# The journal is compacted once it has at least this many entries and is longer than half the roster
+COMPACT_AFTER = 100
+
+
+# The journal kept next to a roster csv, named the way Voluntracker names it (Roster.csv -> Roster.journal)
+def journal_path(path):
+    return os.path.splitext(path)[0] + '.journal'
+
+
+# The members of the roster at path, with its journal replayed, for tools that run without Voluntracker open.
+# Unlike RosterStore, a missing roster is an error rather than a new empty one
+def load_names(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError('No roster at ' + path)
+    return RosterStore(path, journal_path(path)).names()
+
+
+class RosterStore:
+    def __init__(self, path, journal_path):
+        self.path = path
+        self.journal_path = journal_path
+        self.members = {}
+        self.listeners = []
+        self.journal_entries = 0
+        self.mtime = None
+        self._digest = None
+        self.load()
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def names(self):
+        return list(self.members)
+
+    # Reads Roster.csv, replays anything left in the journal, and compacts it so the next load is a plain read
+    def load(self):
+        self.members = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8', newline='\n') as rosterfile:
+                for member in csv.reader(rosterfile):
+                    member = ''.join(member)  # Converts list to a single string
+                    if member:
+                        self.members[member] = None
+        else:
+            with open(self.path, 'w+', newline='\n', encoding='utf-8') as rosterfile:
+                rosterfile.truncate()
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8', newline='\n') as journal:
+                for entry in csv.reader(journal):
+                    if len(entry) != 2:
+                        continue
+                    if entry[0] == ADD:
+                        self.members[entry[1]] = None
+                    elif entry[0] == REMOVE:
+                        self.members.pop(entry[1], None)
+                    replayed += 1
+
+        self.journal_entries = replayed
+        self._digest = None
+        if replayed:
+            self.compact()
+        self.mtime = os.path.getmtime(self.path)
+        self._changed('reload', None)
+
+    # Picks up changes made to Roster.csv outside of Voluntracker (e.g. editing it in Excel)
+    def reload_if_changed(self):
+        if not os.path.exists(self.path) or os.path.getmtime(self.path) != self.mtime:
+            self.load()
+
+    # Adds a member. Returns False if they were already on the roster
+    def add(self, name):
+        if not name or name in self.members:
+            return False
+        self._journal(ADD, name)
+        self.members[name] = None
+        self._changed('add', name)
+        return True
+
+    # Removes a member. Returns False if they weren't on the roster
+    def remove(self, name):
+        if name not in self.members:
+            return False
+        self._journal(REMOVE, name)
+        del self.members[name]
+        self._changed('remove', name)
+        return True
+
+    # Rewrites Roster.csv from memory and empties the journal
+    def compact(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8', newline='\n') as rosterfile:
+            rostwriter = csv.writer(rosterfile)
+            for member in self.members:
+                rostwriter.writerow([member])
+        os.replace(temp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+        with open(self.journal_path, 'w', encoding='utf-8', newline='\n'):
+            pass
+        self.journal_entries = 0
+
+    # A hash of the current members, for caches that depend on the roster. Worked out again only after a change
+    def digest(self):
+        if self._digest is None:
+            digest = hashlib.sha1()
+            for member in self.members:
+                digest.update(member.encode('utf-8') + b'\n')
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    # callback(kind, name) is called after every change, with kind 'add', 'remove' or 'reload' (name is None)
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _journal(self, kind, name):
+        with open(self.journal_path, 'a', encoding='utf-8', newline='\n') as journal:
+            csv.writer(journal).writerow([kind, name])
+        self.journal_entries += 1
+
+    def _changed(self, kind, name):
+        self._digest = None
+        if self.journal_entries >= COMPACT_AFTER and self.journal_entries > len(self.members) // 2:
+            self.compact()
+        for callback in list(self.listeners):
+            callback(kind, name)
@@ -0,0 +1,275 @@
+import collections
+import datetime
+import json
+import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from googleapiclient.discovery import build_from_document
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from backups import row_hash, write_json
+import diagnostics
+
+
+# Helpers for pulling form responses out of Google Sheets. SheetsSession handles logging in and building the Sheets
+# service; the fetch functions take an already-built service.
+
+# Where the Sheets API v4 discovery document is downloaded from the first time it's needed
+DISCOVERY_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+
+# Access tokens are refreshed this long before they expire, so a pull never starts with a token about to run out
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Seconds to wait on a Sheets request before giving up on it
+HTTP_TIMEOUT = 60
+
+# How many times a failed request (connection errors, 429s and 5xx responses) is retried, with exponential backoff
+RETRIES = 5
+
+# Big sheets are fetched this many rows per request, with up to FETCH_WORKERS requests in flight at once
+PAGE_ROWS = 5000
+FETCH_WORKERS = 4
+
+
+# Raised by a non-interactive SheetsSession when the user would have to log in through the browser
+class LoginRequired(Exception):
+    pass
+
+
+# One logged-in Google Sheets connection for the whole run of the program. The credentials are unpickled once and
+# refreshed ahead of expiry, and the service is built once from a discovery document cached on disk, so later pulls
+# (and the first pull, once the document is cached) skip both the token file and the discovery download. With
+# interactive=False (headless runs) a missing or unusable login raises LoginRequired instead of opening a browser.
+# With save=False the token file is only ever read, never rewritten or deleted, so several processes can share it:
+# refreshed tokens are kept in memory only.
+class SheetsSession:
+    def __init__(self, token_path, creds_path, scopes, discovery_path, interactive=True, save=True):
+        self.token_path = token_path
+        self.creds_path = creds_path
+        self.scopes = scopes
+        self.discovery_path = discovery_path
+        self.interactive = interactive
+        self.save = save
+        self.creds = None
+        self._service = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # Returns valid credentials, loading, refreshing or asking the user to log in as needed
+    def credentials(self):
+        with self.lock:
+            if self.creds is None and os.path.exists(self.token_path):
+                with open(self.token_path, 'rb') as token:
+                    self.creds = pickle.load(token)
+
+            if self.creds and self.creds.refresh_token and (not self.creds.valid or self._expiring()):
+                with diagnostics.stage('oauth refresh'):
+                    self.creds.refresh(Request())
+                self._save()
+            elif not self.creds or not self.creds.valid:
+                if not self.interactive:
+                    raise LoginRequired('No usable Google login in ' + self.token_path +
+                                        ' -- log in once from Voluntracker first')
+                with diagnostics.stage('oauth login'):
+                    flow = InstalledAppFlow.from_client_secrets_file(self.creds_path, self.scopes)
+                    self.creds = flow.run_local_server()
+                self._save()
+                self._service = None
+            return self.creds
+
+    # Returns the Sheets service, building it the first time
+    def service(self):
+        creds = self.credentials()
+        with self.lock:
+            if self._service is None:
+                with diagnostics.stage('sheets service'):
+                    self._service = build_from_document(self.discovery_document(), http=self._new_http(creds))
+            return self._service
+
+    # Returns this thread's logged-in HTTP transport. httplib2 connections can't be shared between threads, so each
+    # thread gets its own, which keeps its connections open and is reused for every request that thread makes
+    def http(self):
+        http = getattr(self.local, 'http', None)
+        if http is None or http.credentials is not self.creds:
+            http = self.local.http = self._new_http(self.credentials())
+        return http
+
+    def _new_http(self, creds):
+        return AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+
+    # The Sheets discovery document, from the local cache if there is one
+    def discovery_document(self):
+        if os.path.exists(self.discovery_path):
+            with open(self.discovery_path, 'r', encoding='utf-8') as docfile:
+                return json.load(docfile)
+
+        response, content = httplib2.Http(timeout=30).request(DISCOVERY_URL)
+        if response.status != 200:
+            raise httplib2.HttpLib2Error('Could not download the Sheets discovery document: ' + str(response.status))
+        document = json.loads(content.decode('utf-8'))
+        write_json(self.discovery_path, document)
+        return document
+
+    # Forgets the login, e.g. after the saved token was revoked, so the next pull logs in again
+    def invalidate(self):
+        with self.lock:
+            self.creds = None
+            self._service = None
+            if self.save and os.path.exists(self.token_path):
+                os.remove(self.token_path)
+
+    def _expiring(self):
+        # google-auth keeps expiry as a naive UTC datetime
+        expiry = self.creds.expiry
+        return expiry is not None and expiry - datetime.datetime.utcnow() < REFRESH_MARGIN
+
+    # Save the credentials for the next run
+    def _save(self):
+        if not self.save:
+            return
+        with open(self.token_path, 'wb') as token:
+            pickle.dump(self.creds, token)
+
+
+# Fetches every row in range_name (A1 notation, e.g. 'B:F') from the spreadsheet in a single request
+def fetch_values(service, spreadsheet_id, range_name):
+    with diagnostics.stage('sheets request') as timed:
+        result = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name).execute(
+            num_retries=RETRIES)
+        values = result.get('values', [])
+        timed.note(rows=len(values))
+    return values
+
+
+# Splits 'Sheet1!B:F' into ('Sheet1!', 'B', 'F'), dropping any row numbers
+def split_range(range_name):
+    sheet, separator, cells = range_name.rpartition('!')
+    start, _, end = cells.partition(':')
+    start = start.rstrip('0123456789')
+    end = end.rstrip('0123456789') or start
+    return sheet + separator, start, end
+
+
+# Column letters as a number counting from 1: 'A' -> 1, 'F' -> 6, 'AB' -> 28
+def column_number(letters):
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+# Whether a range starts at column A, where Google Forms puts each response's timestamp
+def has_timestamp(range_name):
+    return split_range(range_name)[1].upper() == 'A'
+
+
+# How many columns a range like 'B:F' or 'Sheet1!B:F' covers
+def range_width(range_name):
+    _, start, end = split_range(range_name)
+    return column_number(end) - column_number(start) + 1
+
+
+# Turns a column range like 'B:F' or 'Sheet1!B:F' into the same columns starting at first_row, e.g. 'B57:F'
+def offset_range(range_name, first_row):
+    sheet, start, end = split_range(range_name)
+    return sheet + start + str(first_row) + ':' + end
+
+
+# The same columns as range_name, limited to rows first_row to first_row + rows - 1, e.g. 'B57:F5056'
+def window_range(range_name, first_row, rows):
+    sheet, start, end = split_range(range_name)
+    return sheet + start + str(first_row) + ':' + end + str(first_row + rows - 1)
+
+
+# Fetches a single window of rows. http is the transport to send the request on (None for the service's own)
+def fetch_window(service, spreadsheet_id, range_name, first_row, rows, http=None):
+    with diagnostics.stage('sheets request', first_row=first_row) as timed:
+        request = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id,
+                                                      range=window_range(range_name, first_row, rows))
+        values = request.execute(http=http, num_retries=RETRIES).get('values', [])
+        timed.note(rows=len(values))
+    diagnostics.count('sheets rows', len(values))
+    return values
+
+
+# Cheaply checks whether the sheet has changed since a pull that saw known_rows rows, the last of which hashed to
+# last_hash, by fetching only that row and the one after it -- a few hundred bytes and one request however big the
+# sheet is. Returns True if there's a row after it or the row itself is different. Like pull_delta, it doesn't notice
+# edits further up the sheet
+def has_changed(service, spreadsheet_id, range_name, known_rows, last_hash, http=None):
+    diagnostics.count('sheets probes')
+    if known_rows == 0:
+        return bool(fetch_window(service, spreadsheet_id, range_name, 1, 1, http))
+    rows = fetch_window(service, spreadsheet_id, range_name, known_rows, 2, http)
+    return len(rows) != 1 or row_hash(rows[0]) != last_hash
+
+
+# Fetches the sheet from first_row down in windows of page_rows rows and yields each window's rows in order, so the
+# whole sheet never has to be held in memory at once. Up to `workers` windows are fetched ahead in parallel; http is
+# a function returning the transport for the calling thread (SheetsSession.http), and without one the windows are
+# fetched one at a time on the service's own transport, which isn't safe to share between threads.
+def stream_values(service, spreadsheet_id, range_name, first_row=1, page_rows=PAGE_ROWS, workers=FETCH_WORKERS,
+                  http=None):
+    if http is None:
+        workers = 1
+
+    def fetch(row):
+        return fetch_window(service, spreadsheet_id, range_name, row, page_rows, http() if http else None)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    next_row = first_row
+    try:
+        while True:
+            while len(pending) < workers:
+                pending.append(pool.submit(fetch, next_row))
+                next_row += page_rows
+
+            rows = pending.popleft().result()
+            if len(rows) < page_rows:
+                # The API leaves off empty rows at the end of a window, so a short window is the end of the sheet
+                # unless one of the windows after it has rows. In that case the gap is put back as blank rows
+                if not any(future.result() for future in pending):
+                    if rows:
+                        yield rows
+                    return
+                rows = rows + [[] for _ in range(page_rows - len(rows))]
+            yield rows
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+# Pulls only the rows added to the sheet since the last pull and appends them to log (a backups.DeltaLog), a window
+# at a time. The last row already in the log is fetched again along with the new ones; if it no longer matches,
+# rows above it were edited or deleted, so the log is rebuilt from a full pull. progress, if given, is called with
+# the number of rows appended so far after every window. Returns the number of rows appended.
+def pull_delta(service, spreadsheet_id, range_name, log, http=None, progress=None):
+    added = 0
+    if log.row_count > 0:
+        chunks = stream_values(service, spreadsheet_id, range_name, log.row_count, http=http)
+        first = next(chunks, [])
+        if first and row_hash(first[0]) == log.last_hash:
+            log.append(first[1:])
+            added = len(first) - 1
+            if progress:
+                progress(added)
+            for chunk in chunks:
+                log.append(chunk)
+                added += len(chunk)
+                if progress:
+                    progress(added)
+            return added
+        chunks.close()
+        log.reset()
+
+    for chunk in stream_values(service, spreadsheet_id, range_name, http=http):
+        log.append(chunk)
+        added += len(chunk)
+        if progress:
+            progress(added)
+    return added
@@ -0,0 +1,186 @@
+import json
+import sqlite3
+import aggregates
+import diagnostics
+from events import (HEADER_NAME, NAME_COL, VENUE_COL, HOURS_COL, TIMESTAMP_COL, NO_TIMESTAMPS, parse_hours,
+                    parse_timestamp)
+
+
+# An optional local SQLite store of form responses, as an alternative to re-reading a backup csv every time the
+# metrics or submission windows are opened. Every backup is loaded into one events table with indexes on member,
+# venue and timestamp, so the per-member and per-venue group-bys behind the metrics and the submission become indexed
+# SQL queries, and old backups can be imported so years of responses can be queried from one place.
+
+# Rows are inserted this many at a time, each batch in one transaction
+BATCH_ROWS = 10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL UNIQUE,
+    created TEXT,
+    rows INTEGER NOT NULL DEFAULT 0,
+    header TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    backup_id INTEGER NOT NULL REFERENCES backups(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    venue TEXT NOT NULL,
+    hours REAL NOT NULL,
+    timestamp TEXT,
+    cells TEXT NOT NULL,
+    PRIMARY KEY (backup_id, position)
+);
+CREATE INDEX IF NOT EXISTS events_member ON events (backup_id, member, position, hours);
+CREATE INDEX IF NOT EXISTS events_venue ON events (backup_id, venue, position);
+CREATE INDEX IF NOT EXISTS events_timestamp ON events (backup_id, timestamp);
+'''
+
+
+class EventStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # Returns the id of the stored backup with this content hash, or None if it hasn't been loaded
+    def find(self, digest):
+        found = self.db.execute('SELECT id FROM backups WHERE hash = ?', (digest,)).fetchone()
+        return found[0] if found else None
+
+    # Loads the rows of one backup (header included) into the store and returns its id. A backup that is already
+    # stored, going by its content hash, isn't loaded again. Each event's form timestamp is read from its timestamp
+    # column and stored in ISO format, so a period can be picked out by comparing strings on the timestamp index
+    def add_backup(self, name, digest, rows, created=None):
+        backup_id = self.find(digest)
+        if backup_id is not None:
+            return backup_id
+
+        with self.db:
+            backup_id = self.db.execute('INSERT INTO backups (name, hash, created) VALUES (?, ?, ?)',
+                                        (name, digest, created)).lastrowid
+
+        header = None
+        batch = []
+        count = 0
+        try:
+            with diagnostics.stage('store load', backup=name) as timed:
+                for row in rows:
+                    if not row:
+                        continue
+                    if row[NAME_COL] == HEADER_NAME:
+                        header = row
+                        continue
+                    batch.append((backup_id, count, row[NAME_COL], _cell(row, VENUE_COL),
+                                  parse_hours(row[HOURS_COL]) if len(row) > HOURS_COL else 0.0,
+                                  _timestamp(row), json.dumps(row)))
+                    count += 1
+                    if len(batch) >= BATCH_ROWS:
+                        self._insert(batch)
+                        batch = []
+                self._insert(batch)
+                timed.note(rows=count)
+        except BaseException:
+            # Don't leave half a backup behind, or it would be skipped as already loaded next time
+            with self.db:
+                self.db.execute('DELETE FROM backups WHERE id = ?', (backup_id,))
+            raise
+
+        with self.db:
+            self.db.execute('UPDATE backups SET rows = ?, header = ? WHERE id = ?',
+                            (count, json.dumps(header) if header is not None else None, backup_id))
+        return backup_id
+
+    def _insert(self, batch):
+        with self.db:
+            self.db.executemany('INSERT INTO events (backup_id, position, member, venue, hours, timestamp, cells) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+
+    # Loads every backup in a backups.BackupCatalog that isn't stored yet, oldest first. Returns how many were loaded
+    def import_catalog(self, catalog, load_rows):
+        loaded = 0
+        for entry in list(catalog.newest_first())[::-1]:
+            if self.find(entry['hash']) is None:
+                self.add_backup(entry['name'], entry['hash'], load_rows(catalog.path_of(entry)), entry['created'])
+                loaded += 1
+        return loaded
+
+    # One backup's aggregates.Aggregate -- hours and events per member and events per venue -- by SQL group-bys.
+    # With start and/or end (datetimes), only the events submitted from start up to (not including) end are counted
+    def aggregate(self, backup_id, start=None, end=None):
+        self.check_period(backup_id, start, end)
+        where, params = _period(backup_id, start, end)
+        with diagnostics.stage('store metrics'):
+            members = self.db.execute('SELECT member, SUM(hours), COUNT(*) FROM events WHERE ' + where +
+                                      ' GROUP BY member ORDER BY MIN(position)', params).fetchall()
+            venues = self.db.execute('SELECT venue, COUNT(*) FROM events WHERE ' + where +
+                                     ' GROUP BY venue ORDER BY MIN(position)', params).fetchall()
+        return aggregates.Aggregate({member: [hours, count] for member, hours, count in members}, dict(venues))
+
+    # The same (name, [(venue, hours), ...]) pairs as submission.group_events, straight from the member index. start
+    # and end limit it to a period, as in aggregate
+    def member_events(self, backup_id, start=None, end=None):
+        self.check_period(backup_id, start, end)
+        where, params = _period(backup_id, start, end)
+        members = []
+        current = None
+        with diagnostics.stage('store query'):
+            for member, venue, hours in self.db.execute('SELECT member, venue, hours FROM events WHERE ' + where +
+                                                        ' ORDER BY member, position', params):
+                if member != current:
+                    current = member
+                    members.append((member, []))
+                members[-1][1].append((venue, hours))
+        return members
+
+    # Whether any event in a backup has a timestamp (backups pulled without column A have none)
+    def has_timestamps(self, backup_id):
+        return self.db.execute('SELECT 1 FROM events WHERE backup_id = ? AND timestamp IS NOT NULL LIMIT 1',
+                               (backup_id,)).fetchone() is not None
+
+    # Raises ValueError if a period is asked of a backup with events but no timestamps, like EventTable.between
+    def check_period(self, backup_id, start, end):
+        if start is None and end is None or self.has_timestamps(backup_id):
+            return
+        if self.db.execute('SELECT rows FROM backups WHERE id = ?', (backup_id,)).fetchone()[0]:
+            raise ValueError(NO_TIMESTAMPS)
+
+    # Streams one backup back out as rows of strings, header first, exactly as they were loaded
+    def iter_rows(self, backup_id):
+        header = self.db.execute('SELECT header FROM backups WHERE id = ?', (backup_id,)).fetchone()
+        if header and header[0] is not None:
+            yield json.loads(header[0])
+        for cells, in self.db.execute('SELECT cells FROM events WHERE backup_id = ? ORDER BY position',
+                                      (backup_id,)):
+            yield json.loads(cells)
+
+
+def _cell(row, column):
+    return row[column] if len(row) > column else ''
+
+
+# A row's form timestamp in ISO format, or None if it has none
+def _timestamp(row):
+    moment = parse_timestamp(_cell(row, TIMESTAMP_COL))
+    return moment.isoformat() if moment is not None else None
+
+
+# The WHERE clause and its parameters for one backup's events, limited to the period from start to end if given
+def _period(backup_id, start, end):
+    where = 'backup_id = ?'
+    params = [backup_id]
+    if start is not None:
+        where += ' AND timestamp >= ?'
+        params.append(start.isoformat())
+    if end is not None:
+        where += ' AND timestamp < ?'
+        params.append(end.isoformat())
+    return where, params
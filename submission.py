@@ -0,0 +1,242 @@
+import os
+import re
+from copy import copy
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import Rule
+from openpyxl.utils import get_column_letter
+import diagnostics
+
+
+# Fills in the chapter's BaseTemplate.xlsx with every member's events and saves it as a new workbook. Events are
+# grouped per member in one pass, and the output is streamed row by row through openpyxl's write-only mode, copying
+# the template's header, styles, formulas and formatting around the data. Members with more events than fit in a row
+# spill onto continuation rows underneath, and the sheet grows past the template's last row when it has to.
+
+# Layout of the template: one member per row starting at FIRST_DATA_ROW, their name in NAME_COLUMN, then
+# EVENTS_PER_ROW (organization, hours) column pairs starting at FIRST_EVENT_COLUMN, and the row total in
+# TOTAL_COLUMN. The data ends at the row whose name cell reads TOTAL_LABEL.
+FIRST_DATA_ROW = 6
+NAME_COLUMN = 2
+FIRST_EVENT_COLUMN = 3
+EVENTS_PER_ROW = 4
+TOTAL_COLUMN = 11
+TOTAL_LABEL = 'Total'
+
+# Parsed templates, keyed by path, so the template is only read again when the file changes
+templates = {}
+
+
+# Everything the writer needs from the template workbook, read once
+class Template:
+    def __init__(self, path):
+        wb = load_workbook(path)
+        ws = wb.active
+        self.title = ws.title
+        self.max_column = ws.max_column
+
+        totals_row = None
+        for row in range(FIRST_DATA_ROW, ws.max_row + 1):
+            if ws.cell(row=row, column=NAME_COLUMN).value == TOTAL_LABEL:
+                totals_row = row
+                break
+        if totals_row is None:
+            raise ValueError('The template has no "' + TOTAL_LABEL + '" row under the member list')
+        self.last_data_row = totals_row - 1
+
+        # Every cell down to the totals row, as (value, style) pairs
+        self.rows = {}
+        for row in ws.iter_rows(min_row=1, max_row=totals_row, max_col=self.max_column):
+            self.rows[row[0].row] = [(cell.value, self._style(cell)) for cell in row]
+
+        self.heights = {row: dim.height for row, dim in ws.row_dimensions.items() if dim.height}
+        self.widths = {letter: dim.width for letter, dim in ws.column_dimensions.items() if dim.width}
+        self.merged = [str(merged) for merged in ws.merged_cells.ranges if merged.max_row < FIRST_DATA_ROW]
+        self.conditional_formatting = [(str(cf.sqref), list(cf.rules)) for cf in ws.conditional_formatting]
+
+    # The style attributes of a template cell, in a form that can be applied to a cell in another workbook
+    @staticmethod
+    def _style(cell):
+        if not cell.has_style:
+            return None
+        return (copy(cell.font), copy(cell.border), copy(cell.fill), cell.number_format, copy(cell.protection),
+                copy(cell.alignment))
+
+    @property
+    def capacity(self):
+        return self.last_data_row - FIRST_DATA_ROW + 1
+
+
+# Returns the parsed template at path, reading it only if it's new or has changed
+def get_template(path):
+    mtime = os.path.getmtime(path)
+    cached = templates.get(path)
+    if cached is None or cached[0] != mtime:
+        with diagnostics.stage('template parse'):
+            cached = templates[path] = (mtime, Template(path))
+    return cached[1]
+
+
+# Groups the events in an events.EventTable by member, in one pass. Returns (name, [(venue, hours), ...]) pairs
+# sorted by name, with each member's events in the order they were submitted. mapping ({name: roster name}, e.g. from
+# names.NameIndex.mapping) puts events logged under a misspelled name under the right member
+def group_events(table, mapping=None):
+    names = table.member_names
+    if mapping:
+        names = [mapping.get(name, name) for name in names]
+
+    by_member = {}
+    for i, member in enumerate(table.member_ids):
+        by_member.setdefault(names[member], []).append((table.venue_name(i), table.hours[i]))
+    return sorted(by_member.items(), key=lambda pair: pair[0])
+
+
+# Renames already grouped (name, events) pairs by mapping, merging members who end up with the same name
+def merge_members(members, mapping):
+    if not mapping:
+        return members
+    merged = {}
+    for name, member_events in members:
+        merged.setdefault(mapping.get(name, name), []).extend(member_events)
+    return sorted(merged.items(), key=lambda pair: pair[0])
+
+
+# Writes the submission workbook for table to output_path. Returns the number of members written
+def write_submission(table, template_path, output_path, mapping=None):
+    with diagnostics.stage('group events', rows=len(table)):
+        members = group_events(table, mapping)
+    return write_members(members, template_path, output_path)
+
+
+# Writes the submission workbook from (name, [(venue, hours), ...]) pairs sorted by name, as returned by group_events
+# or store.EventStore.member_events
+def write_members(members, template_path, output_path):
+    template = get_template(template_path)
+    with diagnostics.stage('workbook write', members=len(members)):
+        return _write_members(members, template, output_path)
+
+
+def _write_members(members, template, output_path):
+
+    # Lay out the rows first: (name or None for a continuation row, events on this row, rows the member spans)
+    layout = []
+    for name, member_events in members:
+        chunks = [member_events[i:i + EVENTS_PER_ROW] for i in range(0, len(member_events), EVENTS_PER_ROW)]
+        for c, chunk in enumerate(chunks):
+            layout.append((name if c == 0 else None, chunk, len(chunks) if c == 0 else 0))
+
+    data_rows = max(len(layout), template.capacity)
+    last_data_row = FIRST_DATA_ROW + data_rows - 1
+    totals_row = last_data_row + 1
+    moved = {template.last_data_row: last_data_row, template.last_data_row + 1: totals_row}
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(template.title)
+    writer = RowWriter(ws)
+
+    # A template row with its formulas pointed at where the data and totals rows ended up
+    def template_row(row):
+        return [(_move_formula(value, moved), style) for value, style in template.rows[row]]
+
+    for letter, width in template.widths.items():
+        ws.column_dimensions[letter].width = width
+    for merged in template.merged:
+        ws.merged_cells.add(merged)
+    for sqref, rules in template.conditional_formatting:
+        for rule in rules:
+            ws.conditional_formatting.add(_move_range(sqref, moved), _copy_rule(rule))
+
+    # Header rows, exactly as in the template
+    for row in range(1, FIRST_DATA_ROW):
+        writer.write(row, template_row(row), template.heights.get(row))
+
+    # Member rows. Anything past the template's own rows is styled like its last data row
+    for k in range(data_rows):
+        row = FIRST_DATA_ROW + k
+        source = min(FIRST_DATA_ROW + k, template.last_data_row)
+        cells = template_row(source)
+        if source != row:
+            cells[0] = (None, cells[0][1])
+
+        if k < len(layout):
+            name, chunk, span = layout[k]
+            cells[NAME_COLUMN - 1] = (name, cells[NAME_COLUMN - 1][1])
+            for e, (venue, hours) in enumerate(chunk):
+                column = FIRST_EVENT_COLUMN + 2 * e
+                cells[column - 1] = (venue, cells[column - 1][1])
+                cells[column] = (hours, cells[column][1])
+            # A member's total covers all of their rows, so the per-row 20+ hour checks still see one total each
+            total = None
+            if span:
+                total = '=SUM(' + _cell(FIRST_EVENT_COLUMN + 1, row) + ':' + \
+                        _cell(TOTAL_COLUMN - 1, row + span - 1) + ')'
+            cells[TOTAL_COLUMN - 1] = (total, cells[TOTAL_COLUMN - 1][1])
+        else:
+            cells[TOTAL_COLUMN - 1] = ('=SUM(' + _cell(FIRST_EVENT_COLUMN + 1, row) + ':' +
+                                       _cell(TOTAL_COLUMN - 1, row) + ')', cells[TOTAL_COLUMN - 1][1])
+
+        writer.write(row, cells, template.heights.get(source))
+
+    # The totals row, with its sums stretched over every member row
+    writer.write(totals_row, template_row(template.last_data_row + 1), template.heights.get(template.last_data_row + 1))
+
+    wb.save(output_path)
+    return len(members)
+
+
+# Streams rows of (value, template style) pairs into a write-only sheet. Styles are registered with the new workbook
+# once per distinct template style and then shared by every cell that uses them
+class RowWriter:
+    def __init__(self, ws):
+        self.ws = ws
+        self.styles = {}
+
+    def write(self, row, cells, height=None):
+        if height:
+            self.ws.row_dimensions[row].height = height
+        self.ws.append([self._cell(value, style) for value, style in cells])
+
+    def _cell(self, value, style):
+        cell = WriteOnlyCell(self.ws, value=value)
+        if style is not None:
+            shared = self.styles.get(id(style))
+            if shared is None:
+                cell.font, cell.border, cell.fill, cell.number_format, cell.protection, cell.alignment = style
+                self.styles[id(style)] = copy(cell._style)
+            else:
+                cell._style = copy(shared)
+        return cell
+
+
+ROW_REFERENCE = re.compile(r'(?<=[A-Z])(\d+)(?!\d)')
+
+
+# Points a template formula's references to the template's last data row and totals row at where those rows ended
+# up. Anything that isn't a formula is returned as it is
+def _move_formula(formula, moved):
+    if not isinstance(formula, str) or not formula.startswith('='):
+        return formula
+    return ROW_REFERENCE.sub(lambda match: str(moved.get(int(match.group(1)), match.group(1))), formula)
+
+
+def _move_range(sqref, moved):
+    bottom = max(moved.values())
+    return ' '.join(_stretch(part, bottom) for part in sqref.split())
+
+
+# Makes sure a cell range like 'K6:K1002' reaches down to at least row bottom
+def _stretch(cell_range, bottom):
+    start, _, end = cell_range.partition(':')
+    match = ROW_REFERENCE.search(end or start)
+    if match and int(match.group(1)) < bottom:
+        return start + ':' + (end or start)[:match.start()] + str(bottom)
+    return cell_range
+
+
+def _copy_rule(rule):
+    return Rule(type=rule.type, operator=rule.operator, formula=list(rule.formula), dxf=copy(rule.dxf),
+                stopIfTrue=rule.stopIfTrue, priority=rule.priority)
+
+
+def _cell(column, row):
+    return get_column_letter(column) + str(row)
@@ -0,0 +1,203 @@
+import tkinter
+from tkinter import ttk
+import numpy
+from events import HOURS_COL, TIMESTAMP_COL, format_timestamp
+
+
+# A scrolling table for showing an events.EventTable of any size. Only the rows that fit on screen exist as widgets;
+# scrolling just changes which rows of the table those widgets show, so opening the table and scrolling through it
+# cost the same for a hundred rows or a million. Clicking a column heading sorts by that column (click again to
+# reverse it) and the box above the table filters down to rows containing the typed text.
+
+# Pixel height of one row and of the heading row, used to work out how many rows fit on screen
+ROW_HEIGHT = 20
+HEADING_HEIGHT = 25
+
+# Milliseconds to wait after the last key press in the filter box before filtering
+FILTER_DELAY = 250
+
+
+class VirtualTable(tkinter.Frame):
+    def __init__(self, master, table=None, **kwargs):
+        tkinter.Frame.__init__(self, master, **kwargs)
+        self.table = None
+        # view[k] is the table row shown at position k, or None when showing every row in table order
+        self.view = None
+        self.offset = 0
+        self.items = []
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_job = None
+        # The table's timestamps formatted for filtering, worked out on the first filter (see _timestamp_matches)
+        self.timestamp_strings = None
+
+        filterbar = tkinter.Frame(self)
+        filterlabel = tkinter.Label(filterbar, text='Filter:')
+        self.filtertext = tkinter.StringVar(self)
+        self.filtertext.trace_add('write', self._schedule_filter)
+        filterfield = tkinter.Entry(filterbar, textvariable=self.filtertext)
+        self.countlabel = tkinter.Label(filterbar)
+
+        style = ttk.Style(self)
+        style.configure('Virtual.Treeview', rowheight=ROW_HEIGHT)
+        self.tree = ttk.Treeview(self, show='headings', selectmode='browse', style='Virtual.Treeview')
+        self.scroll = tkinter.Scrollbar(self, command=self._on_scrollbar)
+
+        filterbar.pack(side='top', fill='x')
+        filterlabel.pack(side='left')
+        filterfield.pack(side='left', fill='x', expand=True)
+        self.countlabel.pack(side='right')
+        self.scroll.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll_by(-event.delta // 120 * 3))
+        self.tree.bind('<Button-4>', lambda event: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_by(3))
+
+        if table is not None:
+            self.set_data(table)
+
+    # Shows a new EventTable, keeping the current filter and sort
+    def set_data(self, table):
+        self.table = table
+        self.timestamp_strings = None
+        width = max(len(table.columns), len(table.header or []))
+        headings = list(table.header or [])
+        headings += ['Column ' + str(c + 1) for c in range(len(headings), width)]
+
+        columns = [str(c) for c in range(width)]
+        self.tree['columns'] = columns
+        for c, heading in zip(columns, headings):
+            self.tree.heading(c, text=heading, command=lambda c=int(c): self.sort_by(c))
+            self.tree.column(c, width=120, stretch=True)
+
+        if self.sort_column is not None and self.sort_column >= width:
+            self.sort_column = None
+        self._apply_view()
+
+    def row_count(self):
+        if self.table is None:
+            return 0
+        return len(self.table) if self.view is None else len(self.view)
+
+    # Sorts by column c, or reverses the sort if it's already sorted by c
+    def sort_by(self, c):
+        if self.sort_column == c:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = c
+            self.sort_reverse = False
+        self._apply_view()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.row_count() - len(self.items)))
+        self._render()
+
+    # Works out which table rows are visible after a filter or sort, then jumps back to the top
+    def _apply_view(self):
+        view = self._filtered_rows(self.filtertext.get().strip().lower())
+        if self.sort_column is not None:
+            view = self._sorted_rows(view, self.sort_column)
+        self.view = view
+        self.offset = 0
+        self.countlabel['text'] = str(self.row_count()) + ' of ' + str(len(self.table)) + ' rows'
+        self._render()
+
+    # Rows where any cell contains text. Each distinct string is only checked once, then the matching ids are looked
+    # up for every row with numpy
+    def _filtered_rows(self, text):
+        if not text:
+            return None
+        keep = numpy.zeros(len(self.table), dtype=bool)
+        for column, pool in zip(self.table.columns, self.table.pools):
+            matches = numpy.fromiter((text in string.lower() for string in pool.strings), dtype=bool,
+                                     count=len(pool))
+            keep |= matches[numpy.asarray(column)]
+        if len(self.table.columns) > TIMESTAMP_COL:
+            keep |= self._timestamp_matches(text)
+        return numpy.flatnonzero(keep)
+
+    # Rows whose timestamp, as shown, contains text. Timestamps are kept as seconds rather than in the column's
+    # strings, so the first filter on a table formats each distinct time once and later filters reuse those strings;
+    # the texts kept as typed are checked as they are
+    def _timestamp_matches(self, text):
+        if self.timestamp_strings is None:
+            distinct, inverse = numpy.unique(numpy.asarray(self.table.times), return_inverse=True)
+            strings = [format_timestamp(seconds).lower() if seconds == seconds else '' for seconds in distinct]
+            self.timestamp_strings = (strings, inverse.reshape(-1))
+        strings, inverse = self.timestamp_strings
+        matches = numpy.fromiter((text in string for string in strings), dtype=bool, count=len(strings))
+        keep = matches[inverse]
+        for i, stamp in self.table.time_texts.items():
+            keep[i] = text in stamp.lower()
+        return keep
+
+    # Sorts rows by column c. Strings are sorted once per distinct value and rows are ordered by that rank; the
+    # hours column sorts by number and the timestamp column by time, with blank timestamps last
+    def _sorted_rows(self, rows, c):
+        if rows is None:
+            rows = numpy.arange(len(self.table))
+        if c == HOURS_COL:
+            keys = numpy.asarray(self.table.hours)[rows]
+        elif c == TIMESTAMP_COL and c < len(self.table.pools):
+            keys = numpy.asarray(self.table.times)[rows]
+        elif c >= len(self.table.pools):
+            # A header column past every row's last cell, so every row is blank there
+            return rows
+        else:
+            pool = self.table.pools[c]
+            rank = numpy.empty(len(pool), dtype=numpy.int64)
+            rank[sorted(range(len(pool)), key=lambda i: pool.strings[i].lower())] = numpy.arange(len(pool))
+            keys = rank[numpy.asarray(self.table.columns[c])[rows]]
+        order = numpy.argsort(keys, kind='stable')
+        if self.sort_reverse:
+            order = order[::-1]
+        return rows[order]
+
+    # Fills the on-screen rows from the table, starting at the scroll offset
+    def _render(self):
+        total = self.row_count()
+        for k, item in enumerate(self.items):
+            position = self.offset + k
+            if position < total:
+                i = position if self.view is None else int(self.view[position])
+                self.tree.item(item, values=self.table.row(i))
+            else:
+                self.tree.item(item, values=())
+
+        if total:
+            self.scroll.set(self.offset / total, min(1.0, (self.offset + len(self.items)) / total))
+        else:
+            self.scroll.set(0.0, 1.0)
+
+    # Keeps exactly as many row widgets as fit in the window
+    def _on_resize(self, event):
+        wanted = max(1, (event.height - HEADING_HEIGHT) // ROW_HEIGHT)
+        while len(self.items) < wanted:
+            self.items.append(self.tree.insert('', 'end', values=()))
+        while len(self.items) > wanted:
+            self.tree.delete(self.items.pop())
+        self.scroll_to(self.offset)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(amount) * self.row_count()))
+        elif unit == 'pages':
+            self.scroll_by(int(amount) * len(self.items))
+        else:
+            self.scroll_by(int(amount))
+
+    # Waits for the user to stop typing before filtering, so big tables aren't filtered on every key press
+    def _schedule_filter(self, *args):
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(FILTER_DELAY, self._run_filter)
+
+    def _run_filter(self):
+        self.filter_job = None
+        if self.table is not None:
+            self._apply_view()
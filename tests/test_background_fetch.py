@@ -0,0 +1,196 @@
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import httplib2
+import pytest
+from google.auth.exceptions import RefreshError
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+import events
+import sheets
+import worker
+import Voluntracker
+from fake_sheets import FakeSheetsServer
+from generate_responses import generate_rows
+
+
+# Runs Voluntracker.fetch_sheet on a worker.BackgroundJob against the local fake Sheets server, checking that starting
+# the pull never blocks the caller, that the rows come back through on_done, and that errors come back through
+# on_error. No display is needed: EventLoop stands in for the tkinter widget the job polls its queue from.
+
+ROWS = 500
+
+# How long every request to the fake server takes, so a pull is still running when start() returns
+LATENCY = 0.2
+
+
+# Stands in for a tkinter widget. after() callbacks only run when pump() is called, on the test's own thread, the way
+# tkinter only runs them on the thread running the event loop
+class EventLoop:
+    def __init__(self):
+        self.pending = []
+        self.exists = True
+        self.thread = threading.current_thread()
+
+    def after(self, ms, callback):
+        self.pending.append((time.monotonic() + ms / 1000.0, callback))
+
+    def winfo_exists(self):
+        return self.exists
+
+    # Runs callbacks as they come due until done() is true, failing after timeout seconds
+    def pump(self, done, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not done():
+            assert time.monotonic() < deadline, 'the job never finished'
+            due = [entry for entry in self.pending if entry[0] <= time.monotonic()]
+            self.pending = [entry for entry in self.pending if entry[0] > time.monotonic()]
+            for _, callback in due:
+                callback()
+            time.sleep(0.01)
+
+
+# Stands in for sheets.SheetsSession, with no login. Records which threads logged in
+class FakeSession:
+    def __init__(self, service, error=None):
+        self._service = service
+        self.error = error
+        self.login_threads = []
+        self.invalidated = False
+        self.local = threading.local()
+
+    def service(self):
+        self.login_threads.append(threading.current_thread())
+        if self.error is not None:
+            raise self.error
+        return self._service
+
+    def http(self):
+        if not hasattr(self.local, 'http'):
+            self.local.http = httplib2.Http(timeout=sheets.HTTP_TIMEOUT)
+        return self.local.http
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+# The form's responses laid out the way the sheet has them, with the timestamp in column A
+@pytest.fixture(scope='module')
+def sheet_rows():
+    return [row[events.TIMESTAMP_COL:events.TIMESTAMP_COL + 1] + row[:events.TIMESTAMP_COL]
+            for row in generate_rows(ROWS)]
+
+
+@pytest.fixture
+def server(sheet_rows):
+    server = FakeSheetsServer({'linked': sheet_rows}, latency=LATENCY).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def session(server, tmp_path, monkeypatch):
+    session = FakeSession(build_from_document(server.discovery_document(), http=httplib2.Http()))
+    monkeypatch.setattr(Voluntracker, 'session', session)
+    monkeypatch.setattr(Voluntracker, 'SpreadURL', 'linked')
+    monkeypatch.setattr(Voluntracker, 'DELTA_PATH', str(tmp_path / 'Delta'))
+    monkeypatch.setattr(Voluntracker, 'sheet_state', {})
+    return session
+
+
+# Starts fetch_sheet on a BackgroundJob and returns (the job, the event loop, what the callbacks were given)
+def start_fetch():
+    loop = EventLoop()
+    outcome = {'progress': []}
+
+    def on_done(table):
+        outcome['table'] = table
+        outcome['thread'] = threading.current_thread()
+
+    def on_error(error):
+        outcome['error'] = error
+        outcome['thread'] = threading.current_thread()
+
+    job = worker.BackgroundJob(loop, Voluntracker.fetch_sheet, on_progress=outcome['progress'].append,
+                               on_done=on_done, on_error=on_error)
+    started = time.perf_counter()
+    job.start()
+    outcome['start_seconds'] = time.perf_counter() - started
+    return job, loop, outcome
+
+
+@pytest.mark.parametrize('delta', [True, False])
+def test_fetch_does_not_block(session, monkeypatch, delta):
+    monkeypatch.setattr(Voluntracker, 'DELTA_PULLS', delta)
+    job, loop, outcome = start_fetch()
+
+    # Every request takes LATENCY, so the pull can't have finished yet
+    assert outcome['start_seconds'] < LATENCY / 2
+    assert not job.finished
+
+    loop.pump(lambda: job.finished)
+    assert 'error' not in outcome
+    # The login ran on the job's thread, and the result was handed over on the event loop's
+    assert session.login_threads and all(thread is job.thread for thread in session.login_threads)
+    assert outcome['thread'] is loop.thread
+    assert outcome['progress']
+
+
+@pytest.mark.parametrize('delta', [True, False])
+def test_fetch_delivers_rows(session, sheet_rows, monkeypatch, delta):
+    monkeypatch.setattr(Voluntracker, 'DELTA_PULLS', delta)
+    job, loop, outcome = start_fetch()
+    loop.pump(lambda: job.finished)
+
+    table = outcome['table']
+    assert len(table) == ROWS
+    assert table.header[events.NAME_COL] == events.HEADER_NAME
+    expected = [events.timestamp_last(row) for row in sheet_rows[1:]]
+    assert list(table.iter_rows())[1:] == expected
+
+
+# The same sheet linked twice is pulled once, rather than by two threads writing one delta log
+def test_fetch_pulls_a_sheet_linked_twice_once(session, server, monkeypatch):
+    monkeypatch.setattr(Voluntracker, 'SpreadURL', 'linked\nlinked ' + Voluntracker.SAMPLE_RANGE_NAME + ' Again')
+    assert len(Voluntracker.linked_sheets()) == 1
+    job, loop, outcome = start_fetch()
+    loop.pump(lambda: job.finished)
+
+    assert 'error' not in outcome
+    assert len(outcome['table']) == ROWS
+
+
+def test_fetch_reports_missing_sheet(session, monkeypatch):
+    monkeypatch.setattr(Voluntracker, 'SpreadURL', 'not-a-sheet')
+    job, loop, outcome = start_fetch()
+    loop.pump(lambda: job.finished)
+
+    assert 'table' not in outcome
+    assert isinstance(outcome['error'], HttpError)
+    assert outcome['thread'] is loop.thread
+
+
+def test_fetch_reports_expired_login(session):
+    session.error = RefreshError('Token has been expired or revoked.')
+    job, loop, outcome = start_fetch()
+    loop.pump(lambda: job.finished)
+
+    assert outcome['error'] is session.error
+    # The next pull starts a fresh login instead of reusing the revoked one
+    assert session.invalidated
+
+
+def test_cancelled_fetch_is_dropped(session):
+    job, loop, outcome = start_fetch()
+    job.cancel()
+    loop.pump(lambda: job.finished or not job.thread.is_alive())
+    job.thread.join(10)
+    loop.pump(lambda: not loop.pending, timeout=1)
+
+    assert 'table' not in outcome and 'error' not in outcome
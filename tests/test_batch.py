@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import batch
+import events
+import roster
+from generate_responses import write_responses, write_roster
+
+
+# Runs batch.main end to end on chapters loaded from backups (so no login or network is needed), with and without a
+# period, and checks every chapter's results land in its own folder.
+
+ROWS = 2000
+TEMPLATE_PATH = os.path.join(ROOT, 'Configuration', 'BaseTemplate.xlsx')
+
+
+def write_jobs(tmp_path, jobs):
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps(jobs), encoding='utf-8')
+    return str(path)
+
+
+def run(tmp_path, jobs, capsys):
+    out = tmp_path / 'Batch'
+    code = batch.main([write_jobs(tmp_path, jobs), '--out', str(out), '--workers', '1'])
+    return code, out, capsys.readouterr().out
+
+
+def test_batch_runs_every_chapter(tmp_path, capsys):
+    write_responses(str(tmp_path / 'alpha.csv'), ROWS)
+    write_roster(str(tmp_path / 'roster.csv'))
+    jobs = [{'name': 'Alpha', 'backup': 'alpha.csv', 'roster': 'roster.csv', 'template': TEMPLATE_PATH},
+            {'name': 'Spring', 'backup': 'alpha.csv', 'template': TEMPLATE_PATH,
+             'from': '2020-01-01', 'to': '2020-07-31'}]
+
+    code, out, printed = run(tmp_path, jobs, capsys)
+
+    assert code == 0, printed
+    spring = events.load_backup(str(tmp_path / 'alpha.csv')).between(*events.parse_period('2020-01-01', '2020-07-31'))
+    assert 0 < len(spring) < ROWS
+    assert 'Alpha: ' + str(ROWS) + ' events' in printed
+    assert 'Spring: ' + str(len(spring)) + ' events' in printed
+    for name in ('Alpha', 'Spring'):
+        assert (out / name / 'FINALIZED_SUBMISSION.xlsx').exists()
+        assert (out / name / 'Charts' / 'summary.csv').exists()
+
+
+def test_batch_reports_a_failed_chapter(tmp_path, capsys):
+    write_responses(str(tmp_path / 'alpha.csv'), ROWS)
+    jobs = [{'name': 'Alpha', 'backup': 'alpha.csv', 'template': TEMPLATE_PATH},
+            {'name': 'Missing', 'backup': 'missing.csv', 'template': TEMPLATE_PATH}]
+
+    code, out, printed = run(tmp_path, jobs, capsys)
+
+    assert code == 1
+    assert 'Alpha: ' + str(ROWS) + ' events' in printed
+    assert 'Missing: FAILED' in printed
+
+
+# A backup pulled without column A has no timestamps, so asking for a period fails the chapter instead of writing an
+# empty submission
+def test_batch_rejects_a_period_without_timestamps(tmp_path, capsys):
+    write_responses(str(tmp_path / 'alpha.csv'), ROWS)
+    with open(str(tmp_path / 'alpha.csv'), 'r', encoding='utf-8') as backup:
+        lines = backup.read().splitlines()
+    (tmp_path / 'old.csv').write_text('\n'.join(line.rsplit(',', 1)[0] for line in lines) + '\n', encoding='utf-8')
+    jobs = [{'name': 'Old', 'backup': 'old.csv', 'template': TEMPLATE_PATH, 'from': '2020-01-01'},
+            {'name': 'Whole', 'backup': 'old.csv', 'template': TEMPLATE_PATH}]
+
+    code, out, printed = run(tmp_path, jobs, capsys)
+
+    assert code == 1
+    assert 'Old: FAILED -- ValueError: ' + events.NO_TIMESTAMPS in printed
+    assert 'Whole: ' + str(ROWS) + ' events' in printed
+    assert not (out / 'Old' / 'FINALIZED_SUBMISSION.xlsx').exists()
+
+
+# Members added to the roster in Voluntracker are still in its journal, and count as inactive chapter members
+def test_batch_reads_the_roster_journal(tmp_path, capsys):
+    write_responses(str(tmp_path / 'alpha.csv'), ROWS)
+    write_roster(str(tmp_path / 'Roster.csv'))
+    with open(roster.journal_path(str(tmp_path / 'Roster.csv')), 'w', encoding='utf-8', newline='\n') as journal:
+        journal.write('+,Added Member\n')
+    jobs = [{'name': 'Alpha', 'backup': 'alpha.csv', 'roster': 'Roster.csv', 'template': TEMPLATE_PATH}]
+
+    code, out, printed = run(tmp_path, jobs, capsys)
+
+    assert code == 0, printed
+    assert 'Added Member' in (out / 'Alpha' / 'Charts' / 'summary.csv').read_text(encoding='utf-8')
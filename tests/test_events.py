@@ -0,0 +1,35 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+import events
+
+
+# Checks which events EventTable.between keeps when some of them have no timestamp.
+
+ROWS = [[events.HEADER_NAME, 'Day', 'Venue', 'Hours', 'Notes', 'Timestamp'],
+        ['Alex Smith', '1/2/2021', 'Library', '2', '', '1/2/2021 9:00:00'],
+        ['Jordan Lee', '1/20/2021', 'Food Bank', '3', '', ''],
+        ['Alex Smith', '2/3/2021', 'Food Bank', '1.5', '', '2/3/2021 12:15:00']]
+
+
+def test_no_period_keeps_events_without_timestamps():
+    table = events.EventTable.from_rows(ROWS)
+    assert table.between() is table
+    assert len(table.between(None, None)) == 3
+
+
+def test_period_leaves_out_events_without_timestamps():
+    table = events.EventTable.from_rows(ROWS)
+    spring = table.between(*events.parse_period('2021-01-01', ''))
+    assert [spring.member_name(i) for i in range(len(spring))] == ['Alex Smith', 'Alex Smith']
+
+
+def test_period_without_any_timestamps_is_refused():
+    table = events.EventTable.from_rows([row[:events.TIMESTAMP_COL] for row in ROWS])
+    assert table.between() is table
+    with pytest.raises(ValueError, match=events.NO_TIMESTAMPS):
+        table.between(*events.parse_period('2021-01-01', ''))
@@ -0,0 +1,30 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import report
+import roster
+from generate_responses import member_names, write_responses, write_roster
+
+
+# The headless report reads the roster the way Voluntracker does, journal included, so members added or removed in
+# Voluntracker since the roster was last compacted are counted in the report too.
+
+ROWS = 500
+
+
+def test_report_reads_the_roster_journal(tmp_path):
+    backup_path = str(tmp_path / 'backup.csv')
+    roster_path = str(tmp_path / 'Roster.csv')
+    write_responses(backup_path, ROWS, members=3)
+    write_roster(roster_path, members=3, inactive=2)
+    kept, removed = member_names(5)[3:]
+    with open(roster.journal_path(roster_path), 'w', encoding='utf-8', newline='\n') as journal:
+        journal.write('+,Added Member\n-,' + removed + '\n')
+
+    results = report.backup_results(backup_path, roster_path)
+
+    assert results['inactive'] == [kept, 'Added Member']
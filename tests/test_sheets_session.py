@@ -0,0 +1,74 @@
+import os
+import pickle
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from concurrent.futures import ThreadPoolExecutor
+import batch
+import sheets
+
+
+# Checks that only a saving SheetsSession ever rewrites the token file, so batch workers (which share it read-only)
+# can't leave it half written, and that a batch refreshes the login once before starting its workers.
+
+
+# Stands in for google.oauth2 credentials that have expired and need a refresh
+class ExpiredCredentials:
+    def __init__(self):
+        self.refresh_token = 'refresh'
+        self.valid = False
+        self.expiry = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.valid = True
+        self.refreshes += 1
+
+
+def session(tmp_path, save):
+    token_path = str(tmp_path / 'token.pickle')
+    if not os.path.exists(token_path):
+        with open(token_path, 'wb') as token:
+            pickle.dump(ExpiredCredentials(), token)
+    return sheets.SheetsSession(token_path, None, [], None, interactive=False, save=save), token_path
+
+
+def test_read_only_session_never_writes_the_token(tmp_path):
+    reader, token_path = session(tmp_path, save=False)
+    before = os.stat(token_path).st_mtime_ns, open(token_path, 'rb').read()
+
+    assert reader.credentials().refreshes == 1
+    reader.invalidate()
+
+    assert (os.stat(token_path).st_mtime_ns, open(token_path, 'rb').read()) == before
+
+
+def test_saving_session_saves_the_refreshed_token(tmp_path):
+    writer, token_path = session(tmp_path, save=True)
+    writer.credentials()
+    with open(token_path, 'rb') as token:
+        assert pickle.load(token).valid
+
+
+def skip_job(job, output_dir):
+    raise RuntimeError('not run')
+
+
+def test_batch_refreshes_the_login_once_before_pulling(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, 'refresh_login', lambda: calls.append(True))
+    monkeypatch.setattr(batch, 'run_job', skip_job)
+    # Runs the jobs on threads, so the stand-ins above are the ones called
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', lambda max_workers=None, **setup: ThreadPoolExecutor(1))
+
+    jobs = [{'name': name, 'spreadsheet': name, 'template': 'template.xlsx'} for name in ('Alpha', 'Beta')]
+    batch.run_batch(jobs, str(tmp_path), echo=lambda line: None)
+    assert calls == [True]
+
+    calls.clear()
+    batch.run_batch([{'name': 'Gamma', 'backup': 'gamma.csv', 'template': 'template.xlsx'}], str(tmp_path),
+                    echo=lambda line: None)
+    assert calls == []
+
@@ -0,0 +1,34 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aggregates
+import events
+import store
+
+
+# Checks that the event store reads each event's timestamp from its own row, so headers and blank rows between
+# events don't shift anyone's timestamp, and that a period picks out the same events as EventTable.between.
+
+ROWS = [[events.HEADER_NAME, 'Day', 'Venue', 'Hours', 'Notes', 'Timestamp'],
+        ['Alex Smith', '1/2/2021', 'Library', '2', '', '1/2/2021 9:00:00'],
+        [],
+        ['Jordan Lee', '1/20/2021', 'Food Bank', '3', '', '1/20/2021 17:30:00'],
+        [events.HEADER_NAME, 'Day', 'Venue', 'Hours', 'Notes', 'Timestamp'],
+        ['Alex Smith', '2/3/2021', 'Food Bank', '1.5', '', '2/3/2021 12:15:00']]
+
+
+def test_period_matches_event_table(tmp_path):
+    eventstore = store.EventStore(str(tmp_path / 'events.sqlite3'))
+    backup_id = eventstore.add_backup('hours_backup.csv', 'digest', ROWS)
+    table = events.EventTable.from_rows(ROWS)
+
+    start, end = events.parse_period('2021-01-15', '2021-02-28')
+    stored = eventstore.aggregate(backup_id, start, end)
+    assert stored.members == {'Jordan Lee': [3.0, 1], 'Alex Smith': [1.5, 1]}
+    assert stored.members == aggregates.Aggregate.from_table(table.between(start, end)).members
+    assert eventstore.member_events(backup_id, None, events.parse_period('', '2021-01-02')[1]) == [
+        ('Alex Smith', [('Library', 2.0)])]
+    eventstore.close()
@@ -0,0 +1,39 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import events
+import tableview
+
+
+# Runs VirtualTable's filter on an EventTable without a display: the filter only reads self.table, so a namespace
+# holding the table stands in for the widget.
+
+ROWS = [[events.HEADER_NAME, 'Day', 'Venue', 'Hours', 'Notes', 'Timestamp'],
+        ['Alex Smith', '1/2/2021', 'Library', '2', '', '1/2/2021 9:00:00'],
+        ['Jordan Lee', '1/20/2021', 'Food Bank', '3', '', '2/1/2021 17:30:00'],
+        ['Sam Park', '1/25/2021', 'Food Bank', '1', '', 'Feb 1st, 2021'],
+        ['Alex Smith', '2/3/2021', 'Food Bank', '1.5', ''],
+        ['Robin Diaz', '2/1/2021', 'Library', '4', '', '2/4/2021 8:05:00']]
+
+
+def filtered(text):
+    view = types.SimpleNamespace(table=events.EventTable.from_rows(ROWS), timestamp_strings=None)
+    view._timestamp_matches = types.MethodType(tableview.VirtualTable._timestamp_matches, view)
+    return list(tableview.VirtualTable._filtered_rows(view, text))
+
+
+def test_filter_matches_timestamps():
+    # Row 1 was submitted on 2/1/2021 and row 4 volunteered on it
+    assert filtered('2/1/2021') == [1, 4]
+    assert filtered('17:30') == [1]
+    # A timestamp that isn't in the form's format is matched as it was typed
+    assert filtered('feb 1st') == [2]
+
+
+def test_filter_matches_other_cells():
+    assert filtered('food bank') == [1, 2, 3]
+    assert filtered('alex') == [0, 3]
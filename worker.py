@@ -0,0 +1,88 @@
+import queue
+import threading
+
+
+# Runs slow jobs (like pulling from Google Sheets) on a background thread so the tkinter windows keep responding.
+# tkinter widgets may only be touched from the thread running the event loop, so the job never calls back into the
+# GUI directly -- it puts progress messages and its result on a queue, which is polled from the event loop with
+# widget.after.
+
+# How often (in milliseconds) the event loop checks the queue
+POLL_MS = 100
+
+
+# Raised inside a job by check_cancelled once the user has asked for it to stop
+class JobCancelled(Exception):
+    pass
+
+
+# A job is any function taking the BackgroundJob as its only argument. It can report progress with job.progress()
+# and should call job.check_cancelled() between steps. Whatever it returns is handed to on_done, and any exception it
+# raises is handed to on_error. All three callbacks run on the tkinter thread.
+class BackgroundJob:
+    def __init__(self, widget, job, on_progress=None, on_done=None, on_error=None):
+        self.widget = widget
+        self.job = job
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.widget.after(POLL_MS, self._poll)
+        return self
+
+    # Asks the job to stop at its next check. Anything it produces afterwards is thrown away
+    def cancel(self):
+        self.cancelled.set()
+
+    # Called from the job's thread
+    def progress(self, message):
+        self.queue.put(('progress', message))
+
+    # Called from the job's thread
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def _run(self):
+        try:
+            result = self.job(self)
+            self.queue.put(('done', result))
+        except JobCancelled:
+            self.queue.put(('cancelled', None))
+        except Exception as error:
+            self.queue.put(('error', error))
+
+    # Runs on the tkinter thread -- hands everything waiting in the queue to the callbacks
+    def _poll(self):
+        # The window was closed while the job was running, so there's nobody left to tell
+        if not self.widget.winfo_exists():
+            self.cancel()
+            return
+
+        while True:
+            try:
+                kind, payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                if self.on_progress and not self.cancelled.is_set():
+                    self.on_progress(payload)
+                continue
+
+            self.finished = True
+            if self.cancelled.is_set():
+                return
+            if kind == 'done' and self.on_done:
+                self.on_done(payload)
+            elif kind == 'error' and self.on_error:
+                self.on_error(payload)
+            return
+
+        self.widget.after(POLL_MS, self._poll)